@@ -0,0 +1,191 @@
+"""
+🚦 Control de admisión para el servicio de inferencia
+Cola acotada de peticiones en vuelo con carriles de prioridad, deadlines
+por petición y rechazo rápido (503 + Retry-After) cuando el servicio está saturado.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Carriles en orden de prioridad: tráfico autenticado primero
+LANES = ('high', 'low')
+
+
+class AdmissionRejected(Exception):
+    """Petición rechazada antes de llegar a inferencia"""
+
+    def __init__(self, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.reason = reason  # 'overloaded' o 'deadline_exceeded'
+        self.retry_after = retry_after
+
+
+def parse_deadline(headers, default_timeout: float, now: Optional[float] = None) -> float:
+    """
+    Obtener el deadline absoluto (epoch en segundos) de la petición:
+    - `X-Request-Deadline`: epoch absoluto en segundos o milisegundos
+    - `X-Request-Timeout`: segundos relativos a la llegada
+    Sin cabeceras se aplica `default_timeout`.
+    """
+    now = time.time() if now is None else now
+    deadline = headers.get('X-Request-Deadline')
+    if deadline:
+        try:
+            value = float(deadline)
+            return value / 1000.0 if value > 1e11 else value
+        except ValueError:
+            pass
+    timeout = headers.get('X-Request-Timeout')
+    if timeout:
+        try:
+            return now + float(timeout)
+        except ValueError:
+            pass
+    return now + default_timeout
+
+
+def parse_lane(headers, trusted: bool = False) -> str:
+    """
+    Carril de la petición según `X-Request-Priority` (por defecto 'low').
+    La cabecera la pone el cliente: 'high' solo se respeta si el llamador es
+    de confianza (`X-Internal-Token` válido); si no, cualquiera se colaría.
+    """
+    lane = (headers.get('X-Request-Priority') or 'low').lower()
+    if lane not in LANES or (lane == 'high' and not trusted):
+        return 'low'
+    return lane
+
+
+class AdmissionController:
+    """
+    Limita las inferencias concurrentes a `max_in_flight`. Las peticiones que
+    no caben esperan en una cola acotada por carril; el carril 'high' siempre
+    se atiende antes que 'low'. Se rechaza de inmediato cuando la cola está
+    llena o cuando, con el tiempo de servicio estimado, el deadline no se
+    podría cumplir: así no se gasta CPU en peticiones cuyo cliente ya se rindió.
+    """
+
+    def __init__(self, max_in_flight: int = 2, queue_limits: Optional[Dict[str, int]] = None,
+                 initial_service_time: float = 0.5):
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_limits = queue_limits or {'high': 32, 'low': 8}
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queues = {lane: deque() for lane in LANES}
+        # Media móvil exponencial del tiempo de inferencia
+        self._service_time = initial_service_time
+        self._stats = {'admitted': 0, 'rejected_overloaded': 0, 'rejected_deadline': 0,
+                       'completed': 0}
+
+    # -----------------------------------------------------------------
+    # Estimaciones
+    # -----------------------------------------------------------------
+
+    def _queued_ahead(self, lane: str) -> int:
+        """Peticiones que se atenderían antes que una nueva en este carril"""
+        ahead = 0
+        for other in LANES:
+            ahead += len(self._queues[other])
+            if other == lane:
+                break
+        return ahead
+
+    def _estimated_wait(self, position: int) -> float:
+        """Espera estimada con el servicio saturado y `position` peticiones delante"""
+        return (position // self.max_in_flight + 1) * self._service_time
+
+    def _retry_after(self) -> int:
+        waiting = sum(len(q) for q in self._queues.values())
+        return max(1, math.ceil(self._estimated_wait(waiting)))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        key = 'rejected_deadline' if reason == 'deadline_exceeded' else 'rejected_overloaded'
+        self._stats[key] += 1
+        return AdmissionRejected(reason, self._retry_after())
+
+    # -----------------------------------------------------------------
+    # Admisión
+    # -----------------------------------------------------------------
+
+    def check(self, lane: str, deadline: float):
+        """
+        Comprobación rápida al llegar, antes de leer el cuerpo de la petición
+        """
+        with self._cond:
+            self._check_locked(lane, deadline)
+
+    def _check_locked(self, lane: str, deadline: float):
+        remaining = deadline - time.time()
+        if remaining <= self._service_time:
+            raise self._reject('deadline_exceeded')
+        if self._in_flight >= self.max_in_flight:
+            if len(self._queues[lane]) >= self.queue_limits.get(lane, 0):
+                raise self._reject('overloaded')
+            if self._estimated_wait(self._queued_ahead(lane)) + self._service_time > remaining:
+                raise self._reject('overloaded')
+
+    @contextmanager
+    def admit(self, lane: str, deadline: float):
+        """
+        Esperar un hueco de inferencia respetando la prioridad y el deadline.
+        Lanza AdmissionRejected si la petición caduca mientras espera.
+        """
+        ticket = object()
+        with self._cond:
+            self._check_locked(lane, deadline)
+            queue = self._queues[lane]
+            queue.append(ticket)
+            try:
+                while not self._can_run(lane, ticket):
+                    remaining = deadline - time.time() - self._service_time
+                    if remaining <= 0:
+                        raise self._reject('deadline_exceeded')
+                    self._cond.wait(timeout=remaining)
+            except AdmissionRejected:
+                queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            queue.popleft()
+            self._in_flight += 1
+            self._stats['admitted'] += 1
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._cond:
+                self._in_flight -= 1
+                self._stats['completed'] += 1
+                self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+                self._cond.notify_all()
+
+    def _can_run(self, lane: str, ticket) -> bool:
+        if self._in_flight >= self.max_in_flight or self._queues[lane][0] is not ticket:
+            return False
+        # Un carril solo avanza si los de mayor prioridad están vacíos
+        for other in LANES:
+            if other == lane:
+                return True
+            if self._queues[other]:
+                return False
+        return True
+
+    def has_waiting(self) -> bool:
+        """¿Hay peticiones en cola esperando un hueco? (para que el trabajo de fondo ceda)"""
+        with self._cond:
+            return any(self._queues.values())
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            return {
+                **self._stats,
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queued': {lane: len(q) for lane, q in self._queues.items()},
+                'estimated_service_time_ms': round(self._service_time * 1000, 1)
+            }
@@ -0,0 +1,356 @@
+"""
+⚡ Pet ID AI - Variante ASGI (Starlette)
+Mismas rutas y mismo contrato JSON que app_multi_species.py (ambas usan
+service_core.py), servidas desde un event loop:
+
+- Los uploads se reciben de forma asíncrona: una conexión lenta no ocupa
+  ningún hilo mientras transfiere la imagen.
+- La decodificación y la inferencia (CPU) corren en un pool de hilos acotado;
+  el control de admisión sigue decidiendo prioridad y deadlines.
+
+Uso:
+    uvicorn app_async:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+
+import service_core as service
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from admission_control import AdmissionRejected, parse_deadline
+from fast_json import dumps
+from perf_config import tuned_setting
+from profiling import InvalidProfileParameter, ProfilerBusy, ProfilerUnavailable, query_number
+from tensor_ingest import RAW_TENSOR_MIMETYPE
+from upload_validation import StreamingImageUpload, UploadRejected, too_large_message
+
+# Hilos para trabajo de CPU: los que pueden inferir más los que pueden esperar
+# en las colas de admisión (esperar ahí no consume CPU)
+EXECUTOR_THREADS = int(os.environ.get(
+    'PET_AI_ASYNC_THREADS',
+    str(service.MAX_IN_FLIGHT + sum(service.QUEUE_LIMITS.values()))
+))
+
+PORT = int(os.environ.get('PORT', '5000'))
+
+executor = ThreadPoolExecutor(max_workers=EXECUTOR_THREADS, thread_name_prefix='inference')
+
+async def run_blocking(func, *args):
+    """Ejecutar trabajo de CPU en el pool acotado sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada con fast_json (orjson si está instalado)"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def respond(payload, status=200, headers=None):
+    """Convertir una respuesta de service_core en una respuesta Starlette"""
+    return FastJSONResponse(payload, status_code=status, headers=headers)
+
+def mimetype(request) -> str:
+    return request.headers.get('content-type', '').split(';')[0].strip().lower()
+
+async def receive_image_upload(request):
+    """Recibir el multipart en streaming validando la imagen con sus primeros bytes"""
+    content_length = request.headers.get('content-length')
+    upload = StreamingImageUpload(request.headers.get('content-type'),
+                                  int(content_length) if content_length else None)
+    async for chunk in request.stream():
+        upload.feed(chunk)
+    return upload, upload.finish()
+
+async def receive_raw_body(request) -> bytearray:
+    """Cuerpo de tensores crudos, acotado a MAX_RAW_BYTES"""
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > service.MAX_RAW_BYTES:
+            raise UploadRejected('file_too_large', 'Payload de tensores demasiado grande', 413)
+    return body
+
+async def health(request):
+    """Endpoint de salud del servicio"""
+    return respond(*service.health())
+
+async def ready(request):
+    """Readiness: 200 solo cuando los modelos están cargados"""
+    return respond(*service.ready())
+
+async def predict(request):
+    """
+    Endpoint principal de predicción multi-especies
+    Mantiene compatibilidad con la API anterior para perros
+    """
+    try:
+        print("\n" + "="*60)
+        print("📸 Nueva predicción multi-especies")
+
+        if service.predictor is None:
+            return respond(*service.predict_unavailable())
+
+        # Rechazo rápido antes de leer el cuerpo si no hay capacidad o tiempo
+        lane = service.request_lane(request.headers)
+        deadline = parse_deadline(request.headers, service.DEFAULT_REQUEST_TIMEOUT)
+        service.admission.check(lane, deadline)
+
+        # Variante de modelo opcional (p.ej. 'compact' para tráfico anónimo)
+        model_variant = request.headers.get('X-Model-Variant')
+
+        # Tensores crudos pre-redimensionados de llamadores internos
+        if mimetype(request) == RAW_TENSOR_MIMETYPE:
+            if not service.is_internal_caller(request.headers.get('X-Internal-Token')):
+                return respond(*service.raw_tensor_forbidden())
+            payload = await receive_raw_body(request)
+            return respond(*await run_blocking(service.predict_raw_tensor, payload, lane,
+                                               deadline, model_variant))
+
+        # El multipart se recibe en streaming sin bloquear y la imagen se valida
+        # (formato y dimensiones) con sus primeros bytes
+        upload, image_bytes = await receive_image_upload(request)
+
+        if upload.filename is None:
+            return respond({
+                'success': False,
+                'error': 'no_image',
+                'message': 'No se envió imagen'
+            }, 400)
+
+        if upload.filename == '' or not image_bytes:
+            return respond({
+                'success': False,
+                'error': 'empty_file',
+                'message': 'Archivo vacío'
+            }, 400)
+
+        print(f"📁 Procesando: {upload.filename} ({upload.info.format} "
+              f"{upload.info.width}x{upload.info.height})")
+
+        model_variant = upload.fields.get('model_variant') or model_variant
+
+        # Realizar predicción multi-especies
+        return respond(*await run_blocking(service.predict_image, image_bytes, lane,
+                                           deadline, model_variant))
+
+    except AdmissionRejected as e:
+        print(f"🚦 Petición rechazada: {e.reason}")
+        return respond(*service.admission_rejected(e))
+    except UploadRejected as e:
+        return respond(*service.upload_rejected(e))
+    except Exception as e:
+        return respond(*service.internal_error(e))
+
+async def predict_species_only(request):
+    """
+    Endpoint para detectar solo la especie (sin raza específica)
+    """
+    try:
+        if service.predictor is None:
+            return respond(*service.service_unavailable({'success': False, 'error': 'Servicio no disponible'}))
+
+        lane = service.request_lane(request.headers)
+        deadline = parse_deadline(request.headers, service.DEFAULT_REQUEST_TIMEOUT)
+        service.admission.check(lane, deadline)
+
+        upload, image_bytes = await receive_image_upload(request)
+        if not image_bytes:
+            return respond({'success': False, 'error': 'No se envió imagen'}, 400)
+
+        # Solo detectar especie
+        return respond(*await run_blocking(service.predict_species, image_bytes, lane, deadline))
+
+    except AdmissionRejected as e:
+        return respond(*service.admission_rejected(e))
+    except UploadRejected as e:
+        return respond(*service.upload_rejected(e))
+    except Exception as e:
+        return respond({'success': False, 'error': str(e)}, 500)
+
+async def predict_regions(request):
+    """
+    Varias mascotas en una imagen: especie y raza por región, con su caja
+    """
+    try:
+        if service.predictor is None:
+            return respond(*service.predict_unavailable())
+
+        lane = service.request_lane(request.headers)
+        deadline = parse_deadline(request.headers, service.DEFAULT_REQUEST_TIMEOUT)
+        service.admission.check(lane, deadline)
+
+        upload, image_bytes = await receive_image_upload(request)
+        if not image_bytes:
+            return respond({'success': False, 'error': 'no_image', 'message': 'No se envió imagen'}, 400)
+
+        model_variant = upload.fields.get('model_variant') or request.headers.get('X-Model-Variant')
+        return respond(*await run_blocking(service.predict_regions, image_bytes, lane,
+                                           deadline, model_variant))
+
+    except AdmissionRejected as e:
+        return respond(*service.admission_rejected(e))
+    except UploadRejected as e:
+        return respond(*service.upload_rejected(e))
+    except Exception as e:
+        return respond(*service.internal_error(e))
+
+def metadata_route(view):
+    """Rutas de solo lectura: 503 mientras cargan los modelos y 500 ante errores"""
+    @functools.wraps(view)
+    async def wrapper(request):
+        try:
+            if service.predictor is None:
+                return respond(*service.service_unavailable({'success': False, 'error': 'Servicio no disponible'}))
+            return respond(*view(request))
+        except Exception as e:
+            return respond({'success': False, 'error': str(e)}, 500)
+    return wrapper
+
+@metadata_route
+def get_breeds(request):
+    """Razas soportadas (parámetro opcional species, 'all' para todas)"""
+    return service.breeds(request.query_params.get('species', 'dog').lower())
+
+@metadata_route
+def search_breeds(request):
+    """Autocompletado de razas (prefijo y tolerante a errores): ?q=&species=&limit="""
+    params = request.query_params
+    return service.breed_search(params.get('q', ''), params.get('species', '').lower(), params.get('limit'))
+
+@metadata_route
+def get_species(request):
+    """Información sobre especies soportadas"""
+    return service.species()
+
+@metadata_route
+def get_model_info(request):
+    """Información detallada del modelo"""
+    return service.model_info()
+
+def admin_required(view):
+    """Rechazar la petición salvo que traiga el token de administración"""
+    @functools.wraps(view)
+    async def wrapper(request):
+        if not service.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != service.ADMIN_TOKEN:
+            return respond({'success': False, 'error': 'forbidden'}, 403)
+        try:
+            return view(request)
+        except ProfilerBusy as e:
+            return respond({'success': False, 'error': 'profiler_busy', 'message': str(e)}, 409)
+        except ProfilerUnavailable as e:
+            return respond({'success': False, 'error': 'profiler_unavailable', 'message': str(e)}, 409)
+        except InvalidProfileParameter as e:
+            return respond({'success': False, 'error': 'invalid_parameter', 'message': str(e)}, 400)
+    return wrapper
+
+@admin_required
+def profile_status(request):
+    """Estado de los perfiles y artefactos generados"""
+    return respond({'success': True, **service.profiler.status()})
+
+@admin_required
+def profile_cpu(request):
+    """Perfil de CPU por muestreo durante `seconds` (pstats + speedscope)"""
+    seconds = query_number(request.query_params, 'seconds', 10.0)
+    interval_ms = query_number(request.query_params, 'interval_ms', 10.0)
+    return respond({'success': True, **service.profiler.start_cpu_profile(seconds, interval_ms)}, 202)
+
+@admin_required
+def profile_tensorflow(request):
+    """Traza del profiler de TensorFlow alrededor de las próximas `calls` predicciones"""
+    calls = query_number(request.query_params, 'calls', 5, int)
+    return respond({'success': True, **service.profiler.arm_tf_trace(calls)}, 202)
+
+@admin_required
+def profile_memory(request):
+    """tracemalloc: start, snapshot (con diff frente al anterior) o stop"""
+    profiler = service.profiler
+    params = request.query_params
+    action = request.path_params['action']
+    if action == 'start':
+        return respond({'success': True, **profiler.start_memory(query_number(params, 'frames', 25, int))})
+    if action == 'snapshot':
+        return respond({'success': True, **profiler.memory_snapshot(query_number(params, 'top', 20, int))})
+    if action == 'stop':
+        return respond({'success': True, **profiler.stop_memory()})
+    return respond({'success': False, 'error': f'Acción desconocida: {action}'}, 400)
+
+@admin_required
+def shadow_stats(request):
+    """Acuerdo, diferencias de confianza y latencias del modelo en sombra"""
+    return respond(*service.shadow_stats())
+
+@admin_required
+def drift_stats(request):
+    """Resúmenes del log de predicciones para detectar deriva de la distribución"""
+    return respond(*service.drift_stats())
+
+@admin_required
+def reload_models(request):
+    """Recargar modelos y etiquetas publicados (incremental_training.py) sin reiniciar"""
+    return respond(*service.request_reload())
+
+async def too_large(request, exc):
+    return respond({
+        'success': False,
+        'error': 'file_too_large',
+        'message': too_large_message()
+    }, 413)
+
+async def bad_request(request, exc):
+    return respond({
+        'success': False,
+        'error': 'bad_request',
+        'message': 'Solicitud inválida.'
+    }, 400)
+
+async def internal_error(request, exc):
+    return respond({
+        'success': False,
+        'error': 'internal_server_error',
+        'message': 'Error interno del servidor.'
+    }, 500)
+
+@asynccontextmanager
+async def lifespan(app):
+    service.start()
+    service.print_banner('ASGI', PORT)
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        Route('/ready', ready, methods=['GET']),
+        Route('/predict', predict, methods=['POST']),
+        Route('/predict/species', predict_species_only, methods=['POST']),
+        Route('/predict/regions', predict_regions, methods=['POST']),
+        Route('/breeds', get_breeds, methods=['GET']),
+        Route('/breeds/search', search_breeds, methods=['GET']),
+        Route('/species', get_species, methods=['GET']),
+        Route('/model/info', get_model_info, methods=['GET']),
+        Route('/admin/profile', profile_status, methods=['GET']),
+        Route('/admin/profile/cpu', profile_cpu, methods=['POST']),
+        Route('/admin/profile/tensorflow', profile_tensorflow, methods=['POST']),
+        Route('/admin/profile/memory/{action}', profile_memory, methods=['POST']),
+        Route('/admin/shadow', shadow_stats, methods=['GET']),
+        Route('/admin/drift', drift_stats, methods=['GET']),
+        Route('/admin/models/reload', reload_models, methods=['POST'])
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    exception_handlers={413: too_large, 400: bad_request, 500: internal_error},
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    # Número de procesos: el elegido por autotune.py para esta máquina
+    workers = tuned_setting(service.PERF_SETTINGS, 'PET_AI_WORKERS', 'workers')
+    uvicorn.run('app_async:app', host='0.0.0.0', port=PORT, workers=workers)
@@ -1,49 +1,72 @@
 """
 🐾 Pet ID AI - Servicio Multi-Especies
 Aplicación Flask mejorada que soporta perros, gatos, aves y conejos
+(la lógica compartida con la variante ASGI vive en service_core.py)
 """
 
-from flask import Flask, request, jsonify
+import service_core as service
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import functools
 import os
-import traceback
-from multi_species_predictor import MultiSpeciesPredictor, PetSpecies
+from admission_control import AdmissionRejected, parse_deadline
+from fast_json import dumps
+from profiling import InvalidProfileParameter, ProfilerBusy, ProfilerUnavailable, query_number
+from tensor_ingest import RAW_TENSOR_MIMETYPE, RawTensorError, read_body
+from upload_validation import (MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, StreamingImageUpload, UploadRejected,
+                               too_large_message)
 
 app = Flask(__name__)
 CORS(app)
 
-# Configuración
-MODEL_DATA_PATH = os.path.join(os.path.dirname(__file__), 'model_data')
+# Límite del cuerpo (413); la ingesta de tensores crudos lo amplía por petición
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
-# Inicializar predictor multi-especies
-print("🚀 Inicializando Pet ID AI Multi-Especies...")
-try:
-    predictor = MultiSpeciesPredictor(MODEL_DATA_PATH)
-    print("✅ Sistema multi-especies listo")
-except Exception as e:
-    print(f"❌ Error inicializando sistema: {e}")
-    predictor = None
+service.start()
+
+def respond(payload, status=200, headers=None):
+    """Convertir una respuesta de service_core en una respuesta Flask (JSON directo a bytes)"""
+    return Response(dumps(payload), status=status, headers=headers, mimetype='application/json')
 
 @app.route('/health', methods=['GET'])
 def health():
     """Endpoint de salud del servicio"""
-    if predictor is None:
-        return jsonify({
-            'status': 'error',
-            'message': 'Sistema no inicializado'
-        }), 500
-    
-    # Obtener información de especies soportadas
-    species_info = predictor.get_supported_species()
-    
-    return jsonify({
-        'status': 'healthy',
-        'version': '2.0.0',
-        'features': ['multi_species', 'breed_prediction', 'species_detection'],
-        'supported_species': list(species_info.keys()),
-        'species_details': species_info,
-        'total_breeds': sum(info['breeds_count'] for info in species_info.values())
-    })
+    return respond(*service.health())
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 solo cuando los modelos están cargados"""
+    return respond(*service.ready())
+
+def receive_image_upload():
+    """Recibir el multipart en streaming validando la imagen con sus primeros bytes"""
+    upload = StreamingImageUpload(request.content_type, request.content_length)
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        upload.feed(chunk)
+    return upload, upload.finish()
+
+def predict_raw_tensor(lane, deadline, model_variant):
+    """
+    /predict con cuerpo application/octet-stream (ver tensor_ingest.py):
+    sin decodificación de imagen y con varias imágenes por payload
+    """
+    if not service.is_internal_caller(request.headers.get('X-Internal-Token')):
+        return respond(*service.raw_tensor_forbidden())
+
+    # Comprobar antes de tocar request.stream: werkzeug lanzaría RequestEntityTooLarge
+    if (request.content_length or 0) > service.MAX_RAW_BYTES:
+        raise UploadRejected('file_too_large', 'Payload de tensores demasiado grande', 413)
+
+    request.max_content_length = service.MAX_RAW_BYTES
+    try:
+        payload = read_body(request.stream, request.content_length or 0)
+    except RawTensorError as e:
+        return jsonify({'success': False, 'error': 'invalid_tensor', 'message': str(e)}), 400
+
+    return respond(*service.predict_raw_tensor(payload, lane, deadline, model_variant))
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -54,79 +77,54 @@ def predict():
     try:
         print("\n" + "="*60)
         print("📸 Nueva predicción multi-especies")
-        
-        if predictor is None:
-            return jsonify({
-                'success': False, 
-                'error': 'service_unavailable',
-                'message': 'Servicio de predicción no disponible'
-            }), 500
-        
-        # Validar archivo
-        if 'image' not in request.files:
+
+        if service.predictor is None:
+            return respond(*service.predict_unavailable())
+
+        # Rechazo rápido antes de leer el cuerpo si no hay capacidad o tiempo
+        lane = service.request_lane(request.headers)
+        deadline = parse_deadline(request.headers, service.DEFAULT_REQUEST_TIMEOUT)
+        service.admission.check(lane, deadline)
+
+        # Variante de modelo opcional (p.ej. 'compact' para tráfico anónimo)
+        model_variant = request.headers.get('X-Model-Variant')
+
+        # Tensores crudos pre-redimensionados de llamadores internos
+        if request.mimetype == RAW_TENSOR_MIMETYPE:
+            return predict_raw_tensor(lane, deadline, model_variant)
+
+        # Leer y validar la imagen en streaming (formato y dimensiones antes del resto)
+        upload, image_bytes = receive_image_upload()
+
+        if upload.filename is None:
             return jsonify({
-                'success': False, 
+                'success': False,
                 'error': 'no_image',
                 'message': 'No se envió imagen'
             }), 400
-        
-        file = request.files['image']
-        
-        if file.filename == '':
+
+        if upload.filename == '' or not image_bytes:
             return jsonify({
-                'success': False, 
+                'success': False,
                 'error': 'empty_file',
                 'message': 'Archivo vacío'
             }), 400
-        
-        print(f"📁 Procesando: {file.filename}")
-        
-        # Leer imagen
-        image_bytes = file.read()
-        
+
+        print(f"📁 Procesando: {upload.filename} ({upload.info.format} "
+              f"{upload.info.width}x{upload.info.height})")
+
+        model_variant = upload.fields.get('model_variant') or model_variant
+
         # Realizar predicción multi-especies
-        result = predictor.predict(image_bytes)
-        
-        # Si hay error, retornarlo
-        if not result.get('success', False):
-            return jsonify(result), 400
-        
-        # Formatear respuesta exitosa
-        response = {
-            'success': True,
-            'species': result['species'],
-            'species_confidence': result['species_confidence'],
-            'breed': result['breed'],
-            'confidence': result['breed_confidence'],  # Mantener compatibilidad
-            'breed_confidence': result['breed_confidence'],
-            'top_5_predictions': result['top_5_predictions'],
-            'model_info': result['model_info'],
-            'additional_info': result.get('additional_info', {})
-        }
-        
-        # Para compatibilidad con frontend existente (solo perros)
-        if result['species'] == 'dog':
-            # Mantener formato original para perros
-            response['model_info'].update({
-                'architecture': 'MobileNetV2',
-                'dataset': 'Stanford Dogs Dataset',
-                'num_classes': result['model_info'].get('total_breeds', 0),
-                'validation_accuracy': 0.7329
-            })
-        
-        print(f"✅ Predicción exitosa: {result['species']} - {result['breed']}")
-        print("="*60 + "\n")
-        
-        return jsonify(response)
-        
+        return respond(*service.predict_image(image_bytes, lane, deadline, model_variant))
+
+    except AdmissionRejected as e:
+        print(f"🚦 Petición rechazada: {e.reason}")
+        return respond(*service.admission_rejected(e))
+    except UploadRejected as e:
+        return respond(*service.upload_rejected(e))
     except Exception as e:
-        print(f"❌ Error en predicción: {str(e)}")
-        traceback.print_exc()
-        return jsonify({
-            'success': False, 
-            'error': 'internal_error',
-            'message': f'Error interno: {str(e)}'
-        }), 500
+        return respond(*service.internal_error(e))
 
 @app.route('/predict/species', methods=['POST'])
 def predict_species_only():
@@ -134,143 +132,175 @@ def predict_species_only():
     Endpoint para detectar solo la especie (sin raza específica)
     """
     try:
-        if predictor is None:
-            return jsonify({'success': False, 'error': 'Servicio no disponible'}), 500
-        
-        if 'image' not in request.files:
+        if service.predictor is None:
+            return respond(*service.service_unavailable({'success': False, 'error': 'Servicio no disponible'}))
+
+        lane = service.request_lane(request.headers)
+        deadline = parse_deadline(request.headers, service.DEFAULT_REQUEST_TIMEOUT)
+        service.admission.check(lane, deadline)
+
+        upload, image_bytes = receive_image_upload()
+        if not image_bytes:
             return jsonify({'success': False, 'error': 'No se envió imagen'}), 400
-        
-        file = request.files['image']
-        image_bytes = file.read()
-        image_array = predictor._preprocess_image(image_bytes)
-        
+
         # Solo detectar especie
-        species, confidence = predictor.detect_species(image_array)
-        
-        return jsonify({
-            'success': True,
-            'species': species.value,
-            'confidence': confidence,
-            'species_name': species.value.title()
-        })
-        
+        return respond(*service.predict_species(image_bytes, lane, deadline))
+
+    except AdmissionRejected as e:
+        return respond(*service.admission_rejected(e))
+    except UploadRejected as e:
+        return respond(*service.upload_rejected(e))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/predict/regions', methods=['POST'])
+def predict_regions():
+    """
+    Varias mascotas en una imagen: especie y raza por región, con su caja
+    """
+    try:
+        if service.predictor is None:
+            return respond(*service.predict_unavailable())
+
+        lane = service.request_lane(request.headers)
+        deadline = parse_deadline(request.headers, service.DEFAULT_REQUEST_TIMEOUT)
+        service.admission.check(lane, deadline)
+
+        upload, image_bytes = receive_image_upload()
+        if not image_bytes:
+            return jsonify({'success': False, 'error': 'no_image', 'message': 'No se envió imagen'}), 400
+
+        model_variant = upload.fields.get('model_variant') or request.headers.get('X-Model-Variant')
+        return respond(*service.predict_regions(image_bytes, lane, deadline, model_variant))
+
+    except AdmissionRejected as e:
+        return respond(*service.admission_rejected(e))
+    except UploadRejected as e:
+        return respond(*service.upload_rejected(e))
+    except Exception as e:
+        return respond(*service.internal_error(e))
+
+def metadata_route(view):
+    """Rutas de solo lectura: 503 mientras cargan los modelos y 500 ante errores"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            if service.predictor is None:
+                return respond(*service.service_unavailable({'success': False, 'error': 'Servicio no disponible'}))
+            return respond(*view(*args, **kwargs))
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    return wrapper
+
 @app.route('/breeds', methods=['GET'])
+@metadata_route
 def get_breeds():
     """
     Endpoint para obtener todas las razas soportadas
     Mantiene compatibilidad con API anterior
     """
-    try:
-        if predictor is None:
-            return jsonify({'success': False, 'error': 'Servicio no disponible'}), 500
-        
-        # Obtener parámetro de especie (opcional)
-        species_param = request.args.get('species', 'dog').lower()
-        
-        species_info = predictor.get_supported_species()
-        
-        if species_param == 'all':
-            # Retornar todas las especies y sus razas
-            return jsonify({
-                'success': True,
-                'species': species_info,
-                'total_species': len(species_info),
-                'total_breeds': sum(info['breeds_count'] for info in species_info.values())
-            })
-        else:
-            # Retornar solo una especie específica (compatibilidad)
-            species_data = species_info.get(species_param, species_info.get('dog'))
-            
-            if species_data:
-                return jsonify({
-                    'success': True,
-                    'breeds': sorted(species_data['breeds']),
-                    'total': species_data['breeds_count'],
-                    'species': species_param,
-                    'model_status': species_data['model_status']
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': f'Especie no soportada: {species_param}'
-                }), 400
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Obtener parámetro de especie (opcional)
+    return service.breeds(request.args.get('species', 'dog').lower())
+
+@app.route('/breeds/search', methods=['GET'])
+@metadata_route
+def search_breeds():
+    """
+    Autocompletado de razas (prefijo y tolerante a errores): ?q=&species=&limit=
+    """
+    return service.breed_search(request.args.get('q', ''), request.args.get('species', '').lower(),
+                                request.args.get('limit'))
 
 @app.route('/species', methods=['GET'])
+@metadata_route
 def get_species():
     """
     Endpoint para obtener información sobre especies soportadas
     """
-    try:
-        if predictor is None:
-            return jsonify({'success': False, 'error': 'Servicio no disponible'}), 500
-        
-        species_info = predictor.get_supported_species()
-        
-        return jsonify({
-            'success': True,
-            'supported_species': species_info,
-            'total_species': len(species_info),
-            'capabilities': {
-                'species_detection': True,
-                'breed_prediction': True,
-                'multi_species': True
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return service.species()
 
 @app.route('/model/info', methods=['GET'])
+@metadata_route
 def get_model_info():
     """
     Endpoint para obtener información detallada del modelo
     """
-    try:
-        if predictor is None:
-            return jsonify({'success': False, 'error': 'Servicio no disponible'}), 500
-        
-        species_info = predictor.get_supported_species()
-        
-        return jsonify({
-            'success': True,
-            'version': '2.0.0',
-            'architecture': 'Multi-Species MobileNetV2',
-            'species_detector': 'MobileNetV2 + ImageNet',
-            'supported_species': species_info,
-            'features': [
-                'Detección automática de especies',
-                'Predicción de razas específicas',
-                'Soporte para perros, gatos, aves y conejos',
-                'API compatible con versión anterior'
-            ],
-            'performance': {
-                'dog_breeds': {
-                    'accuracy': 0.73,
-                    'dataset': 'Stanford Dogs Dataset',
-                    'breeds_count': len(species_info.get('dog', {}).get('breeds', []))
-                },
-                'species_detection': {
-                    'method': 'ImageNet pre-trained classes',
-                    'confidence_threshold': 0.15
-                }
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return service.model_info()
+
+def admin_required(view):
+    """Rechazar la petición salvo que traiga el token de administración"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not service.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != service.ADMIN_TOKEN:
+            return jsonify({'success': False, 'error': 'forbidden'}), 403
+        try:
+            return view(*args, **kwargs)
+        except ProfilerBusy as e:
+            return jsonify({'success': False, 'error': 'profiler_busy', 'message': str(e)}), 409
+        except ProfilerUnavailable as e:
+            return jsonify({'success': False, 'error': 'profiler_unavailable', 'message': str(e)}), 409
+        except InvalidProfileParameter as e:
+            return jsonify({'success': False, 'error': 'invalid_parameter', 'message': str(e)}), 400
+    return wrapper
+
+@app.route('/admin/profile', methods=['GET'])
+@admin_required
+def profile_status():
+    """Estado de los perfiles y artefactos generados"""
+    return jsonify({'success': True, **service.profiler.status()})
+
+@app.route('/admin/profile/cpu', methods=['POST'])
+@admin_required
+def profile_cpu():
+    """Perfil de CPU por muestreo durante `seconds` (pstats + speedscope)"""
+    seconds = query_number(request.args, 'seconds', 10.0)
+    interval_ms = query_number(request.args, 'interval_ms', 10.0)
+    return jsonify({'success': True, **service.profiler.start_cpu_profile(seconds, interval_ms)}), 202
+
+@app.route('/admin/profile/tensorflow', methods=['POST'])
+@admin_required
+def profile_tensorflow():
+    """Traza del profiler de TensorFlow alrededor de las próximas `calls` predicciones"""
+    calls = query_number(request.args, 'calls', 5, int)
+    return jsonify({'success': True, **service.profiler.arm_tf_trace(calls)}), 202
+
+@app.route('/admin/profile/memory/<action>', methods=['POST'])
+@admin_required
+def profile_memory(action):
+    """tracemalloc: start, snapshot (con diff frente al anterior) o stop"""
+    profiler = service.profiler
+    if action == 'start':
+        return jsonify({'success': True, **profiler.start_memory(query_number(request.args, 'frames', 25, int))})
+    if action == 'snapshot':
+        return jsonify({'success': True, **profiler.memory_snapshot(query_number(request.args, 'top', 20, int))})
+    if action == 'stop':
+        return jsonify({'success': True, **profiler.stop_memory()})
+    return jsonify({'success': False, 'error': f'Acción desconocida: {action}'}), 400
+
+@app.route('/admin/shadow', methods=['GET'])
+@admin_required
+def shadow_stats():
+    """Acuerdo, diferencias de confianza y latencias del modelo en sombra"""
+    return respond(*service.shadow_stats())
+
+@app.route('/admin/drift', methods=['GET'])
+@admin_required
+def drift_stats():
+    """Resúmenes del log de predicciones para detectar deriva de la distribución"""
+    return respond(*service.drift_stats())
+
+@app.route('/admin/models/reload', methods=['POST'])
+@admin_required
+def reload_models():
+    """Recargar modelos y etiquetas publicados (incremental_training.py) sin reiniciar"""
+    return respond(*service.request_reload())
 
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({
         'success': False,
         'error': 'file_too_large',
-        'message': 'El archivo es demasiado grande. Máximo 16MB.'
+        'message': too_large_message()
     }), 413
 
 @app.errorhandler(400)
@@ -290,30 +320,6 @@ def internal_error(e):
     }), 500
 
 if __name__ == '__main__':
-    print("\n" + "="*60)
-    print("🐾 Pet ID AI - Servicio Multi-Especies")
-    print("="*60)
-    
-    if predictor:
-        species_info = predictor.get_supported_species()
-        print("📊 Especies soportadas:")
-        for species, info in species_info.items():
-            status = "✅" if info['model_status'] == 'trained' else "🔄"
-            print(f"  {status} {species.title()}: {info['breeds_count']} razas")
-        
-        print(f"\n🎯 Total de razas: {sum(info['breeds_count'] for info in species_info.values())}")
-    else:
-        print("❌ Sistema no inicializado correctamente")
-    
-    print("="*60)
-    print("🌐 Servidor iniciando en http://localhost:5000")
-    print("📚 Endpoints disponibles:")
-    print("  POST /predict - Predicción multi-especies")
-    print("  POST /predict/species - Solo detección de especie")
-    print("  GET  /breeds - Obtener razas (por especie)")
-    print("  GET  /species - Información de especies")
-    print("  GET  /model/info - Información del modelo")
-    print("  GET  /health - Estado del servicio")
-    print("="*60 + "\n")
-    
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    port = int(os.environ.get('PORT', '5000'))
+    service.print_banner('Flask', port)
+    app.run(host='0.0.0.0', port=port, debug=True)
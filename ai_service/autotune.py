@@ -0,0 +1,297 @@
+"""
+🎛️ Auto-ajuste de rendimiento para la máquina actual
+Barre hilos intra/inter-op del runtime, inferencias concurrentes, tamaño de
+batch, pool de preprocesado y número de workers con carga sintética (JPEG
+del tamaño de una foto de móvil) y elige la configuración de mayor
+throughput cuyo p99 cumple el objetivo. El resultado se guarda en
+`model_data/perf_config.json`, que el servicio carga al arrancar.
+
+Cada prueba corre en un subproceso nuevo: los hilos de TensorFlow/ONNX
+Runtime solo se pueden fijar antes de inicializar el runtime.
+
+El servicio Flask/ASGI infiere cada petición por separado, así que por
+defecto las pruebas usan batch 1 y `batch_size` no se barre; con `--ring` se
+ajusta para `inference_server.py`, que agrupa hasta `batch_size` peticiones.
+
+Uso:
+    python autotune.py --p99-target-ms 500
+    python autotune.py --backend onnx --duration 15 --dry-run
+    python autotune.py --ring
+"""
+
+import argparse
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from perf_config import TUNABLE_DEFAULTS, cpu_fingerprint, save_perf_config
+
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+RESULT_PREFIX = 'AUTOTUNE_RESULT '
+READY_PREFIX = 'AUTOTUNE_READY'
+# Margen entre "todos listos" y el inicio común de la carga
+START_DELAY = 0.5
+
+
+# =====================================================================
+# Carga sintética (dentro del subproceso de cada prueba)
+# =====================================================================
+
+def synthetic_images(count: int = 16, size=(1024, 768), seed: int = 0) -> List[bytes]:
+    """JPEGs con ruido suave: coste de decodificación parecido al de una foto real"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        coarse = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+        image = Image.fromarray(coarse).resize(size, Image.Resampling.BILINEAR)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def run_load(predictor, params: Dict, images: List[bytes], duration: float, warmup: float) -> Dict:
+    """
+    Carga en lazo cerrado con el mismo camino que el servicio: decodificación en
+    un pool de `preprocess_workers` hilos y `max_in_flight` hilos de inferencia
+    que agrupan hasta `batch_size` peticiones en cola
+    """
+    max_in_flight = params['max_in_flight']
+    batch_size = params['batch_size']
+    clients = max_in_flight * batch_size + params['preprocess_workers']
+    pending: queue.Queue = queue.Queue()
+    stop = threading.Event()  # clientes
+    stop_inference = threading.Event()  # después, cuando no quedan peticiones en curso
+    latencies: List[float] = []
+    latencies_lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    measure_until = measure_from + duration
+
+    def inference_worker():
+        while not stop_inference.is_set():
+            try:
+                items = [pending.get(timeout=0.05)]
+            except queue.Empty:
+                continue
+            while len(items) < batch_size:
+                try:
+                    items.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            batch = np.concatenate([array for array, _ in items])
+            try:
+                results = predictor.predict_batch(batch)
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
+    def client(index: int, pool: ThreadPoolExecutor):
+        image_index = index
+        while not stop.is_set():
+            start = time.perf_counter()
+            array = pool.submit(predictor._preprocess_image, images[image_index % len(images)]).result()
+            future: Future = Future()
+            pending.put((array, future))
+            future.result()
+            end = time.perf_counter()
+            if measure_from <= start and end <= measure_until:
+                with latencies_lock:
+                    latencies.append((end - start) * 1000)
+            image_index += clients
+
+    with ThreadPoolExecutor(max_workers=params['preprocess_workers']) as pool:
+        workers = [threading.Thread(target=inference_worker, daemon=True) for _ in range(max_in_flight)]
+        client_threads = [threading.Thread(target=client, args=(i, pool), daemon=True) for i in range(clients)]
+        for thread in workers + client_threads:
+            thread.start()
+        time.sleep(warmup + duration)
+        stop.set()
+        for thread in client_threads:
+            thread.join(timeout=30)
+        stop_inference.set()
+        for thread in workers:
+            thread.join(timeout=30)
+
+    if not latencies:
+        return {'throughput': 0.0, 'p50_ms': None, 'p99_ms': None, 'requests': 0}
+    values = np.asarray(latencies)
+    return {
+        'throughput': round(len(values) / duration, 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p99_ms': round(float(np.percentile(values, 99)), 1),
+        'requests': int(len(values))
+    }
+
+
+def trial_main(args):
+    """Subproceso de una prueba: cargar modelos con los hilos indicados y medir"""
+    from multi_species_predictor import MultiSpeciesPredictor
+
+    params = json.loads(args.trial)
+    backend_options = {'intra_op_threads': params['intra_op_threads'],
+                       'inter_op_threads': params['inter_op_threads']}
+    predictor = MultiSpeciesPredictor(args.model_data, backend=args.backend, backend_options=backend_options)
+    if not predictor.is_ready():
+        raise SystemExit("❌ El predictor no está listo")
+    # Esperar la hora de inicio común (reloj de pared) que envía el proceso principal
+    print(READY_PREFIX, flush=True)
+    start_at = float(sys.stdin.readline())
+    time.sleep(max(0.0, start_at - time.time()))
+    result = run_load(predictor, params, synthetic_images(), args.duration, args.warmup)
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+# =====================================================================
+# Barrido (proceso principal)
+# =====================================================================
+
+def run_trials(params: Dict, args, processes: int = 1) -> Dict:
+    """
+    Lanzar `processes` subprocesos de prueba a la vez (simula N workers) y
+    agregar. Cada uno carga sus modelos a su ritmo; cuando todos están listos
+    reciben la misma hora de inicio, así las ventanas medidas coinciden y
+    sumar sus throughputs es válido
+    """
+    # Sin --ring el servicio infiere cada petición por separado
+    trial = params if args.ring else dict(params, batch_size=1)
+    command = [sys.executable, os.path.abspath(__file__), '--trial', json.dumps(trial),
+               '--backend', args.backend, '--model-data', args.model_data,
+               '--duration', str(args.duration), '--warmup', str(args.warmup)]
+    children = [subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, text=True)
+                for _ in range(processes)]
+    for child in children:
+        line = child.stdout.readline()
+        while line and not line.startswith(READY_PREFIX):
+            line = child.stdout.readline()
+        if not line:
+            for other in children:
+                other.kill()
+                other.communicate()
+            return {'throughput': 0.0, 'p99_ms': None, 'error': f'la prueba terminó con código {child.returncode}'}
+    start_at = time.time() + START_DELAY
+    for child in children:
+        child.stdin.write(f"{start_at}\n")
+        child.stdin.flush()
+    results = []
+    for child in children:
+        output, _ = child.communicate()
+        lines = [line for line in output.splitlines() if line.startswith(RESULT_PREFIX)]
+        if child.returncode != 0 or not lines:
+            return {'throughput': 0.0, 'p99_ms': None, 'error': f'la prueba terminó con código {child.returncode}'}
+        results.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+    p99s = [r['p99_ms'] for r in results if r['p99_ms'] is not None]
+    return {
+        'throughput': round(sum(r['throughput'] for r in results), 2),
+        'p99_ms': max(p99s) if p99s else None,
+        'processes': processes
+    }
+
+
+def score(result: Dict, p99_target: float) -> tuple:
+    """Ordenar: primero las que cumplen el p99, luego mayor throughput (o menor p99)"""
+    meets = result['p99_ms'] is not None and result['p99_ms'] <= p99_target
+    if meets:
+        return (1, result['throughput'])
+    return (0, -(result['p99_ms'] or float('inf')))
+
+
+def candidate_values(cpu_count: int, ring: bool = False) -> Dict[str, List[int]]:
+    powers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cpu_count]
+    values = {
+        'intra_op_threads': powers,
+        'inter_op_threads': [1, 2],
+        'max_in_flight': [1, 2, 4],
+        'batch_size': [1, 4, 8, 16],
+        'preprocess_workers': [n for n in (1, 2, 4, 8) if n <= max(cpu_count, 1)]
+    }
+    if not ring:
+        del values['batch_size']  # solo lo usa inference_server.py
+    return values
+
+
+def tune(args) -> Dict:
+    """
+    Descenso por coordenadas: ajustar un parámetro cada vez manteniendo los
+    mejores valores encontrados para el resto, y al final el número de workers
+    """
+    cpu_count = os.cpu_count() or 1
+    best = dict(TUNABLE_DEFAULTS, intra_op_threads=max(1, cpu_count // 2), inter_op_threads=1)
+    best_result = None
+    trials = []
+
+    for key, values in candidate_values(cpu_count, args.ring).items():
+        for value in values:
+            params = dict(best, **{key: value})
+            result = run_trials(params, args)
+            trials.append({'params': params, **result})
+            print(f"🔄 {key}={value}: {result['throughput']:.1f} img/s, p99 {result['p99_ms']} ms")
+            if best_result is None or score(result, args.p99_target_ms) > score(best_result, args.p99_target_ms):
+                best, best_result = params, result
+
+    # Workers: varios procesos en paralelo con la mejor configuración de un proceso
+    threads_per_worker = max(1, best['intra_op_threads']) * best['max_in_flight']
+    max_workers = max(1, cpu_count // threads_per_worker)
+    for workers in range(2, max_workers + 1):
+        params = dict(best, workers=workers)
+        result = run_trials(params, args, processes=workers)
+        trials.append({'params': params, **result})
+        print(f"🔄 workers={workers}: {result['throughput']:.1f} img/s, p99 {result['p99_ms']} ms")
+        if score(result, args.p99_target_ms) > score(best_result, args.p99_target_ms):
+            best, best_result = params, result
+
+    return {'settings': best, 'result': best_result, 'trials': trials}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ajustar hilos, batch y workers para esta máquina')
+    parser.add_argument('--backend', default=os.environ.get('PET_AI_BACKEND', 'keras'))
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    parser.add_argument('--p99-target-ms', type=float, default=500.0)
+    parser.add_argument('--duration', type=float, default=10.0, help='Segundos medidos por prueba')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--ring', action='store_true',
+                        help='Ajustar para inference_server.py (agrupa hasta batch_size peticiones)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar el resultado sin escribir perf_config.json')
+    parser.add_argument('--trial', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        trial_main(args)
+        return
+
+    fingerprint = cpu_fingerprint()
+    print(f"🎛️ Auto-ajuste en {fingerprint['cpu_model']} ({fingerprint['cpu_count']} núcleos), "
+          f"backend {args.backend}, objetivo p99 {args.p99_target_ms:.0f} ms"
+          f"{', servidor de inferencia (--ring)' if args.ring else ''}")
+    outcome = tune(args)
+    best, result = outcome['settings'], outcome['result']
+    if result['p99_ms'] is None or result['p99_ms'] > args.p99_target_ms:
+        print(f"⚠️ Ninguna configuración cumple p99 <= {args.p99_target_ms:.0f} ms; se elige la de menor p99")
+    print(f"✅ Mejor configuración: {best} -> {result['throughput']:.1f} img/s, p99 {result['p99_ms']} ms")
+
+    if args.dry_run:
+        return
+    path = save_perf_config(args.model_data, best, args.backend, {
+        'p99_target_ms': args.p99_target_ms,
+        'ring': args.ring,
+        'measured': result,
+        'trials': outcome['trials']
+    })
+    print(f"📄 Configuración guardada en {path}")
+
+
+if __name__ == "__main__":
+    main()
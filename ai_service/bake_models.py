@@ -0,0 +1,62 @@
+"""
+🍞 Pre-horneado del detector de especies
+Serializa MobileNetV2 (ImageNet) en `model_data/species_detector.keras` con un
+manifiesto que fija las versiones de TensorFlow/Keras. Así el servicio no
+descarga pesos ni reconstruye el grafo con `keras.applications` en cada arranque.
+
+Uso:
+    python bake_models.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+DETECTOR_FILE = 'species_detector.keras'
+DETECTOR_MANIFEST = 'species_detector.json'
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bake_species_detector(model_data_path: str = MODEL_DATA_PATH) -> str:
+    import tensorflow as tf
+
+    detector = tf.keras.applications.MobileNetV2(weights='imagenet', include_top=True,
+                                                 input_shape=(224, 224, 3))
+    detector_path = os.path.join(model_data_path, DETECTOR_FILE)
+    detector.save(detector_path)
+
+    manifest = {
+        'model_file': DETECTOR_FILE,
+        'architecture': 'MobileNetV2',
+        'weights': 'imagenet',
+        'tensorflow_version': tf.__version__,
+        'keras_version': tf.keras.__version__ if hasattr(tf.keras, '__version__') else None,
+        'sha256': file_sha256(detector_path),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(os.path.join(model_data_path, DETECTOR_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"✅ Detector horneado en {detector_path} (TensorFlow {tf.__version__})")
+    return detector_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serializar el detector de especies en model_data/')
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    args = parser.parse_args()
+    bake_species_detector(args.model_data)
+
+
+if __name__ == "__main__":
+    main()
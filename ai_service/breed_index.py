@@ -0,0 +1,136 @@
+"""
+🔎 Índice de búsqueda de razas
+Se construye una vez por carga de modelos (las etiquetas de cada especie son
+las salidas del modelo de razas) y responde `/breeds/search` sin recorrer las
+listas completas:
+
+- Trie de prefijos sobre el nombre normalizado y sobre cada palabra
+  ("retr" -> "Golden retriever", "Labrador retriever", ...).
+- Índice de trigramas para búsqueda tolerante a errores ("chiuaua" -> "Chihuahua").
+
+La normalización ignora mayúsculas, acentos, guiones y guiones bajos.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+NGRAM_SIZE = 3
+# Similitud mínima (coeficiente de Dice sobre trigramas) para coincidencias aproximadas
+MIN_FUZZY_SIMILARITY = 0.3
+
+
+def normalize_breed_name(text: str) -> str:
+    """Minúsculas, sin acentos y con separadores unificados"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.sub(r'[\s_\-]+', ' ', text).strip()
+
+
+def ngrams(text: str) -> List[str]:
+    padded = f'  {text} '
+    return [padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+
+
+@dataclass
+class BreedEntry:
+    species: str
+    breed: str
+    class_index: int
+    key: str
+    gram_count: int
+
+
+class BreedIndex:
+    """Trie de prefijos + índice de trigramas sobre las razas de todas las especies"""
+
+    def __init__(self, labels: Dict[str, List[str]]):
+        self.entries: List[BreedEntry] = []
+        self.sorted_breeds: Dict[str, List[str]] = {}
+        self._trie: Dict = {}
+        self._grams: Dict[str, List[int]] = defaultdict(list)
+
+        for species, breeds in labels.items():
+            self.sorted_breeds[species] = sorted(breeds)
+            for class_index, breed in enumerate(breeds):
+                key = normalize_breed_name(breed)
+                entry_id = len(self.entries)
+                grams = set(ngrams(key))
+                self.entries.append(BreedEntry(species, breed, class_index, key, len(grams)))
+                self._insert(key, entry_id)
+                for position in (m.end() for m in re.finditer(' ', key)):
+                    self._insert(key[position:], entry_id)
+                for gram in grams:
+                    self._grams[gram].append(entry_id)
+
+    def _insert(self, text: str, entry_id: int):
+        """Guardar el id en todos los nodos del camino: un prefijo se resuelve en O(len)"""
+        node = self._trie
+        for char in text:
+            node = node.setdefault(char, {})
+            ids = node.setdefault('', [])
+            if not ids or ids[-1] != entry_id:
+                ids.append(entry_id)
+
+    def _prefix_matches(self, query: str) -> List[int]:
+        node = self._trie
+        for char in query:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])
+
+    def _fuzzy_matches(self, query: str) -> Dict[int, float]:
+        query_grams = set(ngrams(query))
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for entry_id in self._grams.get(gram, ()):
+                shared[entry_id] += 1
+        scores = {}
+        for entry_id, count in shared.items():
+            similarity = 2 * count / (len(query_grams) + self.entries[entry_id].gram_count)
+            if similarity >= MIN_FUZZY_SIMILARITY:
+                scores[entry_id] = similarity
+        return scores
+
+    def search(self, query: str, species: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        """
+        Coincidencias ordenadas: exacta > prefijo del nombre > prefijo de una
+        palabra > aproximada por trigramas
+        """
+        query = normalize_breed_name(query)
+        if not query:
+            return []
+
+        scored: Dict[int, tuple] = {}
+        for entry_id in self._prefix_matches(query):
+            key = self.entries[entry_id].key
+            if key == query:
+                scored[entry_id] = (3.0, 'exact')
+            elif key.startswith(query):
+                scored[entry_id] = (2.0 + len(query) / len(key), 'prefix')
+            else:
+                scored[entry_id] = (1.0 + len(query) / len(key), 'prefix')
+        for entry_id, similarity in self._fuzzy_matches(query).items():
+            if entry_id not in scored:
+                scored[entry_id] = (similarity, 'fuzzy')
+
+        matches = [(score, match, self.entries[entry_id]) for entry_id, (score, match) in scored.items()
+                   if species is None or self.entries[entry_id].species == species]
+        matches.sort(key=lambda item: (-item[0], item[2].key))
+        return [{
+            'breed': entry.breed,
+            'species': entry.species,
+            'class_index': entry.class_index,
+            'score': round(score, 4),
+            'match': match
+        } for score, match, entry in matches[:limit]]
+
+    def get_stats(self) -> Dict:
+        return {
+            'breeds': len(self.entries),
+            'species': {species: len(breeds) for species, breeds in self.sorted_breeds.items()},
+            'ngrams': len(self._grams)
+        }
@@ -0,0 +1,74 @@
+"""
+🗂️ Manifiestos de datasets de imágenes
+Lectura de datasets en carpetas por raza o CSV y splits deterministas.
+Sin dependencias de TensorFlow: lo usan tanto el entrenamiento como la evaluación.
+"""
+
+import csv
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
+
+
+def clean_class_name(folder_name: str) -> str:
+    """Normalizar nombre de carpeta (p.ej. 'n02085620-Chihuahua' -> 'Chihuahua')"""
+    name = re.sub(r'^n\d{8}-', '', folder_name)
+    return name.replace('_', ' ')
+
+
+def is_validation(path: str, val_split: float, seed: int) -> bool:
+    """Split determinista por hash de la ruta (estable entre ejecuciones)"""
+    digest = hashlib.md5(f"{seed}:{path}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'little') / 2**32 < val_split
+
+
+def load_image_folder_manifest(data_dir: str) -> Tuple[List[str], List[str]]:
+    """Leer un dataset con estructura `data_dir/<raza>/<imagen>`"""
+    paths, labels = [], []
+    for class_dir in sorted(d for d in Path(data_dir).iterdir() if d.is_dir()):
+        label = clean_class_name(class_dir.name)
+        for image_path in sorted(class_dir.rglob('*')):
+            if image_path.suffix.lower() in IMAGE_EXTENSIONS:
+                paths.append(str(image_path))
+                labels.append(label)
+    return paths, labels
+
+
+def load_csv_manifest(manifest_path: str) -> Tuple[List[str], List[str], List[Optional[str]]]:
+    """
+    Leer un manifiesto CSV con columnas `path,label` y opcionalmente `split`
+    (train/val). Las rutas relativas se resuelven respecto al CSV.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths, labels, splits = [], [], []
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            path = row['path']
+            if not os.path.isabs(path):
+                path = os.path.join(base_dir, path)
+            paths.append(path)
+            labels.append(row['label'].strip())
+            splits.append((row.get('split') or '').strip().lower() or None)
+    return paths, labels, splits
+
+
+def load_manifest(data_dir: Optional[str] = None,
+                  manifest: Optional[str] = None) -> Tuple[List[str], List[str], List[Optional[str]]]:
+    """Leer un dataset desde CSV o carpetas; retorna (paths, labels, splits)"""
+    if manifest:
+        return load_csv_manifest(manifest)
+    if data_dir:
+        paths, labels = load_image_folder_manifest(data_dir)
+        return paths, labels, [None] * len(paths)
+    raise ValueError("Se necesita data_dir o manifest")
+
+
+def is_validation_sample(path: str, split: Optional[str], val_split: float, seed: int) -> bool:
+    """Un ejemplo es de validación por su columna `split` o, si no la tiene, por hash"""
+    if split is None:
+        return is_validation(path, val_split, seed)
+    return split in ('val', 'validation', 'test')
@@ -0,0 +1,296 @@
+"""
+🎓 Destilación de conocimiento para modelos de razas compactos
+El modelo grande de una especie (profesor) entrena a un estudiante mucho más
+pequeño (MobileNetV3-Small o MobileNetV2 con alpha reducido a menor resolución).
+
+Uso:
+    python distill_model.py --species dog --data-dir /datasets/stanford_dogs/Images
+    python distill_model.py --species dog --data-dir ... --student mobilenet_v2_035 --resolution 128
+
+El estudiante se guarda como `{especie}_compact.keras`, se registra como
+variante 'compact' en `model_data/model_variants.json` y el informe con
+precisión, latencia y tamaño de ambos modelos queda en
+`{especie}_compact_report.json`.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from species_models import SpeciesModelsManager
+from training_pipeline import MODEL_DATA_PATH, TrainingConfig, build_splits, create_dataset
+
+STUDENT_ARCHITECTURES = ('mobilenet_v3_small', 'mobilenet_v2_035', 'mobilenet_v2_050')
+
+
+def build_student(num_classes: int, architecture: str = 'mobilenet_v3_small',
+                  resolution: int = 160, input_size=(224, 224)):
+    """
+    Crear el modelo estudiante. La entrada sigue siendo 224x224 normalizada
+    en [-1, 1] (la misma que el predictor ya genera); el redimensionado a la
+    resolución reducida ocurre dentro del modelo.
+    Retorna el modelo que produce logits (para la destilación).
+    """
+    inputs = keras.Input(shape=tuple(input_size) + (3,))
+    x = inputs
+    if resolution != input_size[0]:
+        x = layers.Resizing(resolution, resolution, name='student_resize')(x)
+
+    if architecture == 'mobilenet_v3_small':
+        backbone = keras.applications.MobileNetV3Small(
+            input_shape=(resolution, resolution, 3),
+            include_top=False,
+            weights='imagenet',
+            include_preprocessing=False,  # Las entradas ya vienen en [-1, 1]
+            minimalistic=False
+        )
+    elif architecture.startswith('mobilenet_v2_'):
+        alpha = int(architecture.rsplit('_', 1)[1]) / 100.0
+        backbone = keras.applications.MobileNetV2(
+            input_shape=(resolution, resolution, 3),
+            include_top=False,
+            weights='imagenet',
+            alpha=alpha
+        )
+    else:
+        raise ValueError(f"Arquitectura de estudiante no soportada: {architecture}")
+
+    x = backbone(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(0.2)(x)
+    logits = layers.Dense(num_classes, name='student_logits')(x)
+    return keras.Model(inputs, logits, name=f"student_{architecture}")
+
+
+class Distiller(keras.Model):
+    """
+    Entrenamiento profesor -> estudiante:
+    loss = alpha * CE(etiquetas, estudiante) + (1 - alpha) * T² * KL(profesor_T || estudiante_T)
+    """
+
+    def __init__(self, student, teacher, alpha: float = 0.3, temperature: float = 4.0):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.alpha = alpha
+        self.temperature = temperature
+        self.ce_loss = keras.losses.SparseCategoricalCrossentropy(from_logits=True)
+        self.kl_loss = keras.losses.KLDivergence()
+        self.accuracy = keras.metrics.SparseCategoricalAccuracy(name='accuracy')
+        self.loss_tracker = keras.metrics.Mean(name='loss')
+
+    @property
+    def metrics(self):
+        return [self.loss_tracker, self.accuracy]
+
+    def call(self, images, training=False):
+        # Keras 3 construye el modelo llamando a call() antes de fit()
+        return self.student(images, training=training)
+
+    def _teacher_soft_targets(self, images):
+        # El profesor termina en softmax: log(p) funciona como logits
+        teacher_probs = self.teacher(images, training=False)
+        teacher_logits = tf.math.log(tf.clip_by_value(teacher_probs, 1e-8, 1.0))
+        return tf.nn.softmax(teacher_logits / self.temperature)
+
+    def train_step(self, data):
+        images, labels = data
+        soft_targets = self._teacher_soft_targets(images)
+        with tf.GradientTape() as tape:
+            student_logits = self.student(images, training=True)
+            hard_loss = self.ce_loss(labels, student_logits)
+            soft_loss = self.kl_loss(soft_targets, tf.nn.softmax(student_logits / self.temperature))
+            loss = self.alpha * hard_loss + (1 - self.alpha) * soft_loss * self.temperature ** 2
+        gradients = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.student.trainable_variables))
+        self.loss_tracker.update_state(loss)
+        self.accuracy.update_state(labels, student_logits)
+        return {m.name: m.result() for m in self.metrics}
+
+    def test_step(self, data):
+        images, labels = data
+        student_logits = self.student(images, training=False)
+        self.loss_tracker.update_state(self.ce_loss(labels, student_logits))
+        self.accuracy.update_state(labels, student_logits)
+        return {m.name: m.result() for m in self.metrics}
+
+
+def deployable_student(student):
+    """Añadir softmax para que el estudiante sea intercambiable con el profesor"""
+    outputs = layers.Softmax(name='student_probs')(student.output)
+    return keras.Model(student.input, outputs, name=student.name)
+
+
+# =====================================================================
+# Informe de compromisos precisión / latencia / tamaño
+# =====================================================================
+
+def evaluate_accuracy(model, dataset) -> Dict[str, float]:
+    """Top-1 y top-5 sobre el split de validación"""
+    top1 = keras.metrics.SparseTopKCategoricalAccuracy(k=1)
+    top5 = keras.metrics.SparseTopKCategoricalAccuracy(k=5)
+    for images, labels in dataset:
+        probs = model(images, training=False)
+        top1.update_state(labels, probs)
+        top5.update_state(labels, probs)
+    return {'top1_accuracy': float(top1.result()), 'top5_accuracy': float(top5.result())}
+
+
+def measure_latency(model, input_size=(224, 224), runs: int = 50, warmup: int = 5) -> Dict[str, float]:
+    """Latencia por imagen en CPU (batch de 1, como en /predict)"""
+    sample = np.random.uniform(-1, 1, size=(1,) + tuple(input_size) + (3,)).astype(np.float32)
+    for _ in range(warmup):
+        model(sample, training=False)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model(sample, training=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'latency_ms_mean': float(np.mean(timings)),
+        'latency_ms_p95': float(np.percentile(timings, 95))
+    }
+
+
+def model_size(model, path: str) -> Dict[str, float]:
+    return {
+        'parameters': int(model.count_params()),
+        'file_size_mb': round(os.path.getsize(path) / 1024**2, 2)
+    }
+
+
+def print_report(report: Dict):
+    print("\n" + "="*60)
+    print("INFORME DE DESTILACIÓN")
+    print("="*60)
+    print(f"{'':12}{'top-1':>8}{'top-5':>8}{'ms/img':>10}{'params':>12}{'MB':>8}")
+    for name in ('teacher', 'student'):
+        r = report[name]
+        print(f"{name:12}{r['top1_accuracy']:>8.3f}{r['top5_accuracy']:>8.3f}"
+              f"{r['latency_ms_mean']:>10.1f}{r['parameters']:>12,}{r['file_size_mb']:>8.1f}")
+    print("="*60 + "\n")
+
+
+def register_variant(output_dir: str, species: str, variant: str, model_file: str, report: Dict):
+    """Registrar el estudiante como variante en model_variants.json"""
+    registry_path = os.path.join(output_dir, 'model_variants.json')
+    registry = {}
+    if os.path.exists(registry_path):
+        with open(registry_path, 'r', encoding='utf-8') as f:
+            registry = json.load(f)
+    registry.setdefault(species, {})[variant] = {
+        'model_file': model_file,
+        'architecture': report['student']['architecture'],
+        'resolution': report['student']['resolution'],
+        'top1_accuracy': report['student']['top1_accuracy']
+    }
+    with open(registry_path, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=2, ensure_ascii=False)
+
+
+def distill(config: TrainingConfig, architecture: str, resolution: int, epochs: int,
+            alpha: float, temperature: float, variant: str = 'compact') -> Dict:
+    manager = SpeciesModelsManager(config.output_dir)
+    teacher_path = manager.get_model_path(config.species)
+    if not manager.is_model_trained(config.species) or not teacher_path:
+        raise ValueError(f"La especie {config.species} no tiene modelo profesor entrenado")
+
+    # El estudiante debe respetar el orden de clases del profesor
+    class_names = manager.get_species_config(config.species).breeds
+    train_files, train_labels, val_files, val_labels, class_names = build_splits(config, class_names)
+    train_ds = create_dataset(train_files, train_labels, config, is_training=True)
+    val_ds = create_dataset(val_files, val_labels, config, is_training=False)
+
+    print(f"Profesor: {teacher_path}")
+    teacher = keras.models.load_model(teacher_path)
+    student = build_student(len(class_names), architecture, resolution, config.image_size)
+    print(f"Estudiante: {architecture} @ {resolution}px - {student.count_params():,} parámetros")
+
+    distiller = Distiller(student, teacher, alpha=alpha, temperature=temperature)
+    distiller.compile(optimizer=keras.optimizers.Adam(learning_rate=config.learning_rate))
+    distiller.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=epochs,
+        callbacks=[
+            keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=5, mode='max',
+                                          restore_best_weights=True, verbose=1),
+            keras.callbacks.CSVLogger(os.path.join(config.output_dir,
+                                                   f"{config.species}_distillation_log.csv"))
+        ],
+        verbose=1
+    )
+
+    model_file = f"{config.species}_{variant}.keras"
+    student_path = os.path.join(config.output_dir, model_file)
+    compact = deployable_student(student)
+    compact.save(student_path)
+
+    report = {
+        'species': config.species,
+        'variant': variant,
+        'teacher': {
+            'model_file': os.path.basename(teacher_path),
+            **evaluate_accuracy(teacher, val_ds),
+            **measure_latency(teacher, config.image_size),
+            **model_size(teacher, teacher_path)
+        },
+        'student': {
+            'model_file': model_file,
+            'architecture': architecture,
+            'resolution': resolution,
+            **evaluate_accuracy(compact, val_ds),
+            **measure_latency(compact, config.image_size),
+            **model_size(compact, student_path)
+        },
+        'distillation': {'alpha': alpha, 'temperature': temperature, 'epochs': epochs}
+    }
+    report['tradeoffs'] = {
+        'top1_accuracy_delta': report['student']['top1_accuracy'] - report['teacher']['top1_accuracy'],
+        'speedup': report['teacher']['latency_ms_mean'] / report['student']['latency_ms_mean'],
+        'size_ratio': report['student']['file_size_mb'] / report['teacher']['file_size_mb']
+    }
+
+    with open(os.path.join(config.output_dir, f"{config.species}_{variant}_report.json"),
+              'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    register_variant(config.output_dir, config.species, variant, model_file, report)
+
+    print_report(report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Destilación de un modelo de razas compacto')
+    parser.add_argument('--species', required=True)
+    parser.add_argument('--data-dir', help='Directorio con una carpeta por raza')
+    parser.add_argument('--manifest', help='CSV con columnas path,label[,split]')
+    parser.add_argument('--student', default='mobilenet_v3_small', choices=STUDENT_ARCHITECTURES)
+    parser.add_argument('--resolution', type=int, default=160)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--alpha', type=float, default=0.3, help='Peso de la pérdida con etiquetas reales')
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output-dir', default=MODEL_DATA_PATH)
+    args = parser.parse_args()
+
+    config = TrainingConfig(
+        species=args.species,
+        data_dir=args.data_dir,
+        manifest=args.manifest,
+        batch_size=args.batch_size,
+        output_dir=args.output_dir
+    )
+    distill(config, args.student, args.resolution, args.epochs, args.alpha, args.temperature)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+📐 Resúmenes en streaming de memoria constante
+Estructuras para vigilar la distribución de las predicciones sin guardar el
+historial en memoria: histogramas de bins fijos, count-min sketch para la
+frecuencia de cada raza y un reservoir con una muestra uniforme de registros.
+Todas se actualizan con arrays NumPy (un batch del log de predicciones a la
+vez) y ocupan lo mismo tras mil o tras mil millones de predicciones.
+"""
+
+import random
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Evita log(0) y divisiones por cero en el PSI con bins vacíos
+PSI_EPSILON = 1e-4
+
+
+def population_stability_index(expected: np.ndarray, actual: np.ndarray) -> Optional[float]:
+    """
+    PSI entre dos distribuciones de conteos sobre los mismos bins
+    (< 0.1 estable, 0.1-0.25 cambio moderado, > 0.25 cambio importante)
+    """
+    if expected.sum() == 0 or actual.sum() == 0:
+        return None
+    p = np.maximum(expected / expected.sum(), PSI_EPSILON)
+    q = np.maximum(actual / actual.sum(), PSI_EPSILON)
+    return round(float(np.sum((q - p) * np.log(q / p))), 4)
+
+
+class Histogram:
+    """Conteos sobre bordes fijos (los valores fuera del rango van a los bins extremos)"""
+
+    def __init__(self, edges: np.ndarray):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+
+    @classmethod
+    def linear(cls, low: float, high: float, bins: int) -> 'Histogram':
+        return cls(np.linspace(low, high, bins + 1))
+
+    @classmethod
+    def logarithmic(cls, low: float, high: float, bins: int) -> 'Histogram':
+        return cls(np.geomspace(low, high, bins + 1))
+
+    def update(self, values: np.ndarray):
+        index = np.searchsorted(self.edges, values, side='right') - 1
+        np.add.at(self.counts, np.clip(index, 0, len(self.counts) - 1), 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cuantil aproximado (borde superior del bin que lo contiene)"""
+        total = self.counts.sum()
+        if total == 0:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.counts), q * total))
+        return round(float(self.edges[min(index + 1, len(self.edges) - 1)]), 4)
+
+    def to_dict(self) -> Dict:
+        return {'edges': [round(float(e), 4) for e in self.edges], 'counts': self.counts.tolist()}
+
+
+class CountMinSketch:
+    """
+    Frecuencias aproximadas de ids enteros en `depth` x `width` contadores:
+    la estimación nunca es menor que la real y la sobreestima como mucho
+    ~ e/width * total con probabilidad 1 - exp(-depth)
+    """
+
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, width: int = 512, depth: int = 4, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.counts = np.zeros((depth, width), dtype=np.int64)
+        self._a = rng.integers(1, 1 << 31, size=(depth, 1), dtype=np.int64)
+        self._b = rng.integers(0, 1 << 31, size=(depth, 1), dtype=np.int64)
+        self.total = 0
+
+    def _buckets(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64).reshape(1, -1)
+        return ((self._a * ids + self._b) % self.PRIME) % self.width
+
+    def update(self, ids: np.ndarray):
+        buckets = self._buckets(ids)
+        for row in range(len(self.counts)):
+            np.add.at(self.counts[row], buckets[row], 1)
+        self.total += buckets.shape[1]
+
+    def estimate(self, ids: np.ndarray) -> np.ndarray:
+        buckets = self._buckets(ids)
+        return np.take_along_axis(self.counts, buckets, axis=1).min(axis=0)
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0
+
+
+class Reservoir:
+    """Muestra uniforme de tamaño fijo de un flujo (algoritmo R)"""
+
+    def __init__(self, size: int = 256, seed: Optional[int] = None):
+        self.size = size
+        self.items: List = []
+        self.seen = 0
+        self._random = random.Random(seed)
+
+    def update(self, items: List):
+        for item in items:
+            self.seen += 1
+            if len(self.items) < self.size:
+                self.items.append(item)
+            else:
+                slot = self._random.randrange(self.seen)
+                if slot < self.size:
+                    self.items[slot] = item
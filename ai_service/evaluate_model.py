@@ -0,0 +1,320 @@
+"""
+📏 Evaluación de modelos de razas con puertas de regresión
+Ejecuta un modelo candidato y el modelo desplegado sobre el mismo conjunto
+retenido, con el mismo preprocesado que el servicio (decode_image +
+normalize_batch) y el backend de inferencia elegido, y calcula:
+
+- top-1, top-5 y accuracy por clase, matriz de confusión (NumPy vectorizado)
+- latencia por batch (p50/p95/p99) y throughput en imágenes/s
+
+Si el candidato empeora más de lo permitido frente al desplegado el comando
+termina con código 1, de modo que puede bloquear un despliegue en CI.
+
+Uso:
+    python evaluate_model.py --species dog --data-dir /datasets/stanford_dogs/Images \\
+        --candidate model_data/dog_model.keras --report eval/dog.json
+    python evaluate_model.py --species dog --manifest val.csv --variant compact --backend onnx
+    python evaluate_model.py --species dog --data-dir ... --publish   # actualizar métricas servidas
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from dataset_manifests import is_validation_sample, load_manifest
+from inference_backends import create_backend
+from multi_species_predictor import IMAGE_SIZE, decode_image, normalize_batch
+from species_models import EVALUATION_REPORT_FILE, SpeciesModelsManager
+from tensor_store import TENSOR_STORE_PATH, TensorStore, open_store
+
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+TOP_K = 5
+
+
+# =====================================================================
+# Datos
+# =====================================================================
+
+def load_eval_set(class_names: List[str], data_dir: Optional[str] = None,
+                  manifest: Optional[str] = None, split: str = 'val', val_split: float = 0.2,
+                  seed: int = 42, limit: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    """
+    Seleccionar las imágenes de evaluación y sus índices de clase.
+    `split='val'` reproduce el split retenido de training_pipeline.py (misma
+    semilla y proporción); `split='all'` usa todo el dataset (carpeta ya retenida).
+    """
+    paths, labels, splits = load_manifest(data_dir, manifest)
+    class_index = {name: i for i, name in enumerate(class_names)}
+
+    files, targets = [], []
+    skipped = 0
+    for path, label, sample_split in zip(paths, labels, splits):
+        if label not in class_index:
+            skipped += 1
+            continue
+        if split == 'val' and not is_validation_sample(path, sample_split, val_split, seed):
+            continue
+        files.append(path)
+        targets.append(class_index[label])
+
+    if skipped:
+        print(f"⚠️ {skipped} imágenes con clases desconocidas para el modelo fueron descartadas")
+    if limit:
+        files, targets = files[:limit], targets[:limit]
+    if not files:
+        raise ValueError("No hay imágenes de evaluación")
+    return files, np.asarray(targets, dtype=np.int64)
+
+
+def decode_files(files: List[str], workers: int = 8, store: Optional[TensorStore] = None) -> np.ndarray:
+    """
+    Decodificar todas las imágenes una sola vez (uint8) para compartirlas entre
+    modelos; con almacén de tensores solo se decodifican las que no estén
+    """
+    if store is not None:
+        return store.load_files(files, workers)
+    images = np.empty((len(files), *IMAGE_SIZE, 3), dtype=np.uint8)
+
+    def decode(index: int):
+        with open(files[index], 'rb') as f:
+            images[index] = decode_image(f.read())
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(decode, range(len(files))))
+    return images
+
+
+# =====================================================================
+# Inferencia y métricas
+# =====================================================================
+
+def run_model(runner, images: np.ndarray, batch_size: int, warmup: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ejecutar un modelo por batches reutilizando un único buffer float32.
+    Retorna (probabilidades (N, C), latencias por batch en ms)
+    """
+    buffer = np.empty((batch_size, *IMAGE_SIZE, 3), dtype=np.float32)
+    for _ in range(warmup):
+        count = min(batch_size, len(images))
+        runner.predict(normalize_batch(images[:count], out=buffer[:count]))
+
+    outputs, latencies = [], []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        inputs = normalize_batch(batch, out=buffer[:len(batch)])
+        batch_start = time.perf_counter()
+        outputs.append(np.asarray(runner.predict(inputs), dtype=np.float32))
+        latencies.append((time.perf_counter() - batch_start) * 1000)
+    return np.concatenate(outputs), np.asarray(latencies)
+
+
+def compute_metrics(probabilities: np.ndarray, targets: np.ndarray, class_names: List[str],
+                    k: int = TOP_K) -> Dict:
+    """Top-1, top-k, accuracy por clase y matriz de confusión sin bucles por imagen"""
+    num_classes = len(class_names)
+    predicted = probabilities.argmax(axis=1)
+    k = min(k, num_classes)
+    top_k = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    top_k_hits = (top_k == targets[:, None]).any(axis=1)
+
+    confusion = np.bincount(targets * num_classes + predicted,
+                            minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+    support = confusion.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        per_class = np.diag(confusion) / support
+    evaluated = support > 0
+
+    return {
+        'samples': int(len(targets)),
+        'top1_accuracy': float((predicted == targets).mean()),
+        f'top{k}_accuracy': float(top_k_hits.mean()),
+        'mean_per_class_accuracy': float(per_class[evaluated].mean()),
+        'per_class_accuracy': {class_names[i]: round(float(per_class[i]), 4)
+                               for i in np.flatnonzero(evaluated)},
+        'confusion_matrix': confusion
+    }
+
+
+def latency_stats(latencies: np.ndarray, samples: int, batch_size: int) -> Dict:
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'batch_size': batch_size,
+        'batches': int(len(latencies)),
+        'batch_latency_ms': {'p50': round(float(p50), 2), 'p95': round(float(p95), 2),
+                             'p99': round(float(p99), 2), 'mean': round(float(latencies.mean()), 2)},
+        'throughput_images_per_s': round(float(samples / (latencies.sum() / 1000)), 2)
+    }
+
+
+def evaluate(runner, images: np.ndarray, targets: np.ndarray, class_names: List[str],
+             batch_size: int) -> Dict:
+    probabilities, latencies = run_model(runner, images, batch_size)
+    result = compute_metrics(probabilities, targets, class_names)
+    result['latency'] = latency_stats(latencies, len(images), batch_size)
+    return result
+
+
+# =====================================================================
+# Puertas de regresión
+# =====================================================================
+
+def check_gates(candidate: Dict, baseline: Dict, max_top1_drop: float, max_top5_drop: float,
+                max_latency_ratio: float) -> List[Dict]:
+    """Comparar candidato vs desplegado; cada puerta indica si pasa"""
+    gates = []
+    for metric, max_drop in (('top1_accuracy', max_top1_drop), (f'top{TOP_K}_accuracy', max_top5_drop)):
+        drop = baseline[metric] - candidate[metric]
+        gates.append({'gate': f'{metric}_drop', 'value': round(drop, 4), 'threshold': max_drop,
+                      'passed': drop <= max_drop})
+
+    candidate_p95 = candidate['latency']['batch_latency_ms']['p95']
+    baseline_p95 = baseline['latency']['batch_latency_ms']['p95']
+    ratio = candidate_p95 / baseline_p95 if baseline_p95 > 0 else 1.0
+    gates.append({'gate': 'p95_latency_ratio', 'value': round(ratio, 3), 'threshold': max_latency_ratio,
+                  'passed': ratio <= max_latency_ratio})
+    return gates
+
+
+def publish_metrics(model_data_path: str, species: str, model_file: str, metrics: Dict,
+                    backend: str, dataset: str):
+    """Guardar las métricas del modelo servido en evaluation_report.json (las lee /model/info)"""
+    path = os.path.join(model_data_path, EVALUATION_REPORT_FILE)
+    report = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    report[species] = {
+        'model_file': model_file,
+        'top1_accuracy': round(metrics['top1_accuracy'], 4),
+        f'top{TOP_K}_accuracy': round(metrics[f'top{TOP_K}_accuracy'], 4),
+        'mean_per_class_accuracy': round(metrics['mean_per_class_accuracy'], 4),
+        'samples': metrics['samples'],
+        'dataset': dataset,
+        'backend': backend,
+        'throughput_images_per_s': metrics['latency']['throughput_images_per_s'],
+        'evaluated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Métricas de {species} publicadas en {path}")
+
+
+def print_summary(name: str, result: Dict):
+    latency = result['latency']
+    print(f"📊 {name}: top-1 {result['top1_accuracy']:.2%} | top-{TOP_K} "
+          f"{result[f'top{TOP_K}_accuracy']:.2%} | media por clase {result['mean_per_class_accuracy']:.2%} | "
+          f"p95 {latency['batch_latency_ms']['p95']:.1f} ms/batch | "
+          f"{latency['throughput_images_per_s']:.1f} img/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluar un modelo de razas frente al desplegado')
+    parser.add_argument('--species', default='dog')
+    parser.add_argument('--data-dir', help='Dataset en carpetas por raza')
+    parser.add_argument('--manifest', help='CSV con columnas path,label[,split]')
+    parser.add_argument('--split', choices=['val', 'all'], default='val',
+                        help="'val' = split retenido de training_pipeline.py; 'all' = todo el dataset")
+    parser.add_argument('--val-split', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--limit', type=int, help='Evaluar solo las primeras N imágenes')
+    parser.add_argument('--candidate', help='Modelo candidato (por defecto, el desplegado)')
+    parser.add_argument('--variant', help='Evaluar una variante registrada (p.ej. compact) como candidato')
+    parser.add_argument('--backend', default='keras', choices=['keras', 'onnx'])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=8, help='Hilos de decodificación')
+    parser.add_argument('--tensor-store', default=TENSOR_STORE_PATH,
+                        help='Almacén de tensores preprocesados (tensor_store.py); vacío = decodificar siempre')
+    parser.add_argument('--max-top1-drop', type=float, default=0.01)
+    parser.add_argument('--max-top5-drop', type=float, default=0.01)
+    parser.add_argument('--max-latency-ratio', type=float, default=1.2,
+                        help='p95 del candidato / p95 del desplegado')
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    parser.add_argument('--report', help='Ruta del informe JSON (la matriz de confusión va en .npy)')
+    parser.add_argument('--publish', action='store_true',
+                        help='Si pasan las puertas, publicar las métricas del candidato para /model/info')
+    args = parser.parse_args()
+
+    manager = SpeciesModelsManager(args.model_data)
+    config = manager.get_species_config(args.species)
+    deployed_path = manager.get_model_path(args.species)
+    if config is None or config.status != 'trained' or deployed_path is None:
+        print(f"❌ La especie {args.species} no tiene un modelo entrenado desplegado")
+        sys.exit(2)
+
+    if args.variant:
+        candidate_path = manager.get_variant_model_path(args.species, args.variant)
+        if candidate_path is None:
+            print(f"❌ Variante no registrada: {args.species}/{args.variant}")
+            sys.exit(2)
+    else:
+        candidate_path = args.candidate or deployed_path
+    compare = os.path.abspath(candidate_path) != os.path.abspath(deployed_path)
+
+    class_names = config.breeds
+    files, targets = load_eval_set(class_names, args.data_dir, args.manifest, args.split,
+                                   args.val_split, args.seed, args.limit)
+    print(f"🔄 Decodificando {len(files)} imágenes ({len(class_names)} clases)...")
+    images = decode_files(files, args.workers, open_store(args.tensor_store))
+
+    backend = create_backend(args.backend, args.model_data)
+    backend.prepare()
+
+    results = {}
+    print(f"🔄 Evaluando candidato: {candidate_path}")
+    results['candidate'] = evaluate(backend.load_model(candidate_path), images, targets,
+                                    class_names, args.batch_size)
+    print_summary('Candidato', results['candidate'])
+    if compare:
+        print(f"🔄 Evaluando desplegado: {deployed_path}")
+        results['baseline'] = evaluate(backend.load_model(deployed_path), images, targets,
+                                       class_names, args.batch_size)
+        print_summary('Desplegado', results['baseline'])
+        gates = check_gates(results['candidate'], results['baseline'], args.max_top1_drop,
+                            args.max_top5_drop, args.max_latency_ratio)
+    else:
+        gates = []
+
+    for gate in gates:
+        status = '✅' if gate['passed'] else '❌'
+        print(f"{status} {gate['gate']}: {gate['value']} (límite {gate['threshold']})")
+    passed = all(gate['passed'] for gate in gates)
+
+    if args.report:
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        base = os.path.splitext(args.report)[0]
+        for name, result in results.items():
+            np.save(f"{base}_{name}_confusion.npy", result.pop('confusion_matrix'))
+        report = {
+            'species': args.species,
+            'backend': args.backend,
+            'dataset': args.manifest or args.data_dir,
+            'split': args.split,
+            'candidate_model': candidate_path,
+            'baseline_model': deployed_path if compare else None,
+            'class_names': class_names,
+            'results': results,
+            'gates': gates,
+            'passed': passed
+        }
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📄 Informe guardado en {args.report}")
+
+    if args.publish and passed:
+        publish_metrics(args.model_data, args.species, os.path.basename(candidate_path),
+                        results['candidate'], args.backend, args.manifest or args.data_dir)
+
+    if not passed:
+        print("❌ El candidato no pasa las puertas de regresión")
+        sys.exit(1)
+    print("✅ Evaluación completada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+📦 Exportación de modelos Keras a ONNX
+Convierte el detector de especies (también su versión con mapa de
+características para /predict/regions) y los modelos de razas (incluidas sus
+variantes) a `model_data/onnx/` y verifica la paridad de salidas frente a Keras.
+
+Uso:
+    python export_onnx.py
+    python export_onnx.py --species dog --samples 32 --tolerance 1e-4
+
+Después se puede servir sin TensorFlow con `PET_AI_BACKEND=onnx`.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+import tensorflow as tf
+import tf2onnx
+import onnxruntime as ort
+
+from species_models import SpeciesModelsManager
+from inference_backends import (CLASSIFIER_LAYER, LOCALIZER_WEIGHTS_FILE, ONNX_DIR, SPECIES_DETECTOR_NAME,
+                                SPECIES_LOCALIZER_NAME, build_keras_localizer, onnx_model_name)
+
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+OPSET = 13
+
+
+def export_model(model, output_path: str) -> str:
+    """Convertir un modelo Keras a ONNX con batch dinámico"""
+    input_signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input')]
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=OPSET,
+                               output_path=output_path)
+    return output_path
+
+
+def check_parity(model, onnx_path: str, samples: np.ndarray) -> Dict[str, float]:
+    """Comparar salidas Keras vs ONNX Runtime sobre las mismas entradas"""
+    session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+    keras_out = model(samples, training=False)
+    # Modelos con varias salidas (localizador): se compara la de probabilidades
+    keras_out = (keras_out[0] if isinstance(keras_out, (list, tuple)) else keras_out).numpy()
+    onnx_out = session.run(None, {input_name: samples})[0]
+    return {
+        'max_abs_diff': float(np.max(np.abs(keras_out - onnx_out))),
+        'top1_agreement': float(np.mean(keras_out.argmax(axis=1) == onnx_out.argmax(axis=1)))
+    }
+
+
+def models_to_export(manager: SpeciesModelsManager, species_filter: List[str]) -> List[Tuple[str, str]]:
+    """Lista de (especie/variante, ruta .keras) de los modelos de razas entrenados"""
+    models = []
+    for species, config in manager.get_all_species().items():
+        if species_filter and species not in species_filter:
+            continue
+        if config.status == 'trained' and config.model_file:
+            models.append((species, manager.get_model_path(species)))
+        for variant in config.variants:
+            models.append((f"{species}/{variant}", manager.get_variant_model_path(species, variant)))
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar modelos Keras a ONNX')
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    parser.add_argument('--species', nargs='*', default=[], help='Limitar a estas especies')
+    parser.add_argument('--skip-detector', action='store_true')
+    parser.add_argument('--samples', type=int, default=16, help='Entradas para verificar paridad')
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    onnx_dir = os.path.join(args.model_data, ONNX_DIR)
+    os.makedirs(onnx_dir, exist_ok=True)
+    samples = np.random.default_rng(0).uniform(-1, 1, size=(args.samples, 224, 224, 3)).astype(np.float32)
+
+    targets = []
+    if not args.skip_detector:
+        detector = tf.keras.applications.MobileNetV2(weights='imagenet', include_top=True,
+                                                     input_shape=(224, 224, 3))
+        targets.append((SPECIES_DETECTOR_NAME, detector))
+        targets.append((SPECIES_LOCALIZER_NAME, build_keras_localizer(tf, detector)))
+        np.save(os.path.join(onnx_dir, LOCALIZER_WEIGHTS_FILE), detector.get_layer(CLASSIFIER_LAYER).get_weights()[0])
+
+    manager = SpeciesModelsManager(args.model_data)
+    for label, model_path in models_to_export(manager, args.species):
+        if not os.path.exists(model_path):
+            print(f"⚠️ {label}: {model_path} no encontrado, se omite")
+            continue
+        targets.append((onnx_model_name(model_path), tf.keras.models.load_model(model_path)))
+
+    report = {}
+    failed = False
+    for name, model in targets:
+        output_path = os.path.join(onnx_dir, f"{name}.onnx")
+        print(f"🔄 Exportando {name}...")
+        export_model(model, output_path)
+        parity = check_parity(model, output_path, samples)
+        parity['file_size_mb'] = round(os.path.getsize(output_path) / 1024**2, 2)
+        report[name] = parity
+        ok = parity['max_abs_diff'] <= args.tolerance
+        failed = failed or not ok
+        status = "✅" if ok else "❌"
+        print(f"{status} {name}: max |Δ| = {parity['max_abs_diff']:.2e}, "
+              f"top-1 = {parity['top1_agreement']:.1%}")
+
+    report['_meta'] = {'opset': OPSET, 'tensorflow': tf.__version__, 'onnxruntime': ort.__version__,
+                       'tolerance': args.tolerance}
+    with open(os.path.join(onnx_dir, 'export_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    if failed:
+        print("❌ Paridad fuera de tolerancia: no despliegues el backend ONNX")
+        sys.exit(1)
+    print(f"✅ Modelos ONNX listos en {onnx_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+⚡ Serialización JSON de las respuestas
+Con orjson instalado se escribe directamente a bytes (varias veces más rápido
+que la librería estándar y acepta tipos NumPy); sin él se usa `json` con la
+misma salida compacta. La usan ambas apps y el servidor de inferencia.
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    """Tipos NumPy que la librería estándar no sabe serializar"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} no es serializable a JSON")
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
@@ -0,0 +1,204 @@
+"""
+🎞️ Entrada multi-fotograma: GIF/WebP animados y clips de vídeo cortos
+En lugar de decodificar todos los fotogramas se toma una muestra dispersa por
+rondas (primero unos pocos repartidos por el clip, después los puntos
+intermedios) y cada ronda se infiere como un único batch. El muestreo se
+detiene en cuanto la especie y la raza agregadas superan el umbral de
+confianza, así el coste queda acotado por PET_AI_CLIP_MAX_FRAMES fotogramas.
+
+Variables de entorno:
+    PET_AI_CLIP_FIRST_FRAMES        fotogramas de la primera ronda (3)
+    PET_AI_CLIP_MAX_FRAMES          fotogramas inferidos como máximo (8)
+    PET_AI_CLIP_MAX_TOTAL_FRAMES    fotogramas que puede tener el archivo (600)
+    PET_AI_CLIP_SPECIES_CONFIDENCE  confianza de especie agregada para parar (0.5)
+    PET_AI_CLIP_BREED_CONFIDENCE    confianza de raza agregada para parar (0.6)
+
+El vídeo (MP4/WebM) necesita PyAV (`pip install av`); sin él solo se aceptan
+imágenes animadas.
+"""
+
+import io
+import os
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from multi_species_predictor import IMAGE_SIZE, image_to_array
+from upload_validation import SNIFF_BYTES, VIDEO_FORMATS, UploadRejected, check_dimensions, sniff_format
+
+CLIP_FIRST_FRAMES = int(os.environ.get('PET_AI_CLIP_FIRST_FRAMES', '3'))
+CLIP_MAX_FRAMES = int(os.environ.get('PET_AI_CLIP_MAX_FRAMES', '8'))
+CLIP_MAX_TOTAL_FRAMES = int(os.environ.get('PET_AI_CLIP_MAX_TOTAL_FRAMES', '600'))
+CLIP_SPECIES_CONFIDENCE = float(os.environ.get('PET_AI_CLIP_SPECIES_CONFIDENCE', '0.5'))
+CLIP_BREED_CONFIDENCE = float(os.environ.get('PET_AI_CLIP_BREED_CONFIDENCE', '0.6'))
+
+FRAME_SHAPE = IMAGE_SIZE + (3,)
+
+
+def _import_av():
+    try:
+        import av
+    except ImportError:
+        raise UploadRejected('unsupported_format',
+                             'Los vídeos requieren PyAV en el servidor; envía un GIF o WebP animado', 415)
+    return av
+
+
+def _check_frame_count(frame_count: int):
+    if frame_count > CLIP_MAX_TOTAL_FRAMES:
+        raise UploadRejected('clip_too_long',
+                             f'El clip tiene {frame_count} fotogramas (máximo {CLIP_MAX_TOTAL_FRAMES})', 413)
+
+
+class AnimatedImageFrames:
+    """Fotogramas de un GIF/WebP animado (PIL decodifica bajo demanda al hacer seek)"""
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self.frame_count = image.n_frames
+        _check_frame_count(self.frame_count)
+
+    def decode(self, indices: List[int]) -> Tuple[List[int], np.ndarray]:
+        """
+        Índices decodificados y uint8 (N, 224, 224, 3) con esos fotogramas, en
+        orden creciente
+        """
+        arrays = []
+        for index in indices:
+            self.image.seek(index)
+            arrays.append(image_to_array(self.image))
+        return list(indices), np.stack(arrays)
+
+
+class VideoFrames:
+    """
+    Fotogramas de un clip de vídeo con PyAV: para cada muestra se salta al
+    keyframe anterior y se decodifica solo hasta el instante buscado
+    """
+
+    def __init__(self, data: bytes):
+        self.av = _import_av()
+        self.data = data
+        try:
+            with self.av.open(io.BytesIO(data)) as container:
+                stream = container.streams.video[0]
+                check_dimensions(stream.codec_context.width, stream.codec_context.height)
+                self.rate = float(stream.average_rate or 25)
+                self.frame_count = stream.frames or sum(1 for packet in container.demux(stream) if packet.size)
+        except UploadRejected:
+            raise
+        except Exception as e:
+            raise UploadRejected('invalid_image', f'No se pudo leer el vídeo: {e}')
+        if self.frame_count <= 0:
+            raise UploadRejected('invalid_image', 'El vídeo no contiene fotogramas')
+        _check_frame_count(self.frame_count)
+
+    def decode(self, indices: List[int]) -> Tuple[List[int], np.ndarray]:
+        """
+        Como AnimatedImageFrames.decode, pero un índice puede faltar: el número
+        de fotogramas de la cabecera es aproximado y un salto puede no dar
+        ningún fotograma en o tras el instante buscado
+        """
+        decoded, arrays = [], []
+        with self.av.open(io.BytesIO(self.data)) as container:
+            stream = container.streams.video[0]
+            start = stream.start_time or 0
+            for index in indices:
+                target = start + int(index / self.rate / stream.time_base)
+                container.seek(target, stream=stream, backward=True, any_frame=False)
+                for frame in container.decode(stream):
+                    if frame.pts is None or frame.pts >= target:
+                        decoded.append(index)
+                        arrays.append(image_to_array(frame.to_image()))
+                        break
+        if not arrays:
+            return decoded, np.empty((0,) + FRAME_SHAPE, dtype=np.uint8)
+        return decoded, np.stack(arrays)
+
+
+def open_frames(data: bytes):
+    """
+    Fuente de fotogramas si el archivo es un GIF/WebP animado o un vídeo;
+    None para imágenes de un solo fotograma (camino normal)
+    """
+    image_format = sniff_format(data[:SNIFF_BYTES])
+    if image_format in VIDEO_FORMATS:
+        return VideoFrames(data)
+    if image_format not in ('GIF', 'WEBP'):
+        return None
+    image = Image.open(io.BytesIO(data))
+    check_dimensions(*image.size)
+    if getattr(image, 'n_frames', 1) <= 1:
+        return None
+    return AnimatedImageFrames(image)
+
+
+def sampling_rounds(frame_count: int, first: int = CLIP_FIRST_FRAMES,
+                    max_frames: int = CLIP_MAX_FRAMES) -> Iterator[List[int]]:
+    """
+    Índices a decodificar en cada ronda: `first` fotogramas repartidos por el
+    clip y después, duplicando la densidad, solo los que aún no se muestrearon
+    """
+    budget = min(max_frames, frame_count)
+    sampled = set()
+    slots = max(1, first)
+    while len(sampled) < budget:
+        positions = {min(frame_count - 1, int((i + 0.5) * frame_count / slots)) for i in range(slots)}
+        new = sorted(positions - sampled)[:budget - len(sampled)]
+        if new:
+            sampled.update(new)
+            yield new
+        slots *= 2
+
+
+def aggregate_frame_results(indices: List[int], results: List[Dict]) -> Dict:
+    """
+    Combinar los resultados por fotograma: especie con mayor confianza media
+    (los fotogramas sin detección cuentan 0) y razas promediando el top 5 de
+    los fotogramas de esa especie
+    """
+    species_scores: Dict[str, float] = defaultdict(float)
+    for result in results:
+        if result.get('success'):
+            species_scores[result['species']] += result['species_confidence'] / len(results)
+
+    per_frame = [{
+        'frame': index,
+        'species': result.get('species'),
+        'species_confidence': result.get('species_confidence', 0.0),
+        'breed': result.get('breed'),
+        'breed_confidence': result.get('breed_confidence', 0.0)
+    } for index, result in zip(indices, results)]
+
+    if not species_scores:
+        aggregated = dict(results[0])
+        aggregated['per_frame'] = per_frame
+        return aggregated
+
+    species = max(species_scores, key=species_scores.get)
+    species_results = [r for r in results if r.get('success') and r['species'] == species]
+    breed_scores: Dict[str, float] = defaultdict(float)
+    for result in species_results:
+        for prediction in result['top_5_predictions']:
+            breed_scores[prediction['breed']] += prediction['confidence'] / len(species_results)
+    top_5 = sorted(breed_scores.items(), key=lambda item: item[1], reverse=True)[:5]
+
+    aggregated = dict(max(species_results, key=lambda r: r['breed_confidence']))
+    aggregated.update({
+        'species_confidence': species_scores[species],
+        'breed': top_5[0][0] if top_5 else aggregated['breed'],
+        'breed_confidence': top_5[0][1] if top_5 else aggregated['breed_confidence'],
+        'top_5_predictions': [{'breed': breed, 'confidence': confidence, 'rank': rank + 1}
+                              for rank, (breed, confidence) in enumerate(top_5)],
+        'per_frame': per_frame
+    })
+    return aggregated
+
+
+def is_confident(aggregated: Dict) -> bool:
+    """¿Basta con lo muestreado? Especie y raza agregadas por encima del umbral"""
+    return (aggregated.get('success', False)
+            and aggregated['species_confidence'] >= CLIP_SPECIES_CONFIDENCE
+            and aggregated['breed_confidence'] >= CLIP_BREED_CONFIDENCE)
@@ -0,0 +1,423 @@
+"""
+🔁 Reentrenamiento incremental con correcciones de raza de los usuarios
+En lugar de repetir el entrenamiento completo, se guardan los embeddings del
+backbone congelado (salida de GlobalAveragePooling2D) de las imágenes
+corregidas y de una muestra de repaso del dataset original, y solo se
+reentrena la cabeza de clasificación sobre esos vectores: minutos en CPU.
+
+Almacén de embeddings (`model_data/embeddings/`): un `.npz` por especie y
+fuente (`{especie}_corrections.npz`, `{especie}_replay.npz`) con hash del
+contenido, embedding en float16, etiqueta y split. Las correcciones se
+deduplican por hash (la última etiqueta gana). Cada almacén guarda la huella
+del backbone con el que se calculó; si el backbone cambia hay que regenerarlo.
+
+Uso:
+    # 1. Muestra de repaso del dataset original (una vez por modelo base)
+    python incremental_training.py replay --species dog --data-dir /datasets/stanford_dogs/Images
+    # 2. Añadir correcciones (CSV `path,label` con la raza corregida, exportado del backend)
+    python incremental_training.py add --species dog --manifest corrections.csv
+    # 3. Reentrenar la cabeza y publicar `{especie}_model_v{N}.keras`
+    python incremental_training.py train --species dog --publish --reload-url http://localhost:5000
+
+Publicar escribe `{especie}_labels.json` apuntando a la nueva versión (las
+anteriores se conservan para volver atrás); el servicio la carga con
+`POST /admin/models/reload` sin reiniciarse.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from dataset_manifests import is_validation_sample, load_csv_manifest, load_manifest
+from evaluate_model import decode_files
+from multi_species_predictor import normalize_batch
+from prediction_cache import content_hash
+from species_models import SpeciesModelsManager
+from tensor_store import open_store
+
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+EMBEDDINGS_DIR = 'embeddings'
+EMBED_CHUNK = 256
+
+
+# =====================================================================
+# Almacén de embeddings
+# =====================================================================
+
+class EmbeddingStore:
+    """Embeddings float16 con hash de contenido, etiqueta y split (un .npz por fuente)"""
+
+    def __init__(self, path: str, load: bool = True):
+        self.path = path
+        self.keys: List[str] = []
+        self.labels: List[str] = []
+        self.splits: List[str] = []
+        self.embeddings = np.empty((0, 0), dtype=np.float16)
+        self.backbone: Optional[str] = None
+        if load and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                self.keys = data['keys'].tolist()
+                self.labels = data['labels'].tolist()
+                self.splits = data['splits'].tolist()
+                self.embeddings = data['embeddings']
+                self.backbone = str(data['backbone'])
+
+    @classmethod
+    def for_species(cls, model_data_path: str, species: str, source: str, load: bool = True) -> 'EmbeddingStore':
+        return cls(os.path.join(model_data_path, EMBEDDINGS_DIR, f"{species}_{source}.npz"), load)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, keys: List[str], embeddings: np.ndarray, labels: List[str], splits: List[str],
+            backbone: str):
+        """Añadir o reemplazar (mismo hash) entradas calculadas con `backbone`"""
+        if self.backbone not in (None, backbone) and len(self):
+            raise ValueError(f"{os.path.basename(self.path)} se calculó con otro backbone: "
+                             f"regenera el almacén o usa uno nuevo")
+        self.backbone = backbone
+        replaced = set(keys)
+        keep = [i for i, key in enumerate(self.keys) if key not in replaced]
+        self.keys = [self.keys[i] for i in keep] + list(keys)
+        self.labels = [self.labels[i] for i in keep] + list(labels)
+        self.splits = [self.splits[i] for i in keep] + list(splits)
+        previous = self.embeddings[keep] if len(keep) else np.empty((0, embeddings.shape[1]), np.float16)
+        self.embeddings = np.concatenate([previous, embeddings.astype(np.float16)])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp.npz'
+        np.savez_compressed(temp_path, keys=np.asarray(self.keys), labels=np.asarray(self.labels),
+                            splits=np.asarray(self.splits), embeddings=self.embeddings,
+                            backbone=np.asarray(self.backbone or ''))
+        os.replace(temp_path, self.path)
+
+    def select(self, class_names: List[str], split: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(embeddings float32, índices de clase) de las entradas con clase conocida"""
+        class_index = {name: i for i, name in enumerate(class_names)}
+        rows = [i for i, (label, row_split) in enumerate(zip(self.labels, self.splits))
+                if label in class_index and (split is None or row_split == split)]
+        targets = np.asarray([class_index[self.labels[i]] for i in rows], dtype=np.int64)
+        return self.embeddings[rows].astype(np.float32), targets
+
+
+# =====================================================================
+# Modelo: backbone congelado + cabeza
+# =====================================================================
+
+def split_model(model):
+    """
+    Extractor (entrada -> GlobalAveragePooling2D) y capas de la cabeza, con la
+    misma estructura que build_model de training_pipeline.py y train_model.py
+    """
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    pool_index = next((i for i, layer in enumerate(model.layers)
+                       if isinstance(layer, layers.GlobalAveragePooling2D)), None)
+    if pool_index is None:
+        raise ValueError("El modelo no tiene GlobalAveragePooling2D: no se puede separar la cabeza")
+    extractor = keras.Model(model.input, model.layers[pool_index].output)
+    return extractor, model.layers[pool_index + 1:]
+
+
+def backbone_fingerprint(extractor) -> str:
+    """Huella de los pesos del extractor: los embeddings solo valen para ese backbone"""
+    digest = hashlib.blake2b(digest_size=16)
+    for weight in extractor.get_weights():
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()
+
+
+def build_head(head_layers, features: int, learning_rate: float):
+    """Modelo sobre embeddings que comparte las capas (y los pesos) de la cabeza original"""
+    from tensorflow import keras
+
+    inputs = keras.Input(shape=(features,))
+    x = inputs
+    for layer in head_layers:
+        x = layer(x)
+    head = keras.Model(inputs, x, name='incremental_head')
+    head.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+                 loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return head
+
+
+def load_species_model(manager: SpeciesModelsManager, species: str):
+    from tensorflow import keras
+
+    model_path = manager.get_model_path(species)
+    if not manager.is_model_trained(species) or not model_path or not os.path.exists(model_path):
+        raise ValueError(f"La especie {species} no tiene modelo entrenado")
+    print(f"📦 Modelo base: {model_path}")
+    return keras.models.load_model(model_path), model_path
+
+
+def embed_files(extractor, files: List[str], batch_size: int = 64) -> np.ndarray:
+    """
+    Embeddings del extractor con el mismo preprocesado que el servicio, por
+    trozos; las imágenes ya presentes en PET_AI_TENSOR_STORE no se decodifican
+    """
+    store = open_store()
+    outputs = []
+    for start in range(0, len(files), EMBED_CHUNK):
+        images = decode_files(files[start:start + EMBED_CHUNK], store=store)
+        outputs.append(extractor.predict(normalize_batch(images), batch_size=batch_size, verbose=0))
+        print(f"   {min(start + EMBED_CHUNK, len(files))}/{len(files)} imágenes")
+    return np.concatenate(outputs).astype(np.float16)
+
+
+def file_hashes(files: List[str]) -> List[str]:
+    hashes = []
+    for path in files:
+        with open(path, 'rb') as f:
+            hashes.append(content_hash(f.read()))
+    return hashes
+
+
+# =====================================================================
+# Comandos
+# =====================================================================
+
+def build_replay(args, manager: SpeciesModelsManager):
+    """Muestra estratificada del dataset original (train y val) para repasar al reentrenar"""
+    class_names = manager.get_species_config(args.species).breeds
+    known = set(class_names)
+    paths, labels, splits = load_manifest(args.data_dir, args.manifest)
+
+    by_class: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    for path, label, sample_split in zip(paths, labels, splits):
+        if label in known:
+            split = 'val' if is_validation_sample(path, sample_split, args.val_split, args.seed) else 'train'
+            by_class[(label, split)].append(path)
+
+    rng = np.random.default_rng(args.seed)
+    val_per_class = max(2, args.per_class // 4)
+    files, file_labels, file_splits = [], [], []
+    for (label, split), class_files in sorted(by_class.items()):
+        count = min(len(class_files), args.per_class if split == 'train' else val_per_class)
+        for index in rng.choice(len(class_files), size=count, replace=False):
+            files.append(class_files[index])
+            file_labels.append(label)
+            file_splits.append(split)
+    if not files:
+        raise ValueError("El dataset no tiene imágenes de las clases del modelo")
+
+    model, _ = load_species_model(manager, args.species)
+    extractor, _ = split_model(model)
+    print(f"🧮 Embeddings de repaso: {len(files)} imágenes")
+    embeddings = embed_files(extractor, files)
+
+    # El repaso se regenera completo (p.ej. tras un reentrenamiento del backbone)
+    store = EmbeddingStore.for_species(args.model_data, args.species, 'replay', load=False)
+    store.add(file_hashes(files), embeddings, file_labels, file_splits, backbone_fingerprint(extractor))
+    store.save()
+    print(f"✅ Muestra de repaso guardada ({len(files)} embeddings)")
+
+
+def add_corrections(args, manager: SpeciesModelsManager):
+    """Calcular y guardar embeddings de las imágenes corregidas (CSV path,label)"""
+    class_names = manager.get_species_config(args.species).breeds
+    known = set(class_names)
+    paths, labels, _ = load_csv_manifest(args.manifest)
+
+    unknown = sorted({label for label in labels if label not in known})
+    if unknown:
+        print(f"⚠️ {len(unknown)} razas no existen en el modelo y se ignoran: {', '.join(unknown[:10])}")
+    pairs = [(path, label) for path, label in zip(paths, labels) if label in known and os.path.exists(path)]
+    if not pairs:
+        raise ValueError("No hay correcciones válidas en el manifiesto")
+    files = [path for path, _ in pairs]
+
+    model, _ = load_species_model(manager, args.species)
+    extractor, _ = split_model(model)
+    print(f"🧮 Embeddings de correcciones: {len(files)} imágenes")
+    embeddings = embed_files(extractor, files)
+
+    store = EmbeddingStore.for_species(args.model_data, args.species, 'corrections')
+    before = len(store)
+    store.add(file_hashes(files), embeddings, [label for _, label in pairs], ['train'] * len(files),
+              backbone_fingerprint(extractor))
+    store.save()
+    print(f"✅ {len(store) - before} correcciones nuevas ({len(store)} en total)")
+
+
+def accuracy(head, embeddings: np.ndarray, targets: np.ndarray) -> Optional[float]:
+    if not len(targets):
+        return None
+    predictions = head.predict(embeddings, batch_size=512, verbose=0)
+    return float((predictions.argmax(axis=1) == targets).mean())
+
+
+def format_accuracy(value: Optional[float]) -> str:
+    """Sin filas de validación en el repaso la accuracy es None"""
+    return 'n/d' if value is None else f"{value:.4f}"
+
+
+def retrain_head(args, manager: SpeciesModelsManager) -> Dict:
+    """Reentrenar la cabeza sobre correcciones + repaso y comparar antes/después"""
+    class_names = manager.get_species_config(args.species).breeds
+    corrections = EmbeddingStore.for_species(args.model_data, args.species, 'corrections')
+    replay = EmbeddingStore.for_species(args.model_data, args.species, 'replay')
+    if not len(corrections):
+        raise ValueError("No hay correcciones: ejecuta antes el comando add")
+    if not len(replay):
+        raise ValueError("No hay muestra de repaso: ejecuta antes el comando replay")
+
+    model, model_path = load_species_model(manager, args.species)
+    extractor, head_layers = split_model(model)
+    fingerprint = backbone_fingerprint(extractor)
+    for store in (corrections, replay):
+        if store.backbone != fingerprint:
+            raise ValueError(f"{os.path.basename(store.path)} no corresponde al backbone del modelo "
+                             f"desplegado: regenéralo")
+
+    correction_x, correction_y = corrections.select(class_names)
+    replay_x, replay_y = replay.select(class_names, 'train')
+    val_x, val_y = replay.select(class_names, 'val')
+
+    head = build_head(head_layers, correction_x.shape[1], args.learning_rate)
+    before = {'replay_val_accuracy': accuracy(head, val_x, val_y),
+              'corrections_accuracy': accuracy(head, correction_x, correction_y)}
+
+    train_x = np.concatenate([replay_x, correction_x])
+    train_y = np.concatenate([replay_y, correction_y])
+    weights = np.concatenate([np.ones(len(replay_y), np.float32),
+                              np.full(len(correction_y), args.correction_weight, np.float32)])
+    print(f"🏋️ Reentrenando la cabeza: {len(correction_y)} correcciones + {len(replay_y)} de repaso, "
+          f"{args.epochs} épocas")
+    start = time.perf_counter()
+    head.fit(train_x, train_y, sample_weight=weights, epochs=args.epochs,
+             batch_size=args.batch_size, shuffle=True, verbose=2)
+    elapsed = time.perf_counter() - start
+
+    after = {'replay_val_accuracy': accuracy(head, val_x, val_y),
+             'corrections_accuracy': accuracy(head, correction_x, correction_y)}
+    print(f"📊 Repaso (val): {format_accuracy(before['replay_val_accuracy'])} -> "
+          f"{format_accuracy(after['replay_val_accuracy'])} | "
+          f"Correcciones: {format_accuracy(before['corrections_accuracy'])} -> "
+          f"{format_accuracy(after['corrections_accuracy'])} ({elapsed:.0f}s)")
+
+    return {
+        'model': model,
+        'class_names': class_names,
+        'summary': {
+            'base_model_file': os.path.basename(model_path),
+            'corrections': int(len(correction_y)),
+            'replay_samples': int(len(replay_y)),
+            'replay_val_samples': int(len(val_y)),
+            'epochs': args.epochs,
+            'correction_weight': args.correction_weight,
+            'training_seconds': round(elapsed, 1),
+            'before': before,
+            'after': after,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+    }
+
+
+def publish_version(model_data_path: str, species: str, model, class_names: List[str], summary: Dict) -> str:
+    """
+    Guardar `{especie}_model_v{N}.keras` y apuntar `{especie}_labels.json` a
+    él; SpeciesModelsManager lo sirve en la siguiente carga de modelos
+    """
+    labels_path = os.path.join(model_data_path, f"{species}_labels.json")
+    metadata = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+    if not isinstance(metadata, dict):
+        metadata = {}
+
+    version = int(metadata.get('model_version', 1)) + 1
+    model_file = f"{species}_model_v{version}.keras"
+    model.save(os.path.join(model_data_path, model_file))
+
+    history = metadata.get('incremental_updates', [])
+    metadata.update({
+        'species': species,
+        'class_names': class_names,
+        'num_classes': len(class_names),
+        'model_architecture': metadata.get('model_architecture', 'MobileNetV2'),
+        'model_file': model_file,
+        'model_version': version,
+        'validation_accuracy': summary['after']['replay_val_accuracy'],
+        'incremental_updates': history + [{'model_version': version, **summary}]
+    })
+    temp_path = labels_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, labels_path)
+    return model_file
+
+
+def request_reload(url: str, admin_token: Optional[str]):
+    """Pedir al servicio que recargue modelos (POST /admin/models/reload)"""
+    request = urllib.request.Request(url.rstrip('/') + '/admin/models/reload', method='POST',
+                                     headers={'X-Admin-Token': admin_token or ''})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        print(f"🔄 Recarga solicitada: {response.status} {response.read().decode('utf-8')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reentrenar la cabeza de razas con correcciones de usuarios')
+    parser.add_argument('command', choices=('replay', 'add', 'train'))
+    parser.add_argument('--species', required=True)
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    parser.add_argument('--data-dir', help='replay: dataset original (carpetas por raza)')
+    parser.add_argument('--manifest', help='replay: manifiesto CSV del dataset; add: CSV path,label de correcciones')
+    parser.add_argument('--per-class', type=int, default=20, help='replay: imágenes de entrenamiento por raza')
+    parser.add_argument('--val-split', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--learning-rate', type=float, default=1e-4)
+    parser.add_argument('--correction-weight', type=float, default=3.0,
+                        help='Peso de cada corrección frente a un ejemplo de repaso')
+    parser.add_argument('--max-regression', type=float, default=0.02,
+                        help='Caída máxima permitida de accuracy en el repaso (val) para publicar')
+    parser.add_argument('--publish', action='store_true', help='Publicar la nueva versión del modelo')
+    parser.add_argument('--reload-url', help='URL del servicio para recargar modelos tras publicar')
+    parser.add_argument('--admin-token', default=os.environ.get('PET_AI_ADMIN_TOKEN'))
+    args = parser.parse_args()
+
+    manager = SpeciesModelsManager(args.model_data)
+    if manager.get_species_config(args.species) is None:
+        raise SystemExit(f"❌ Especie no soportada: {args.species}")
+
+    if args.command == 'replay':
+        if not args.data_dir and not args.manifest:
+            raise SystemExit("❌ replay necesita --data-dir o --manifest")
+        build_replay(args, manager)
+        return
+    if args.command == 'add':
+        if not args.manifest:
+            raise SystemExit("❌ add necesita --manifest con las correcciones")
+        add_corrections(args, manager)
+        return
+
+    outcome = retrain_head(args, manager)
+    summary = outcome['summary']
+    before, after = summary['before']['replay_val_accuracy'], summary['after']['replay_val_accuracy']
+    if before is not None and after is not None and after < before - args.max_regression:
+        print(f"❌ La accuracy de repaso cae {before - after:.4f} (máximo {args.max_regression}): no se publica")
+        sys.exit(1)
+    if not args.publish:
+        return
+
+    model_file = publish_version(args.model_data, args.species, outcome['model'], outcome['class_names'], summary)
+    print(f"🚀 Nueva versión publicada: {model_file}")
+    if args.reload_url:
+        request_reload(args.reload_url, args.admin_token)
+
+
+if __name__ == "__main__":
+    main()
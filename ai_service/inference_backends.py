@@ -0,0 +1,370 @@
+"""
+⚙️ Backends de inferencia para Pet ID AI
+Abstraen cómo se cargan y ejecutan el detector de especies y los modelos de
+razas: Keras/TensorFlow (por defecto), ONNX Runtime en CPU o un backend
+sintético sin modelos para medir y perfilar la capa de servicio.
+
+Con el backend ONNX TensorFlow no se importa en ningún momento del servicio.
+Los modelos ONNX se generan con `export_onnx.py` en `model_data/onnx/`.
+"""
+
+import json
+import os
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bake_models import DETECTOR_FILE, DETECTOR_MANIFEST
+from weight_store import WEIGHT_STORE_DIR
+
+ONNX_DIR = 'onnx'
+SPECIES_DETECTOR_NAME = 'species_detector'
+# Detector con una segunda salida (mapa de características) para localizar mascotas por CAM
+SPECIES_LOCALIZER_NAME = 'species_localizer'
+LOCALIZER_WEIGHTS_FILE = 'species_localizer_weights.npy'
+FEATURE_LAYER = 'out_relu'
+CLASSIFIER_LAYER = 'predictions'
+# Modelos ONNX con los pesos en el almacén compartido de weight_store.py
+WEIGHT_STORE_ENABLED = os.environ.get('PET_AI_WEIGHT_STORE', '0') == '1'
+
+# Backend sintético: coste simulado por llamada (espera) y por imagen (espera y CPU ocupada)
+SYNTHETIC_LATENCY_MS = float(os.environ.get('PET_AI_SYNTHETIC_LATENCY_MS', '0'))
+SYNTHETIC_PER_IMAGE_MS = float(os.environ.get('PET_AI_SYNTHETIC_PER_IMAGE_MS', '0'))
+SYNTHETIC_CPU_MS = float(os.environ.get('PET_AI_SYNTHETIC_CPU_MS', '0'))
+
+
+class ModelRunner:
+    """Modelo cargado: recibe un batch float32 (N, 224, 224, 3) y devuelve probabilidades"""
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class KerasModelRunner(ModelRunner):
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        # model(batch) evita la sobrecarga de model.predict() para batches pequeños
+        return self.model(batch, training=False).numpy()
+
+
+class LocalizerRunner:
+    """
+    Detector con dos salidas: probabilidades ImageNet (N, 1000) y mapa de
+    características (N, 7, 7, 1280); `class_weights` (1280, 1000) son los
+    pesos de la capa de clasificación para calcular mapas de activación
+    """
+    class_weights: np.ndarray
+
+    def predict(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+
+class KerasLocalizerRunner(LocalizerRunner):
+    def __init__(self, model, class_weights: np.ndarray):
+        self.model = model
+        self.class_weights = class_weights
+
+    def predict(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probabilities, features = self.model(batch, training=False)
+        return probabilities.numpy(), features.numpy()
+
+
+def build_keras_localizer(tf, detector):
+    """Modelo de dos salidas sobre las mismas capas del detector (no duplica pesos)"""
+    return tf.keras.Model(detector.input, [detector.output, detector.get_layer(FEATURE_LAYER).output])
+
+
+class KerasBackend:
+    """Backend TensorFlow/Keras (importa TensorFlow al cargar el primer modelo)"""
+    name = 'keras'
+    requires_model_files = True
+
+    def __init__(self, model_data_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 **options):
+        self.model_data_path = model_data_path
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self._tf = None
+
+    def _import_tf(self):
+        """Importar TensorFlow y fijar los hilos antes de que arranque su runtime"""
+        if self._tf is None:
+            import tensorflow as tf
+            if self.intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+            if self.inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+            self._tf = tf
+        return self._tf
+
+    def prepare(self):
+        """Importar el runtime (fase separada para medir el arranque)"""
+        self._import_tf()
+
+    def _baked_detector_path(self, tf) -> Optional[str]:
+        """
+        Ruta del detector pre-serializado por bake_models.py si existe y su
+        versión de TensorFlow coincide con la instalada
+        """
+        manifest_path = os.path.join(self.model_data_path, DETECTOR_MANIFEST)
+        detector_path = os.path.join(self.model_data_path, DETECTOR_FILE)
+        if not (os.path.exists(manifest_path) and os.path.exists(detector_path)):
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('tensorflow_version') != tf.__version__:
+            print(f"⚠️ Detector horneado con TensorFlow {manifest.get('tensorflow_version')}, "
+                  f"instalado {tf.__version__}: ejecuta bake_models.py")
+            return None
+        return detector_path
+
+    def load_species_detector(self) -> ModelRunner:
+        tf = self._import_tf()
+        baked_path = self._baked_detector_path(tf)
+        if baked_path:
+            return KerasModelRunner(tf.keras.models.load_model(baked_path, compile=False))
+
+        print("⚠️ Detector no horneado: construyendo MobileNetV2 desde keras.applications")
+        detector = tf.keras.applications.MobileNetV2(
+            weights='imagenet',
+            include_top=True,
+            input_shape=(224, 224, 3)
+        )
+        return KerasModelRunner(detector)
+
+    def load_species_localizer(self, detector: KerasModelRunner) -> LocalizerRunner:
+        tf = self._import_tf()
+        class_weights = detector.model.get_layer(CLASSIFIER_LAYER).get_weights()[0]
+        return KerasLocalizerRunner(build_keras_localizer(tf, detector.model), class_weights)
+
+    def load_model(self, model_path: str, num_classes: Optional[int] = None) -> ModelRunner:
+        tf = self._import_tf()
+        # compile=False: para inferencia no hace falta restaurar optimizador ni métricas
+        return KerasModelRunner(tf.keras.models.load_model(model_path, compile=False))
+
+
+class OnnxModelRunner(ModelRunner):
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OnnxLocalizerRunner(LocalizerRunner):
+    def __init__(self, session, class_weights: np.ndarray):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.class_weights = class_weights
+
+    def predict(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probabilities, features = self.session.run(None, {self.input_name: batch})
+        return probabilities, features
+
+
+class OnnxBackend:
+    """
+    Backend ONNX Runtime en CPU con optimizaciones de grafo y pool de hilos
+    configurable. Busca `model_data/onnx/<nombre>.onnx` para cada modelo Keras
+    (o `model_data/onnx/weights/<nombre>.onnx` con el almacén de pesos).
+    """
+    name = 'onnx'
+    requires_model_files = True
+
+    def __init__(self, model_data_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 optimization_level: str = 'all', weight_store: bool = WEIGHT_STORE_ENABLED, **options):
+        import onnxruntime as ort
+
+        self.model_data_path = model_data_path
+        self.onnx_dir = os.path.join(model_data_path, ONNX_DIR)
+        self.weight_store_dir = os.path.join(self.onnx_dir, WEIGHT_STORE_DIR) if weight_store else None
+        self._ort = ort
+
+        levels = {
+            'disabled': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        }
+        self.session_options = ort.SessionOptions()
+        self.session_options.graph_optimization_level = levels.get(optimization_level, levels['all'])
+        self.session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 0 = ONNX Runtime decide según los núcleos disponibles
+        self.session_options.intra_op_num_threads = intra_op_threads
+        self.session_options.inter_op_num_threads = inter_op_threads
+        if self.weight_store_dir:
+            # Los pesos se usan directamente desde las páginas mapeadas: sin copias
+            # pre-empaquetadas ni reordenadas (layout NCHWc de 'all') por proceso
+            self.session_options.add_session_config_entry('session.disable_prepacking', '1')
+            if optimization_level == 'all':
+                self.session_options.graph_optimization_level = levels['extended']
+
+    def prepare(self):
+        """onnxruntime ya se importó al crear el backend"""
+
+    def onnx_path(self, name: str) -> str:
+        if self.weight_store_dir:
+            packed_path = os.path.join(self.weight_store_dir, f"{name}.onnx")
+            if os.path.exists(packed_path):
+                return packed_path
+        return os.path.join(self.onnx_dir, f"{name}.onnx")
+
+    def _session(self, name: str) -> OnnxModelRunner:
+        path = self.onnx_path(name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Modelo ONNX no encontrado: {path} (ejecuta export_onnx.py)")
+        session = self._ort.InferenceSession(path, sess_options=self.session_options,
+                                             providers=['CPUExecutionProvider'])
+        return OnnxModelRunner(session)
+
+    def load_species_detector(self) -> ModelRunner:
+        return self._session(SPECIES_DETECTOR_NAME)
+
+    def load_species_localizer(self, detector: ModelRunner) -> LocalizerRunner:
+        session = self._session(SPECIES_LOCALIZER_NAME).session
+        class_weights = np.load(os.path.join(self.onnx_dir, LOCALIZER_WEIGHTS_FILE))
+        return OnnxLocalizerRunner(session, class_weights)
+
+    def load_model(self, model_path: str, num_classes: Optional[int] = None) -> ModelRunner:
+        return self._session(onnx_model_name(model_path))
+
+
+# Clases ImageNet de perros, gatos, aves y conejos (species_models.py): el detector
+# sintético siempre ve un animal para que el resto del pipeline se ejecute entero
+SYNTHETIC_ANIMAL_CLASSES = np.array(list(range(80, 101)) + list(range(127, 147)) + list(range(151, 269)) +
+                                    [281, 282, 283, 284, 285, 330, 331])
+SYNTHETIC_DETECTOR_CLASSES = 1000
+# Clases de un modelo de razas cuando el llamador no las indica (Stanford Dogs)
+SYNTHETIC_DEFAULT_CLASSES = 120
+SYNTHETIC_FEATURE_SHAPE = (7, 7, 1280)
+
+
+def _image_seeds(batch: np.ndarray) -> List[int]:
+    """Semilla por imagen a partir de una muestra de sus píxeles: misma imagen, misma salida"""
+    rows = batch.reshape(len(batch), -1)
+    step = max(rows.shape[1] // 1024, 1)
+    return [zlib.crc32(np.ascontiguousarray(row[::step]).tobytes()) for row in rows]
+
+
+class SyntheticModelRunner(ModelRunner):
+    """
+    Modelo falso: logits deterministas por imagen con una clase dominante
+    (confianza variable, así también se ejercita el TTA) y softmax, con el
+    coste configurado en el backend
+    """
+
+    def __init__(self, backend: 'SyntheticBackend', num_classes: int, salt: int,
+                 favored_classes: Optional[np.ndarray] = None):
+        self.backend = backend
+        self.num_classes = num_classes
+        self.salt = salt
+        self.favored_classes = favored_classes
+
+    def _logits(self, rng: np.random.Generator) -> np.ndarray:
+        logits = rng.standard_normal(self.num_classes, dtype=np.float32)
+        candidates = self.favored_classes if self.favored_classes is not None else self.num_classes
+        # Confianza top-1 entre ~0.25 y ~0.95 sea cual sea el número de clases
+        logits[rng.choice(candidates)] += np.log(self.num_classes) + rng.uniform(-1.0, 3.0)
+        return logits
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        self.backend.simulate_cost(len(batch))
+        logits = np.stack([self._logits(np.random.default_rng((seed, self.salt)))
+                           for seed in _image_seeds(batch)])
+        probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+class SyntheticLocalizerRunner(LocalizerRunner):
+    """Detector sintético + un mapa de características con una mancha por imagen"""
+
+    def __init__(self, detector: SyntheticModelRunner):
+        self.detector = detector
+        self.class_weights = np.abs(np.random.default_rng(detector.salt).standard_normal(
+            (SYNTHETIC_FEATURE_SHAPE[2], SYNTHETIC_DETECTOR_CLASSES), dtype=np.float32))
+
+    def predict(self, batch: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probabilities = self.detector.predict(batch)
+        height, width, channels = SYNTHETIC_FEATURE_SHAPE
+        features = np.empty((len(batch),) + SYNTHETIC_FEATURE_SHAPE, dtype=np.float32)
+        y, x = np.mgrid[:height, :width]
+        for i, seed in enumerate(_image_seeds(batch)):
+            rng = np.random.default_rng((seed, self.detector.salt, 1))
+            cy, cx = rng.uniform(1, height - 2), rng.uniform(1, width - 2)
+            blob = np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / 2.0)
+            features[i] = blob[:, :, np.newaxis] * rng.random(channels, dtype=np.float32)
+        return probabilities, features
+
+
+class SyntheticBackend:
+    """
+    Backend sin modelos ni TensorFlow: salidas con las formas del detector
+    (1000 clases ImageNet) y de los modelos de razas (una por etiqueta) y
+    coste configurable, para hacer pruebas de carga y perfilar Flask/ASGI,
+    preprocesado, batching y cachés en cualquier máquina
+    """
+    name = 'synthetic'
+    requires_model_files = False
+
+    def __init__(self, model_data_path: str, latency_ms: float = SYNTHETIC_LATENCY_MS,
+                 per_image_ms: float = SYNTHETIC_PER_IMAGE_MS, cpu_ms: float = SYNTHETIC_CPU_MS, **options):
+        self.model_data_path = model_data_path
+        self.latency_ms = latency_ms
+        self.per_image_ms = per_image_ms
+        self.cpu_ms = cpu_ms
+        rng = np.random.default_rng(0)
+        self._work = (rng.random((128, 128), dtype=np.float32), rng.random((128, 128), dtype=np.float32))
+
+    def prepare(self):
+        """No hay runtime que importar"""
+
+    def simulate_cost(self, batch_size: int):
+        """
+        Espera (libera el GIL, como el runtime real) y CPU ocupada en
+        multiplicaciones de matrices NumPy durante el tiempo configurado
+        """
+        wait = (self.latency_ms + self.per_image_ms * batch_size) / 1000
+        if wait > 0:
+            time.sleep(wait)
+        if self.cpu_ms > 0:
+            deadline = time.perf_counter() + self.cpu_ms * batch_size / 1000
+            a, b = self._work
+            while time.perf_counter() < deadline:
+                a @ b
+
+    def load_species_detector(self) -> ModelRunner:
+        return SyntheticModelRunner(self, SYNTHETIC_DETECTOR_CLASSES, salt=0,
+                                    favored_classes=SYNTHETIC_ANIMAL_CLASSES)
+
+    def load_species_localizer(self, detector: SyntheticModelRunner) -> LocalizerRunner:
+        return SyntheticLocalizerRunner(detector)
+
+    def load_model(self, model_path: str, num_classes: Optional[int] = None) -> ModelRunner:
+        # Salida distinta por modelo (especie, variante o candidato en sombra)
+        return SyntheticModelRunner(self, num_classes or SYNTHETIC_DEFAULT_CLASSES,
+                                    salt=zlib.crc32(onnx_model_name(model_path).encode()))
+
+
+def onnx_model_name(model_path: str) -> str:
+    """Nombre del modelo ONNX equivalente a un archivo Keras (`best_model.keras` -> `best_model`)"""
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'onnx': OnnxBackend,
+    'synthetic': SyntheticBackend
+}
+
+
+def create_backend(name: str, model_data_path: str, options: Optional[Dict] = None):
+    """Crear el backend de inferencia por nombre ('keras', 'onnx' o 'synthetic')"""
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Backend de inferencia no soportado: {name}")
+    return backend_cls(model_data_path, **(options or {}))
@@ -0,0 +1,459 @@
+"""
+🧠 Servidor de inferencia con memoria compartida
+Un único proceso carga los modelos y atiende a cualquier número de workers
+HTTP a través de un anillo de slots preasignados en `multiprocessing.shared_memory`:
+los tensores nunca se serializan ni se copian por pipes o sockets.
+
+Uso:
+    python inference_server.py --name pet_ai_ring --slots 32
+    PET_AI_INFERENCE_SHM=pet_ai_ring python app_multi_species.py   # workers HTTP
+
+Protocolo por slot (estado int32 en memoria compartida):
+    FREE -> CLAIMED (cliente reserva) -> READY (tensor escrito)
+         -> PROCESSING (servidor) -> DONE (resultado escrito) -> FREE (cliente lo lee)
+La reserva de slots y el abandono por timeout se serializan con un `flock`
+sobre un archivo de bloqueo; el resto son escrituras de un solo int32.
+
+Recuperación ante caídas: el servidor elimina al arrancar el segmento que dejó
+un servidor muerto (latido caducado) y los workers se adjuntan al nuevo; los
+slots CLAIMED de un worker muerto vuelven a FREE pasado `SLOT_CLAIM_TIMEOUT`.
+El latido lo escribe un hilo propio, así un batch largo no parece una caída.
+"""
+
+import argparse
+import fcntl
+import os
+import signal
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from multi_species_predictor import (IMAGE_SIZE, MultiSpeciesPredictor, PetSpecies, decode_image,
+                                     normalize_batch)
+from species_models import SpeciesModelsManager
+from breed_index import BreedIndex
+from fast_json import dumps, loads
+from perf_config import load_perf_config, tuned_setting
+
+MAGIC = 0x50455452  # 'PETR'
+VERSION = 2
+HEADER_FIELDS = 8  # magic, version, slots, pid del servidor, heartbeat (ns), listo, creación (ns)
+RESULT_BYTES = 16384
+VARIANT_BYTES = 32
+INPUT_SHAPE = IMAGE_SIZE + (3,)
+# Latido del servidor y antigüedad a partir de la cual se le da por muerto
+HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_TIMEOUT = 5.0
+# Un worker escribe su tensor en milisegundos: un slot CLAIMED más antiguo es de un worker muerto
+SLOT_CLAIM_TIMEOUT = 10.0
+
+# Estados de un slot
+FREE, CLAIMED, READY, PROCESSING, DONE, ABANDONED = range(6)
+# Operaciones
+OP_PREDICT, OP_SPECIES = 1, 2
+
+
+def _align(offset: int, alignment: int = 64) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class SharedRing:
+    """Vistas NumPy sobre el segmento de memoria compartida del anillo"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int):
+        self.shm = shm
+        self.slots = slots
+        buf = shm.buf
+        offset = 0
+
+        def view(dtype, shape):
+            nonlocal offset
+            offset = _align(offset)
+            array = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.header = view(np.int64, (HEADER_FIELDS,))
+        self.states = view(np.int32, (slots,))
+        self.claimed_at = view(np.int64, (slots,))
+        self.ops = view(np.int32, (slots,))
+        self.result_lengths = view(np.int32, (slots,))
+        self.variants = view(np.uint8, (slots, VARIANT_BYTES))
+        self.results = view(np.uint8, (slots, RESULT_BYTES))
+        self.inputs = view(np.float32, (slots,) + INPUT_SHAPE)
+
+    @staticmethod
+    def required_size(slots: int) -> int:
+        sizes = [8 * HEADER_FIELDS, 4 * slots, 8 * slots, 4 * slots, 4 * slots, VARIANT_BYTES * slots,
+                 RESULT_BYTES * slots, 4 * slots * int(np.prod(INPUT_SHAPE))]
+        return sum(_align(size) for size in sizes) + 64 * len(sizes)
+
+    def heartbeat_age(self) -> float:
+        """Segundos desde el último latido del servidor"""
+        return (time.time_ns() - int(self.header[4])) / 1e9
+
+    @classmethod
+    def create(cls, name: str, slots: int) -> 'SharedRing':
+        size = cls.required_size(slots)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            cls._unlink_stale(name)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ring = cls(shm, slots)
+        ring.header[:] = 0
+        ring.header[0], ring.header[1], ring.header[2] = MAGIC, VERSION, slots
+        ring.header[6] = time.time_ns()
+        ring.states[:] = FREE
+        return ring
+
+    @staticmethod
+    def _unlink_stale(name: str):
+        """Eliminar el segmento que dejó un servidor caído (salvo que otro siga vivo)"""
+        stale = shared_memory.SharedMemory(name=name)
+        try:
+            if stale.size >= 8 * HEADER_FIELDS:
+                header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=stale.buf)
+                heartbeat_age = (time.time_ns() - int(header[4])) / 1e9
+                owner_alive = header[0] == MAGIC and header[5] and heartbeat_age < HEARTBEAT_TIMEOUT
+                owner = int(header[3])
+                del header
+                if owner_alive:
+                    raise RuntimeError(f"El anillo {name} ya lo sirve el proceso {owner}")
+        finally:
+            stale.close()
+        stale.unlink()
+        print(f"🧹 Segmento {name} de un servidor anterior eliminado")
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedRing':
+        shm = shared_memory.SharedMemory(name=name)
+        # Python < 3.13 registra también los segmentos adjuntos en el resource
+        # tracker y los borraría al salir el worker: solo el servidor los elimina
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if header[0] != MAGIC or header[1] != VERSION:
+            raise RuntimeError(f"El segmento {name} no es un anillo de inferencia válido")
+        return cls(shm, int(header[2]))
+
+    def close(self):
+        # Liberar las vistas antes de cerrar el buffer compartido
+        for attr in ('header', 'states', 'claimed_at', 'ops', 'result_lengths', 'variants', 'results', 'inputs'):
+            setattr(self, attr, None)
+        self.shm.close()
+
+
+@contextmanager
+def ring_lock(name: str):
+    """Bloqueo entre procesos (no emparentados) para las transiciones de estado"""
+    path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class InferenceServer:
+    """Proceso dueño de los modelos: consume slots READY en micro-batches"""
+
+    def __init__(self, predictor: MultiSpeciesPredictor, name: str, slots: int = 32,
+                 max_batch: int = 16):
+        self.predictor = predictor
+        self.name = name
+        self.max_batch = max_batch
+        self.ring = SharedRing.create(name, slots)
+        # Buffer de batch preasignado: los slots se copian una sola vez
+        self.batch = np.empty((max_batch,) + INPUT_SHAPE, dtype=np.float32)
+        self.running = True
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='ring-heartbeat',
+                                                  daemon=True)
+
+    def _heartbeat_loop(self):
+        """Latido independiente del bucle de inferencia: un batch largo no marca el servidor como caído"""
+        while self.running:
+            self.ring.header[4] = time.time_ns()
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def _reclaim_claimed_slots(self):
+        """Devolver a FREE los slots CLAIMED de workers que murieron antes de escribir su tensor"""
+        ring = self.ring
+        limit = time.time_ns() - int(SLOT_CLAIM_TIMEOUT * 1e9)
+        if not np.any((ring.states == CLAIMED) & (ring.claimed_at < limit)):
+            return
+        with ring_lock(self.name):
+            stale = np.flatnonzero((ring.states == CLAIMED) & (ring.claimed_at < limit))
+            ring.states[stale] = FREE
+        print(f"🧹 {len(stale)} slots reservados por workers caídos liberados")
+
+    def serve_forever(self):
+        ring = self.ring
+        ring.header[3] = os.getpid()
+        ring.header[4] = time.time_ns()
+        ring.header[5] = 1
+        self._heartbeat_thread.start()
+        idle_sleep = 0.0001
+        next_reclaim = time.monotonic() + SLOT_CLAIM_TIMEOUT
+        print(f"🧠 Servidor de inferencia escuchando en '{self.name}' ({ring.slots} slots)")
+        while self.running:
+            if time.monotonic() > next_reclaim:
+                self._reclaim_claimed_slots()
+                next_reclaim = time.monotonic() + SLOT_CLAIM_TIMEOUT / 2
+            ready = np.flatnonzero(ring.states == READY)[:self.max_batch]
+            if len(ready) == 0:
+                time.sleep(idle_sleep)
+                idle_sleep = min(idle_sleep * 2, 0.002)
+                continue
+            idle_sleep = 0.0001
+            with ring_lock(self.name):
+                # Un cliente pudo abandonar el slot entre la lectura y el bloqueo
+                ready = ready[ring.states[ready] == READY]
+                ring.states[ready] = PROCESSING
+            if len(ready):
+                self._process(ready)
+
+    def _process(self, slots: np.ndarray):
+        ring = self.ring
+        results: Dict[int, Dict] = {}
+        groups: Dict[tuple, List[int]] = {}
+        for slot in slots:
+            groups.setdefault((int(ring.ops[slot]), self._variant(slot)), []).append(int(slot))
+
+        for (op, variant), group in groups.items():
+            batch = self.batch[:len(group)]
+            np.take(ring.inputs, group, axis=0, out=batch)
+            try:
+                if op == OP_SPECIES:
+                    species_predictions = self.predictor.species_detector.predict(batch)
+                    outputs = []
+                    for row in species_predictions:
+                        species, confidence = self.predictor._species_from_predictions(row)
+                        outputs.append({'species': species.value, 'confidence': confidence})
+                else:
+                    outputs = self.predictor.predict_batch(batch, variant)
+            except Exception as e:
+                print(f"❌ Error en inferencia compartida: {e}")
+                outputs = [{'success': False, 'error': 'prediction_failed',
+                            'message': f'Error interno en predicción: {str(e)}'}] * len(group)
+            results.update(zip(group, outputs))
+
+        for slot, output in results.items():
+            encoded = dumps(output)
+            if len(encoded) > RESULT_BYTES:
+                encoded = dumps({'success': False, 'error': 'result_too_large'})
+            ring.results[slot, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            ring.result_lengths[slot] = len(encoded)
+
+        with ring_lock(self.name):
+            for slot in results:
+                # Si el cliente abandonó por timeout, el slot vuelve directamente a FREE
+                ring.states[slot] = FREE if ring.states[slot] == ABANDONED else DONE
+
+    def _variant(self, slot: int) -> Optional[str]:
+        raw = bytes(self.ring.variants[slot]).rstrip(b'\0')
+        return raw.decode('utf-8') if raw else None
+
+    def shutdown(self):
+        self.running = False
+
+    def close(self):
+        self.running = False
+        if self._heartbeat_thread.is_alive():
+            self._heartbeat_thread.join()
+        self.ring.header[5] = 0
+        shm = self.ring.shm
+        self.ring.close()
+        shm.unlink()
+
+
+class SharedMemoryPredictorClient:
+    """
+    Sustituto de MultiSpeciesPredictor para los workers HTTP: preprocesa en el
+    propio worker, normaliza directamente sobre el slot compartido y espera el
+    resultado del servidor. Los metadatos de especies se leen localmente.
+    """
+
+    def __init__(self, name: str, model_data_path: str, timeout: float = 30.0):
+        self.name = name
+        self.timeout = timeout
+        self.ring = SharedRing.attach(name)
+        self.species_manager = SpeciesModelsManager(model_data_path)
+        self.breed_index = BreedIndex({species: config.breeds for species, config
+                                       in self.species_manager.get_all_species().items()})
+        self.backend_name = f"shared_memory:{name}"
+
+    # -----------------------------------------------------------------
+    # Transporte
+    # -----------------------------------------------------------------
+
+    def _current_ring(self) -> SharedRing:
+        """
+        Anillo en uso; si el servidor no late, puede haberse reiniciado con un
+        segmento nuevo del mismo nombre y se cambia a él. El anterior no se
+        cierra: otras peticiones de este worker pueden estar usándolo todavía.
+        """
+        if self.ring.heartbeat_age() >= HEARTBEAT_TIMEOUT:
+            try:
+                ring = SharedRing.attach(self.name)
+            except (FileNotFoundError, RuntimeError):
+                return self.ring
+            if ring.header[6] != self.ring.header[6]:
+                print(f"🔌 Servidor de inferencia reiniciado: conectado al nuevo segmento {self.name}")
+                self.ring = ring
+            else:
+                ring.close()
+        return self.ring
+
+    def _try_claim(self, ring: SharedRing) -> Optional[int]:
+        with ring_lock(self.name):
+            free = np.flatnonzero(ring.states == FREE)
+            if len(free):
+                slot = int(free[0])
+                ring.claimed_at[slot] = time.time_ns()
+                ring.states[slot] = CLAIMED
+                return slot
+        return None
+
+    def _write(self, ring: SharedRing, slot: int, image: np.ndarray, op: int, variant: Optional[str]):
+        """
+        Escribir una imagen (224, 224, 3) en el slot reservado: uint8 se normaliza
+        directamente sobre la memoria compartida, float32 se copia tal cual
+        """
+        if image.dtype == np.uint8:
+            normalize_batch(image, out=ring.inputs[slot])
+        else:
+            np.copyto(ring.inputs[slot], image)
+        encoded_variant = (variant or '').encode('utf-8')[:VARIANT_BYTES]
+        ring.variants[slot, :] = 0
+        ring.variants[slot, :len(encoded_variant)] = np.frombuffer(encoded_variant, dtype=np.uint8)
+        ring.ops[slot] = op
+        ring.states[slot] = READY
+
+    def _wait(self, ring: SharedRing, slot: int, deadline: float) -> Dict:
+        """Esperar (con backoff corto) a que el servidor marque el slot como DONE"""
+        wait = 0.00005
+        while ring.states[slot] != DONE:
+            if time.monotonic() > deadline:
+                with ring_lock(self.name):
+                    state = ring.states[slot]
+                    if state != DONE:
+                        # Si el servidor aún no lo tomó se libera ya; si no, lo libera él
+                        ring.states[slot] = FREE if state == READY else ABANDONED
+                        raise TimeoutError("El servidor de inferencia no respondió a tiempo")
+                break
+            time.sleep(wait)
+            wait = min(wait * 2, 0.001)
+
+        length = int(ring.result_lengths[slot])
+        result = loads(bytes(ring.results[slot, :length]))
+        ring.states[slot] = FREE
+        return result
+
+    def _submit(self, images: np.ndarray, op: int, variant: Optional[str]) -> List[Dict]:
+        """
+        Enviar un batch (cada imagen a su slot) y recoger los resultados. Si no
+        quedan slots libres se recoge primero el resultado pendiente más antiguo,
+        así un batch mayor que el anillo nunca se bloquea a sí mismo.
+        """
+        ring = self._current_ring()
+        deadline = time.monotonic() + self.timeout
+        results: List[Optional[Dict]] = [None] * len(images)
+        pending = []  # (índice, slot)
+        for index, image in enumerate(images):
+            slot = self._try_claim(ring)
+            while slot is None:
+                if pending:
+                    done_index, done_slot = pending.pop(0)
+                    results[done_index] = self._wait(ring, done_slot, deadline)
+                elif time.monotonic() > deadline:
+                    raise TimeoutError("No hay slots libres en el servidor de inferencia")
+                else:
+                    time.sleep(0.001)
+                slot = self._try_claim(ring)
+            self._write(ring, slot, image, op, variant)
+            pending.append((index, slot))
+        for index, slot in pending:
+            results[index] = self._wait(ring, slot, deadline)
+        return results
+
+    # -----------------------------------------------------------------
+    # Interfaz compatible con MultiSpeciesPredictor
+    # -----------------------------------------------------------------
+
+    def _preprocess_image(self, image_bytes: bytes) -> np.ndarray:
+        # Se devuelve uint8: la normalización se hace al escribir en el slot
+        return decode_image(image_bytes)[np.newaxis]
+
+    def predict(self, image_bytes: bytes, model_variant: Optional[str] = None) -> Dict:
+        try:
+            return self._submit(self._preprocess_image(image_bytes), OP_PREDICT, model_variant)[0]
+        except Exception as e:
+            print(f"❌ Error en predicción completa: {e}")
+            return {
+                'success': False,
+                'error': 'prediction_failed',
+                'message': f'Error interno en predicción: {str(e)}'
+            }
+
+    def predict_batch(self, image_array: np.ndarray, model_variant: Optional[str] = None) -> List[Dict]:
+        return self._submit(image_array, OP_PREDICT, model_variant)
+
+    def detect_species(self, image_array: np.ndarray):
+        result = self._submit(image_array[:1], OP_SPECIES, None)[0]
+        return PetSpecies(result['species']), result['confidence']
+
+    def is_ready(self) -> bool:
+        ring = self._current_ring()
+        return bool(ring.header[5]) and ring.heartbeat_age() < HEARTBEAT_TIMEOUT
+
+    def get_supported_species(self) -> Dict[str, Dict]:
+        return self.species_manager.get_species_summary()
+
+    def get_species_breeds(self, species: str) -> List[str]:
+        config = self.species_manager.get_species_config(species)
+        return config.breeds if config else []
+
+    def search_breeds(self, query: str, species: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        return self.breed_index.search(query, species, limit)
+
+    def is_species_trained(self, species: str) -> bool:
+        return self.species_manager.is_model_trained(species)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de inferencia con memoria compartida')
+    parser.add_argument('--name', default=os.environ.get('PET_AI_INFERENCE_SHM', 'pet_ai_ring'))
+    parser.add_argument('--slots', type=int, default=32)
+    parser.add_argument('--max-batch', type=int, help='Por defecto, batch_size de perf_config.json (16)')
+    parser.add_argument('--backend', default=os.environ.get('PET_AI_BACKEND', 'keras'))
+    parser.add_argument('--model-data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             'model_data'))
+    args = parser.parse_args()
+
+    settings = load_perf_config(args.model_data, args.backend)
+    backend_options = {
+        'intra_op_threads': tuned_setting(settings, 'PET_AI_INTRA_OP_THREADS', 'intra_op_threads'),
+        'inter_op_threads': tuned_setting(settings, 'PET_AI_INTER_OP_THREADS', 'inter_op_threads')
+    }
+    max_batch = args.max_batch or tuned_setting(settings, 'PET_AI_MAX_BATCH', 'batch_size')
+
+    predictor = MultiSpeciesPredictor(args.model_data, backend=args.backend, backend_options=backend_options)
+    server = InferenceServer(predictor, args.name, args.slots, max_batch)
+    signal.signal(signal.SIGTERM, lambda *_: server.shutdown())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print("🛑 Servidor de inferencia detenido")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,136 @@
 Arquitectura expandida que soporta perros, gatos, aves y conejos
 """
 
-import tensorflow as tf
 import numpy as np
 import json
 import os
 from PIL import Image
 import io
+import threading
 from enum import Enum
+from functools import lru_cache
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional, Any
 from species_models import SpeciesModelsManager, initialize_species_labels
+from breed_index import BreedIndex
+from inference_backends import create_backend
+from startup import StartupTimer
+from upload_validation import check_dimensions
+from region_proposals import class_activation_map, propose_regions, to_pixels
+
+IMAGE_SIZE = (224, 224)
+
+# TTA adaptativo en predict_breed (umbrales por especie en species_models.py)
+TTA_ENABLED = os.environ.get('PET_AI_TTA', '1') == '1'
+# Lado del recorte (fracción de la imagen) de las vistas central y de esquina
+TTA_CROP = float(os.environ.get('PET_AI_TTA_CROP', '0.875'))
+TTA_VIEWS = 6  # espejo + recorte central + 4 esquinas
+
+# /predict/regions: los recortes salen de la imagen a esta resolución (no de la de 224)
+REGION_SOURCE_SIZE = 896
+
+
+def normalize_batch(images: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Normalizar un batch uint8 (N, 224, 224, 3) al rango [-1, 1] de MobileNetV2
+    en una sola pasada, escribiendo en `out` si se proporciona
+    """
+    out = np.multiply(images, np.float32(1 / 127.5), out=out, dtype=np.float32)
+    out -= 1.0
+    return out
+
+
+def top_k(probabilities: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k de cada fila de un batch (N, C) con selección parcial: O(C) por fila
+    más ordenar solo k. Retorna (índices, probabilidades), ambos (N, k) descendentes
+    """
+    k = min(k, probabilities.shape[1])
+    if k < probabilities.shape[1]:
+        indices = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    else:
+        indices = np.broadcast_to(np.arange(k), probabilities.shape).copy()
+    values = np.take_along_axis(probabilities, indices, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+@lru_cache(maxsize=4)
+def _resize_weights(source: int, target: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Índices y pesos de interpolación bilineal de un eje (centros de píxel alineados)"""
+    position = np.clip((np.arange(target) + 0.5) * source / target - 0.5, 0, source - 1)
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, source - 1)
+    return low, high, (position - low).astype(np.float32)
+
+
+def _resize_batch(images: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Redimensionado bilineal de un batch float32 (N, H, W, 3) sin salir de NumPy"""
+    low, high, weight = _resize_weights(images.shape[1], size[0])
+    weight = weight[:, np.newaxis, np.newaxis]
+    images = images[:, low] * (1 - weight) + images[:, high] * weight
+    low, high, weight = _resize_weights(images.shape[2], size[1])
+    weight = weight[:, np.newaxis]
+    return images[:, :, low] * (1 - weight) + images[:, :, high] * weight
+
+
+def tta_views(images: np.ndarray, crop: float = TTA_CROP) -> np.ndarray:
+    """
+    Vistas aumentadas de un batch ya normalizado (N, 224, 224, 3): espejo
+    horizontal, recorte central y los cuatro recortes de esquina reescalados.
+    Resultado (N * TTA_VIEWS, 224, 224, 3) agrupado por imagen
+    """
+    height, width = images.shape[1:3]
+    side_h, side_w = int(height * crop), int(width * crop)
+    offsets = [((height - side_h) // 2, (width - side_w) // 2),
+               (0, 0), (0, width - side_w), (height - side_h, 0), (height - side_h, width - side_w)]
+    views = np.empty((len(images), TTA_VIEWS, *images.shape[1:]), dtype=np.float32)
+    views[:, 0] = images[:, :, ::-1]
+    for i, (top, left) in enumerate(offsets, start=1):
+        views[:, i] = _resize_batch(images[:, top:top + side_h, left:left + side_w], (height, width))
+    return views.reshape(-1, *images.shape[1:])
+
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    """
+    Decodificar una imagen a uint8 RGB 224x224
+    """
+    # Cargar imagen (solo cabecera) y rechazar bombas de píxeles antes de decodificar
+    image = Image.open(io.BytesIO(image_bytes))
+    check_dimensions(*image.size)
+    
+    # JPEG: decodificar a escala reducida (1/2, 1/4, 1/8) si sigue sobrando
+    # resolución para el resize final; ahorra memoria y CPU en fotos grandes
+    image.draft('RGB', (IMAGE_SIZE[0] * 2, IMAGE_SIZE[1] * 2))
+    return image_to_array(image)
+
+
+def load_region_image(image_bytes: bytes) -> Tuple[Image.Image, np.ndarray]:
+    """
+    Imagen para /predict/regions: RGB reducida solo hasta REGION_SOURCE_SIZE
+    (de ahí salen los recortes de cada mascota) y su versión uint8 224x224
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    check_dimensions(*image.size)
+    image.draft('RGB', (REGION_SOURCE_SIZE, REGION_SOURCE_SIZE))
+    image = image.convert('RGB')
+    return image, image_to_array(image)
+
+
+def image_to_array(image: Image.Image) -> np.ndarray:
+    """
+    Imagen PIL (o fotograma de un GIF/WebP/vídeo) a uint8 RGB 224x224
+    """
+    # Convertir a RGB si es necesario
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Redimensionar a 224x224 (MobileNetV2)
+    image = image.resize(IMAGE_SIZE, Image.Resampling.LANCZOS)
+    
+    # Convertir a array numpy
+    return np.asarray(image, dtype=np.uint8)
+
 
 class PetSpecies(Enum):
     """Especies de mascotas soportadas"""
@@ -37,16 +157,34 @@ class MultiSpeciesPredictor:
     Predictor avanzado que maneja múltiples especies de mascotas
     """
     
-    def __init__(self, model_data_path: str):
+    def __init__(self, model_data_path: str, backend: str = 'keras',
+                 backend_options: Optional[Dict[str, Any]] = None,
+                 timer: Optional[StartupTimer] = None):
         self.model_data_path = model_data_path
+        self.timer = timer or StartupTimer()
+        # Backend de inferencia: 'keras' (TensorFlow), 'onnx' (ONNX Runtime) o 'synthetic'
+        self.backend = create_backend(backend, model_data_path, backend_options)
         self.species_detector = None
+        # Detector con mapa de características para /predict/regions (se carga al primer uso)
+        self.species_localizer = None
+        self._localizer_lock = threading.Lock()
         self.breed_models = {}
+        self.breed_model_variants = {}  # especie -> {variante: modelo}
         self.class_labels = {}
         
         # Inicializar gestor de modelos por especie
-        self.species_manager = initialize_species_labels(model_data_path)
+        with self.timer.phase('configuración de especies'):
+            self.species_manager = initialize_species_labels(model_data_path)
+        with self.timer.phase('índice de razas'):
+            self.build_breed_index()
         
         self._initialize_models()
+        self._build_result_tables()
+    
+    def build_breed_index(self):
+        """(Re)construir el índice de búsqueda con las etiquetas actuales de cada especie"""
+        self.breed_index = BreedIndex({species_name: config.breeds for species_name, config
+                                       in self.species_manager.get_all_species().items()})
     
     def _initialize_models(self):
         """Inicializar todos los modelos necesarios"""
@@ -54,18 +192,18 @@ class MultiSpeciesPredictor:
         
         # 1. Cargar detector de especies (MobileNetV2 pre-entrenado)
         try:
-            self.species_detector = tf.keras.applications.MobileNetV2(
-                weights='imagenet',
-                include_top=True,
-                input_shape=(224, 224, 3)
-            )
-            print("✅ Detector de especies cargado (MobileNetV2)")
+            with self.timer.phase(f'import runtime ({self.backend.name})'):
+                self.backend.prepare()
+            with self.timer.phase('detector de especies'):
+                self.species_detector = self.backend.load_species_detector()
+            print(f"✅ Detector de especies cargado (MobileNetV2, backend {self.backend.name})")
         except Exception as e:
             print(f"❌ Error cargando detector de especies: {e}")
             return
         
         # 2. Cargar modelos específicos por especie
-        self._load_species_models()
+        with self.timer.phase('modelos de razas'):
+            self._load_species_models()
         
         print(f"🎯 Sistema listo: {len(self.breed_models)} especies con modelos entrenados")
         print(f"📊 Total especies soportadas: {len(self.species_manager.get_all_species())}")
@@ -83,103 +221,195 @@ class MultiSpeciesPredictor:
                 # Cargar modelo si está entrenado
                 if config.status == 'trained' and config.model_file:
                     model_path = self.species_manager.get_model_path(species_name)
-                    if model_path and os.path.exists(model_path):
-                        self.breed_models[species_enum] = tf.keras.models.load_model(model_path)
+                    if model_path and (os.path.exists(model_path) or not self.backend.requires_model_files):
+                        self.breed_models[species_enum] = self.backend.load_model(model_path, len(config.breeds))
                         print(f"✅ Modelo {species_name} cargado: {len(config.breeds)} razas")
                     else:
                         print(f"⚠️ Modelo {species_name} no encontrado en: {model_path}")
+                    
+                    # Modelos alternativos (p.ej. estudiante destilado compacto)
+                    for variant in config.variants:
+                        variant_path = self.species_manager.get_variant_model_path(species_name, variant)
+                        self.breed_model_variants.setdefault(species_enum, {})[variant] = \
+                            self.backend.load_model(variant_path, len(config.breeds))
+                        print(f"✅ Variante {species_name}/{variant} cargada")
                 else:
                     print(f"📝 Especies {species_name}: {len(config.breeds)} razas (placeholder)")
                     
             except Exception as e:
                 print(f"❌ Error cargando modelo {species_name}: {e}")
     
+    def _build_result_tables(self):
+        """
+        Tablas del post-procesado, calculadas una vez por carga de modelos (la
+        recarga crea otro predictor): clases ImageNet de cada especie como
+        conjuntos, etiquetas como arrays y fragmentos estáticos de la respuesta
+        """
+        self._species_rules = []
+        self._static_info = {}
+        species_supported = [s.value for s in self.class_labels.keys()]
+        for species_name, config in self.species_manager.get_all_species().items():
+            try:
+                species_enum = PetSpecies(species_name)
+            except ValueError:
+                # Especie no válida en enum
+                continue
+            self._species_rules.append((species_enum, species_name, frozenset(config.imagenet_classes),
+                                        config.confidence_threshold))
+            self._static_info[species_enum] = (
+                species_name,
+                {
+                    'species_detector': 'MobileNetV2 + ImageNet',
+                    'inference_backend': self.backend.name,
+                    'total_breeds': len(self.class_labels.get(species_enum, [])),
+                    'species_supported': species_supported,
+                    'model_version': '2.0.0',
+                    'species_description': config.description
+                },
+                {
+                    'species_name': species_name.title(),
+                    'prediction_method': 'multi_species_cascade',
+                    'confidence_threshold': config.confidence_threshold
+                }
+            )
+        self._label_arrays = {species: np.array(labels, dtype=object)
+                              for species, labels in self.class_labels.items()}
+        self._animal_classes = np.array(sorted({c for _, _, classes, _ in self._species_rules for c in classes}),
+                                        dtype=np.intp)
+    
+    def _labels_for(self, species: PetSpecies, num_classes: int) -> np.ndarray:
+        """Etiquetas de la especie indexables con un array de clases"""
+        labels = self._label_arrays[species]
+        if len(labels) < num_classes:
+            # Modelo con más salidas que etiquetas
+            extra = np.array([f"Unknown_{i}" for i in range(len(labels), num_classes)], dtype=object)
+            labels = self._label_arrays[species] = np.concatenate([labels, extra])
+        return labels
+    
+    def _species_from_predictions(self, predictions: np.ndarray) -> Tuple[PetSpecies, float]:
+        """
+        Decidir la especie a partir de las probabilidades ImageNet de una imagen
+        """
+        classes, confidences = top_k(predictions[np.newaxis], 15)
+        return self._species_from_top(classes[0].tolist(), confidences[0].tolist())
+    
+    def _species_from_top(self, classes: List[int], confidences: List[float]) -> Tuple[PetSpecies, float]:
+        """Especie a partir del top 15 ImageNet (clases y confianzas en orden descendente)"""
+        # Verificar cada especie según sus clases ImageNet configuradas
+        for species_enum, species_name, imagenet_classes, confidence_threshold in self._species_rules:
+            for class_idx, confidence in zip(classes, confidences):
+                if class_idx in imagenet_classes and confidence > confidence_threshold:
+                    print(f"🎯 Especie detectada: {species_name} (confianza: {confidence:.3f})")
+                    return species_enum, confidence
+        
+        print("❓ No se pudo detectar la especie del animal")
+        return PetSpecies.UNKNOWN, 0.0
+    
     def detect_species(self, image_array: np.ndarray) -> Tuple[PetSpecies, float]:
         """
         Detectar la especie del animal en la imagen usando ImageNet classes
         """
         try:
             # Realizar predicción con MobileNetV2
-            predictions = self.species_detector.predict(image_array, verbose=0)
-            predicted_classes = np.argsort(predictions[0])[::-1]
-            
-            # Verificar cada especie según sus clases ImageNet configuradas
-            for species_name, config in self.species_manager.get_all_species().items():
-                try:
-                    species_enum = PetSpecies(species_name)
-                    imagenet_classes = config.imagenet_classes
-                    confidence_threshold = config.confidence_threshold
-                    
-                    for class_idx in predicted_classes[:15]:  # Top 15 predicciones
-                        if class_idx in imagenet_classes:
-                            confidence = float(predictions[0][class_idx])
-                            if confidence > confidence_threshold:
-                                print(f"🎯 Especie detectada: {species_name} (confianza: {confidence:.3f})")
-                                return species_enum, confidence
-                                
-                except ValueError:
-                    # Especie no válida en enum
-                    continue
-            
-            print("❓ No se pudo detectar la especie del animal")
-            return PetSpecies.UNKNOWN, 0.0
+            predictions = self.species_detector.predict(image_array)
+            return self._species_from_predictions(predictions[0])
             
         except Exception as e:
             print(f"❌ Error en detección de especies: {e}")
             return PetSpecies.UNKNOWN, 0.0
     
-    def predict_breed(self, species: PetSpecies, image_array: np.ndarray) -> Dict:
+    def _select_breed_model(self, species: PetSpecies, variant: Optional[str]):
+        """Modelo de razas a usar: la variante pedida si existe, si no el principal"""
+        if variant and variant != 'default':
+            variant_model = self.breed_model_variants.get(species, {}).get(variant)
+            if variant_model is not None:
+                return variant_model, variant
+        return self.breed_models[species], 'default'
+    
+    def predict_breed(self, species: PetSpecies, image_array: np.ndarray,
+                      variant: Optional[str] = None) -> Dict:
         """
         Predecir la raza específica para una especie detectada
+        `variant` permite usar un modelo alternativo (p.ej. 'compact')
+        """
+        return self.predict_breed_batch(species, image_array, variant)[0]
+    
+    def predict_breed_batch(self, species: PetSpecies, image_array: np.ndarray,
+                            variant: Optional[str] = None) -> List[Dict]:
+        """
+        Predecir la raza de un batch de imágenes de la misma especie en una
+        sola pasada del modelo
         """
+        batch_size = len(image_array)
         try:
             if species not in self.class_labels:
-                return {
+                return [{
                     'breed': 'Unknown',
                     'confidence': 0.0,
                     'top_5': [],
                     'status': 'species_not_supported'
-                }
+                } for _ in range(batch_size)]
             
             labels = self.class_labels[species]
             
             # Si tenemos modelo entrenado
             if species in self.breed_models:
-                model = self.breed_models[species]
-                predictions = model.predict(image_array, verbose=0)
+                model, used_variant = self._select_breed_model(species, variant)
+                predictions = np.asarray(model.predict(image_array))
+                tta_rows = self._tta_rows(species, predictions) if TTA_ENABLED else []
+                if tta_rows:
+                    # Todas las vistas de las imágenes dudosas en una sola pasada
+                    augmented = np.asarray(model.predict(tta_views(image_array[tta_rows])))
+                    augmented = augmented.reshape(len(tta_rows), TTA_VIEWS, -1)
+                    predictions = predictions.copy()
+                    predictions[tta_rows] = (predictions[tta_rows] + augmented.sum(axis=1)) / (TTA_VIEWS + 1)
                 
-                # Obtener top 5 predicciones
-                top_5_indices = np.argsort(predictions[0])[::-1][:5]
-                top_5_predictions = []
+                # Top 5 de todo el batch con selección parcial; a Python de una vez
+                top_indices, top_confidences = top_k(predictions, 5)
+                breeds = self._labels_for(species, predictions.shape[1])[top_indices].tolist()
+                confidences = top_confidences.tolist()
+                tta_rows = set(tta_rows)
                 
-                for i, idx in enumerate(top_5_indices):
-                    breed = labels[idx] if idx < len(labels) else f"Unknown_{idx}"
-                    confidence = float(predictions[0][idx])
-                    top_5_predictions.append({
-                        'breed': breed,
-                        'confidence': confidence,
-                        'rank': i + 1
+                results = []
+                for row_index, (row_breeds, row_confidences) in enumerate(zip(breeds, confidences)):
+                    top_5_predictions = [{'breed': breed, 'confidence': confidence, 'rank': rank}
+                                         for rank, (breed, confidence)
+                                         in enumerate(zip(row_breeds, row_confidences), start=1)]
+                    results.append({
+                        'breed': top_5_predictions[0]['breed'],
+                        'confidence': top_5_predictions[0]['confidence'],
+                        'top_5': top_5_predictions,
+                        'status': 'trained_model',
+                        'variant': used_variant,
+                        'tta_applied': row_index in tta_rows
                     })
-                
-                return {
-                    'breed': top_5_predictions[0]['breed'],
-                    'confidence': top_5_predictions[0]['confidence'],
-                    'top_5': top_5_predictions,
-                    'status': 'trained_model'
-                }
+                return results
             
             else:
                 # Modelo placeholder - predicción simulada inteligente
-                return self._generate_placeholder_prediction(species, labels)
+                return [self._generate_placeholder_prediction(species, labels) for _ in range(batch_size)]
                 
         except Exception as e:
             print(f"❌ Error en predicción de raza: {e}")
-            return {
+            return [{
                 'breed': 'Error',
                 'confidence': 0.0,
                 'top_5': [],
                 'status': 'error'
-            }
+            } for _ in range(batch_size)]
+    
+    def _tta_rows(self, species: PetSpecies, predictions: np.ndarray) -> List[int]:
+        """
+        Filas dudosas del batch: confianza top-1 o margen top-1/top-2 por
+        debajo de los umbrales de la especie
+        """
+        config = self.species_manager.get_species_config(species.value)
+        if config is None or predictions.shape[1] < 2:
+            return []
+        top_2 = np.partition(predictions, -2, axis=1)[:, -2:]
+        doubtful = ((top_2[:, 1] < config.tta_min_confidence)
+                    | (top_2[:, 1] - top_2[:, 0] < config.tta_min_margin))
+        return np.flatnonzero(doubtful).tolist()
     
     def _generate_placeholder_prediction(self, species: PetSpecies, labels: List[str]) -> Dict:
         """
@@ -220,53 +450,14 @@ class MultiSpeciesPredictor:
             'status': 'placeholder_model'
         }
     
-    def predict(self, image_bytes: bytes) -> Dict:
+    def predict(self, image_bytes: bytes, model_variant: Optional[str] = None) -> Dict:
         """
         Predicción completa: especie + raza
         """
         try:
             # Preprocesar imagen
             image_array = self._preprocess_image(image_bytes)
-            
-            # 1. Detectar especie
-            species, species_confidence = self.detect_species(image_array)
-            
-            if species == PetSpecies.UNKNOWN:
-                return {
-                    'success': False,
-                    'error': 'species_not_detected',
-                    'message': 'No se pudo identificar la especie del animal. Asegúrate de que la imagen contenga un perro, gato, ave o conejo claramente visible.'
-                }
-            
-            # 2. Predecir raza
-            breed_result = self.predict_breed(species, image_array)
-            
-            # 3. Obtener información del modelo para esta especie
-            species_config = self.species_manager.get_species_config(species.value)
-            
-            # 4. Formatear respuesta
-            return {
-                'success': True,
-                'species': species.value,
-                'species_confidence': species_confidence,
-                'breed': breed_result['breed'],
-                'breed_confidence': breed_result['confidence'],
-                'top_5_predictions': breed_result['top_5'],
-                'model_info': {
-                    'species_detector': 'MobileNetV2 + ImageNet',
-                    'breed_model_status': breed_result['status'],
-                    'total_breeds': len(self.class_labels.get(species, [])),
-                    'species_supported': [s.value for s in self.class_labels.keys()],
-                    'model_version': '2.0.0',
-                    'species_description': species_config.description if species_config else 'N/A'
-                },
-                'additional_info': {
-                    'species_name': species.value.title(),
-                    'prediction_method': 'multi_species_cascade',
-                    'confidence_threshold': species_config.confidence_threshold if species_config else 0.15,
-                    'training_status': breed_result['status']
-                }
-            }
+            return self.predict_batch(image_array, model_variant)[0]
             
         except Exception as e:
             print(f"❌ Error en predicción completa: {e}")
@@ -276,37 +467,118 @@ class MultiSpeciesPredictor:
                 'message': f'Error interno en predicción: {str(e)}'
             }
     
+    def predict_batch(self, image_array: np.ndarray, model_variant: Optional[str] = None) -> List[Dict]:
+        """
+        Predicción especie + raza para un batch ya preprocesado (N, 224, 224, 3):
+        una pasada del detector para todo el batch y una por especie detectada
+        """
+        # 1. Detectar especie de todas las imágenes
+        species_predictions = self.species_detector.predict(image_array)
+        classes, confidences = top_k(np.asarray(species_predictions), 15)
+        detections = [self._species_from_top(row_classes, row_confidences)
+                      for row_classes, row_confidences in zip(classes.tolist(), confidences.tolist())]
+        
+        # 2. Predecir raza agrupando las imágenes por especie
+        breed_results: List[Optional[Dict]] = [None] * len(detections)
+        for species in {s for s, _ in detections if s != PetSpecies.UNKNOWN}:
+            indices = [i for i, (s, _) in enumerate(detections) if s == species]
+            batch = image_array if len(indices) == len(detections) else image_array[indices]
+            for i, breed_result in zip(indices, self.predict_breed_batch(species, batch, model_variant)):
+                breed_results[i] = breed_result
+        
+        return [self._format_result(species, species_confidence, breed_result)
+                for (species, species_confidence), breed_result in zip(detections, breed_results)]
+    
+    def _get_localizer(self):
+        with self._localizer_lock:
+            if self.species_localizer is None:
+                self.species_localizer = self.backend.load_species_localizer(self.species_detector)
+                print(f"✅ Localizador de mascotas cargado (CAM, backend {self.backend.name})")
+        return self.species_localizer
+    
+    def predict_regions(self, image: Image.Image, image_array: np.ndarray,
+                        model_variant: Optional[str] = None) -> List[Dict]:
+        """
+        Varias mascotas en una imagen: una pasada del detector con su mapa de
+        características propone regiones por CAM y todos los recortes se
+        clasifican juntos (un batch para el detector y uno por especie para
+        las razas). Con una sola región se reutiliza la pasada de la imagen
+        completa. Cada resultado incluye `box` (x0, y0, x1, y1 relativos) y
+        `region_score`
+        """
+        batch = normalize_batch(image_array[np.newaxis])
+        localizer = self._get_localizer()
+        probabilities, features = localizer.predict(batch)
+        cam = class_activation_map(features[0], localizer.class_weights, probabilities[0], self._animal_classes)
+        regions = propose_regions(cam)
+        
+        if len(regions) > 1:
+            crops = np.stack([image_to_array(image.crop(to_pixels(box, image.size))) for box, _ in regions])
+            results = self.predict_batch(normalize_batch(crops), model_variant)
+        else:
+            # Una mascota (o ninguna zona activa): la imagen completa ya pasó por el detector
+            species, species_confidence = self._species_from_predictions(probabilities[0])
+            breed_result = None
+            if species != PetSpecies.UNKNOWN:
+                breed_result = self.predict_breed_batch(species, batch, model_variant)[0]
+            results = [self._format_result(species, species_confidence, breed_result)]
+            regions = regions or [((0.0, 0.0, 1.0, 1.0), 0.0)]
+        
+        for result, (box, score) in zip(results, regions):
+            result['box'] = [round(value, 4) for value in box]
+            result['region_score'] = round(score, 4)
+        return results
+    
+    def _format_result(self, species: PetSpecies, species_confidence: float,
+                       breed_result: Optional[Dict]) -> Dict:
+        """Formatear la respuesta de una imagen"""
+        if species == PetSpecies.UNKNOWN:
+            return {
+                'success': False,
+                'error': 'species_not_detected',
+                'message': 'No se pudo identificar la especie del animal. Asegúrate de que la imagen contenga un perro, gato, ave o conejo claramente visible.'
+            }
+        
+        # Información del modelo: fragmentos estáticos + lo propio de esta predicción
+        species_name, model_info, additional_info = self._static_info[species]
+        
+        return {
+            'success': True,
+            'species': species_name,
+            'species_confidence': species_confidence,
+            'breed': breed_result['breed'],
+            'breed_confidence': breed_result['confidence'],
+            'top_5_predictions': breed_result['top_5'],
+            'model_info': {
+                **model_info,
+                'breed_model_status': breed_result['status'],
+                'breed_model_variant': breed_result.get('variant', 'default'),
+                'tta_applied': breed_result.get('tta_applied', False)
+            },
+            'additional_info': {
+                **additional_info,
+                'training_status': breed_result['status']
+            }
+        }
+    
     def _preprocess_image(self, image_bytes: bytes) -> np.ndarray:
         """
         Preprocesar imagen para los modelos
         """
         try:
-            # Cargar imagen
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Convertir a RGB si es necesario
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Redimensionar a 224x224 (MobileNetV2)
-            image = image.resize((224, 224), Image.Resampling.LANCZOS)
+            image_array = decode_image(image_bytes)
             
-            # Convertir a array numpy
-            image_array = np.array(image)
-            
-            # Normalizar para MobileNetV2 (0-1 y luego -1 a 1)
-            image_array = image_array.astype(np.float32) / 255.0
-            image_array = (image_array - 0.5) * 2.0
-            
-            # Añadir dimensión de batch
-            image_array = np.expand_dims(image_array, axis=0)
-            
-            return image_array
+            # Normalizar para MobileNetV2 y añadir dimensión de batch
+            return normalize_batch(image_array[np.newaxis])
             
         except Exception as e:
             print(f"❌ Error en preprocesamiento: {e}")
             raise
     
+    def is_ready(self) -> bool:
+        """El detector de especies está cargado y se puede predecir"""
+        return self.species_detector is not None
+    
     def get_supported_species(self) -> Dict[str, Dict]:
         """
         Obtener información detallada sobre especies soportadas
@@ -323,6 +595,12 @@ class MultiSpeciesPredictor:
         except ValueError:
             return []
     
+    def search_breeds(self, query: str, species: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        """
+        Buscar razas por prefijo o de forma aproximada (ver breed_index.py)
+        """
+        return self.breed_index.search(query, species, limit)
+    
     def is_species_trained(self, species: str) -> bool:
         """
         Verificar si una especie tiene modelo entrenado
@@ -0,0 +1,99 @@
+"""
+🎛️ Configuración de rendimiento por máquina
+`autotune.py` escribe `model_data/perf_config.json` con los hilos, batch,
+concurrencia y workers que maximizan el throughput en esta máquina; el
+servicio la carga al arrancar. Las variables de entorno siguen teniendo
+prioridad sobre el archivo.
+
+La configuración solo se aplica si se generó en una CPU equivalente (mismo
+modelo y número de núcleos): en flotas con SKUs mezclados cada nodo necesita
+su propio ajuste.
+"""
+
+import json
+import os
+import platform
+import time
+from typing import Dict, Optional
+
+PERF_CONFIG_FILE = 'perf_config.json'
+
+# Parámetros ajustables y su valor por defecto (0 = que decida el runtime)
+TUNABLE_DEFAULTS = {
+    'intra_op_threads': 0,
+    'inter_op_threads': 0,
+    'max_in_flight': 2,
+    'batch_size': 16,
+    'preprocess_workers': 4,
+    'workers': 1
+}
+
+
+def cpu_fingerprint() -> Dict:
+    """Identificar la CPU de esta máquina (modelo, núcleos y arquitectura)"""
+    model = platform.processor()
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {
+        'cpu_model': model,
+        'cpu_count': os.cpu_count() or 1,
+        'machine': platform.machine()
+    }
+
+
+def save_perf_config(model_data_path: str, settings: Dict, backend: str, extra: Optional[Dict] = None) -> str:
+    document = {
+        **{key: settings[key] for key in TUNABLE_DEFAULTS},
+        'backend': backend,
+        'tuned_for': cpu_fingerprint(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        **(extra or {})
+    }
+    path = os.path.join(model_data_path, PERF_CONFIG_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_perf_config(model_data_path: str, backend: Optional[str] = None) -> Dict:
+    """
+    Leer los parámetros ajustados para esta máquina; {} si no hay archivo,
+    si se ajustó en otra CPU o para otro backend de inferencia
+    """
+    path = os.path.join(model_data_path, PERF_CONFIG_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Error leyendo {PERF_CONFIG_FILE}: {e}")
+        return {}
+
+    tuned_for = document.get('tuned_for', {})
+    current = cpu_fingerprint()
+    if any(tuned_for.get(key) != value for key, value in current.items()):
+        print(f"⚠️ {PERF_CONFIG_FILE} se generó en otra CPU ({tuned_for.get('cpu_model')}, "
+              f"{tuned_for.get('cpu_count')} núcleos): ignorado, ejecuta autotune.py en esta máquina")
+        return {}
+    if backend and document.get('backend') not in (None, backend):
+        print(f"⚠️ {PERF_CONFIG_FILE} se ajustó para el backend {document.get('backend')}: ignorado")
+        return {}
+
+    settings = {key: int(document[key]) for key in TUNABLE_DEFAULTS if key in document}
+    print(f"🎛️ Configuración de rendimiento cargada: {settings}")
+    return settings
+
+
+def tuned_setting(settings: Dict, env_var: str, key: str) -> int:
+    """Variable de entorno > perf_config.json > valor por defecto"""
+    value = os.environ.get(env_var)
+    if value is not None:
+        return int(value)
+    return int(settings.get(key, TUNABLE_DEFAULTS[key]))
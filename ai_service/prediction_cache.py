@@ -0,0 +1,62 @@
+"""
+🗃️ Caché de predicciones por contenido
+LRU en memoria indexada por el hash del contenido de la imagen y la variante
+de modelo. El router (router.py) usa el mismo hash para enviar siempre la
+misma imagen a la misma instancia, así la caché de cada nodo no se diluye.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+def content_hash(data) -> str:
+    """Hash rápido del contenido (BLAKE2b de 128 bits)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PredictionCache:
+    """LRU con tamaño máximo en entradas; thread-safe"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,424 @@
+"""
+📝 Registro de predicciones y resúmenes de deriva
+Cada predicción de `/predict` (también las servidas desde caché) se encola en
+O(1) y un hilo en segundo plano las escribe por lotes en un log binario de
+solo añadir. El mismo hilo actualiza resúmenes de memoria constante
+(drift_sketches.py) que `GET /admin/drift` compara para detectar cambios en
+la distribución: la petición nunca espera al disco.
+
+Formato: registros de tamaño fijo (RECORD_DTYPE, 56 bytes) en un archivo por
+día `predictions-AAAAMMDD.bin`. Especies, razas y versiones de modelo se
+guardan como ids de `dictionary.jsonl`. Para analizarlos: `load_records()` o
+`python prediction_log.py export`.
+
+Varios procesos (workers de uvicorn o Flask) pueden compartir el directorio:
+los ids nuevos se asignan con `flock` sobre el diccionario tras releer lo que
+hayan añadido los demás, y cada lote se añade al archivo del día con el mismo
+cerrojo. Los resúmenes de deriva son de cada proceso.
+
+Variables de entorno:
+    PET_AI_PREDICTION_LOG        directorio del log (p.ej. prediction_logs); vacío (por defecto) = desactivado
+    PET_AI_PREDICTION_LOG_DAYS   días de archivos que se conservan (30)
+    PET_AI_DRIFT_WINDOW          predicciones por ventana de comparación (1000)
+"""
+
+import argparse
+import fcntl
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from drift_sketches import CountMinSketch, Histogram, Reservoir, population_stability_index
+
+PREDICTION_LOG_PATH = os.environ.get('PET_AI_PREDICTION_LOG', '')
+PREDICTION_LOG_DAYS = int(os.environ.get('PET_AI_PREDICTION_LOG_DAYS', '30'))
+DRIFT_WINDOW = int(os.environ.get('PET_AI_DRIFT_WINDOW', '1000'))
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('species', '<u2'),
+    ('model', '<u2'),
+    ('status', 'u1'),
+    ('flags', 'u1'),
+    ('species_confidence', '<f4'),
+    ('top5', '<u2', (5,)),
+    ('top5_confidence', '<f4', (5,)),
+    ('inference_ms', '<f4'),
+    ('total_ms', '<f4')
+])
+NO_ID = 0xFFFF
+STATUS_CODES = {'success': 0, 'species_not_detected': 1, 'error': 2}
+FLAG_CACHE_HIT = 1
+FLAG_TTA = 2
+FLAG_CLIP = 4
+
+QUEUE_SIZE = 10000
+WRITE_BATCH = 512
+FLUSH_INTERVAL = 1.0
+RESERVOIR_SIZE = 200
+TOP_BREEDS = 10
+
+
+class StringDictionary:
+    """
+    Textos <-> ids u16, persistidos en un JSONL de solo añadir. El id es el
+    número de línea, así que otros procesos que escriban en el mismo archivo
+    obtienen los mismos ids
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values: List[Optional[str]] = []
+        self.ids: Dict[str, int] = {}
+        self._offset = 0  # bytes del archivo ya leídos
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                self._read_new(f)
+
+    def _read_new(self, f):
+        """Incorporar las líneas completas añadidas desde la última lectura"""
+        f.seek(self._offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            self._offset += len(line)
+            try:
+                value = json.loads(line)
+            except ValueError:
+                value = None  # línea dañada: ocupa su id para no desplazar los siguientes
+            if isinstance(value, str):
+                self.ids.setdefault(value, len(self.values))
+            self.values.append(value)
+
+    def id_for(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_ID
+        found = self.ids.get(value)
+        if found is None:
+            found = self._assign(value)
+        return found
+
+    def _assign(self, value: str) -> int:
+        # Con el cerrojo: releer lo que añadieron otros procesos y solo entonces asignar
+        with open(self.path, 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._read_new(f)
+                found = self.ids.get(value)
+                if found is not None:
+                    return found
+                if len(self.values) >= NO_ID:
+                    return NO_ID
+                f.seek(0, os.SEEK_END)
+                if f.tell() > self._offset:
+                    f.write(b'\n')  # cerrar la línea a medio escribir de un proceso caído
+                    self._offset = f.tell()
+                    self.values.append(None)
+                line = (json.dumps(value, ensure_ascii=False) + '\n').encode('utf-8')
+                f.write(line)
+                f.flush()
+                self._offset += len(line)
+                found = self.ids[value] = len(self.values)
+                self.values.append(value)
+                return found
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def value(self, value_id: int) -> Optional[str]:
+        return self.values[value_id] if value_id < len(self.values) else None
+
+
+class DriftSummary:
+    """Resúmenes de un tramo del log: histogramas, count-min de razas y conteos"""
+
+    def __init__(self):
+        self.count = 0
+        self.species: Dict[int, int] = {}
+        self.status = np.zeros(len(STATUS_CODES), dtype=np.int64)
+        self.tta = 0
+        self.cache_hits = 0
+        self.species_confidence = Histogram.linear(0, 1, 20)
+        self.breed_confidence = Histogram.linear(0, 1, 20)
+        self.latency_ms = Histogram.logarithmic(1, 10000, 24)
+        self.breeds = CountMinSketch()
+
+    def update(self, records: np.ndarray):
+        self.count += len(records)
+        np.add.at(self.status, records['status'], 1)
+        self.tta += int(np.count_nonzero(records['flags'] & FLAG_TTA))
+        self.cache_hits += int(np.count_nonzero(records['flags'] & FLAG_CACHE_HIT))
+        self.latency_ms.update(records['total_ms'])
+        ok = records[records['status'] == STATUS_CODES['success']]
+        for species_id, count in zip(*np.unique(ok['species'], return_counts=True)):
+            self.species[int(species_id)] = self.species.get(int(species_id), 0) + int(count)
+        self.species_confidence.update(ok['species_confidence'])
+        self.breed_confidence.update(ok['top5_confidence'][:, 0])
+        self.breeds.update(ok['top5'][:, 0])
+
+    def species_counts(self, species_ids: List[int]) -> np.ndarray:
+        return np.array([self.species.get(i, 0) for i in species_ids], dtype=np.float64)
+
+    def to_dict(self, dictionary: StringDictionary) -> Dict:
+        return {
+            'predictions': self.count,
+            'status': {name: int(self.status[code]) for name, code in STATUS_CODES.items()},
+            'tta_rate': round(self.tta / self.count, 4) if self.count else None,
+            'cache_hit_rate': round(self.cache_hits / self.count, 4) if self.count else None,
+            'species': {dictionary.value(i): count for i, count in sorted(self.species.items())},
+            'species_confidence_p50': self.species_confidence.quantile(0.5),
+            'breed_confidence_p50': self.breed_confidence.quantile(0.5),
+            'latency_ms_p50': self.latency_ms.quantile(0.5),
+            'latency_ms_p95': self.latency_ms.quantile(0.95),
+            'breed_confidence_histogram': self.breed_confidence.to_dict()
+        }
+
+
+class PredictionLog:
+    """Cola acotada + hilo escritor por lotes; mantiene los resúmenes de deriva"""
+
+    def __init__(self, directory: str, retention_days: int = PREDICTION_LOG_DAYS,
+                 window_size: int = DRIFT_WINDOW, queue_size: int = QUEUE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.retention_days = retention_days
+        self.window_size = window_size
+        self.dictionary = StringDictionary(os.path.join(directory, 'dictionary.jsonl'))
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._segment_day: Optional[str] = None
+        self._breed_ids: set = set()
+        self.dropped = 0
+        self.written = 0
+
+        # Referencia = todo lo visto desde el arranque; se compara con la última ventana completa
+        self.reference = DriftSummary()
+        self.previous: Optional[DriftSummary] = None
+        self.current = DriftSummary()
+        self.samples = Reservoir(RESERVOIR_SIZE)
+
+        self._thread = threading.Thread(target=self._worker, name='prediction-log', daemon=True)
+        self._thread.start()
+
+    def record(self, result: Dict, model: Optional[str], total_ms: float,
+               inference_ms: Optional[float] = None, cache_hit: bool = False):
+        """Encolar una predicción (resultado o respuesta formateada); nunca bloquea"""
+        success = result.get('success', False)
+        model_info = result.get('model_info', {})
+        flags = ((FLAG_CACHE_HIT if cache_hit else 0)
+                 | (FLAG_TTA if model_info.get('tta_applied') else 0)
+                 | (FLAG_CLIP if 'frames' in result else 0))
+        entry = (
+            time.time(),
+            result.get('species') if success else None,
+            model,
+            STATUS_CODES['success'] if success else STATUS_CODES.get(result.get('error'), STATUS_CODES['error']),
+            flags,
+            result.get('species_confidence', 0.0),
+            [(p['breed'], p['confidence']) for p in result.get('top_5_predictions', [])[:5]],
+            np.nan if inference_ms is None else inference_ms,
+            total_ms
+        )
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Esperar a que todo lo encolado esté escrito (herramientas y apagado)"""
+        self._queue.join()
+
+    # -----------------------------------------------------------------
+    # Hilo escritor
+    # -----------------------------------------------------------------
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo el log de predicciones: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _encode(self, batch: List[tuple]) -> np.ndarray:
+        records = np.zeros(len(batch), dtype=RECORD_DTYPE)
+        records['top5'] = NO_ID
+        for i, (timestamp, species, model, status, flags, species_confidence,
+                top_5, inference_ms, total_ms) in enumerate(batch):
+            record = records[i]
+            record['timestamp'] = timestamp
+            record['species'] = self.dictionary.id_for(species)
+            record['model'] = self.dictionary.id_for(model)
+            record['status'] = status
+            record['flags'] = flags
+            record['species_confidence'] = species_confidence
+            for rank, (breed, confidence) in enumerate(top_5):
+                breed_id = self.dictionary.id_for(breed)
+                self._breed_ids.add(breed_id)
+                record['top5'][rank] = breed_id
+                record['top5_confidence'][rank] = confidence
+            record['inference_ms'] = inference_ms
+            record['total_ms'] = total_ms
+        return records
+
+    def _segment_path(self, day: str) -> str:
+        return os.path.join(self.directory, f"predictions-{day}.bin")
+
+    def _write(self, batch: List[tuple]):
+        records = self._encode(batch)
+        day = datetime.now().strftime('%Y%m%d')
+        if day != self._segment_day:
+            self._segment_day = day
+            self._remove_old_segments()
+        with open(self._segment_path(day), 'ab') as f:
+            # Otros workers añaden al mismo archivo: un lote entero cada vez
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(records.tobytes())
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        with self._lock:
+            self.written += len(records)
+            self.reference.update(records)
+            # Ventanas de tamaño fijo: la comparación usa siempre la última completa
+            start = 0
+            while start < len(records):
+                take = min(self.window_size - self.current.count, len(records) - start)
+                self.current.update(records[start:start + take])
+                start += take
+                if self.current.count >= self.window_size:
+                    self.previous, self.current = self.current, DriftSummary()
+            self.samples.update([
+                (float(r['timestamp']), int(r['species']), int(r['top5'][0]), float(r['top5_confidence'][0]))
+                for r in records[records['status'] == STATUS_CODES['success']]
+            ])
+
+    def _remove_old_segments(self):
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y%m%d')
+        for path in glob.glob(os.path.join(self.directory, 'predictions-*.bin')):
+            if os.path.basename(path)[12:20] < cutoff:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # ya lo borró otro worker
+
+    # -----------------------------------------------------------------
+    # Deriva
+    # -----------------------------------------------------------------
+
+    def get_drift(self) -> Dict:
+        """
+        Ventana reciente frente a la referencia: PSI de confianzas y de la
+        mezcla de especies y razas, más las razas más frecuentes de cada tramo
+        """
+        with self._lock:
+            window = self.previous or self.current
+            species_ids = sorted(set(self.reference.species) | set(window.species))
+            breed_ids = np.array(sorted(self._breed_ids), dtype=np.int64)
+            reference_breeds = self.reference.breeds.estimate(breed_ids) if len(breed_ids) else np.zeros(0)
+            window_breeds = window.breeds.estimate(breed_ids) if len(breed_ids) else np.zeros(0)
+            top = np.argsort(window_breeds)[::-1][:TOP_BREEDS]
+            reference_total = max(self.reference.breeds.total, 1)
+            window_total = max(window.breeds.total, 1)
+            return {
+                'log_directory': self.directory,
+                'written': self.written,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize(),
+                'window_size': self.window_size,
+                'window_complete': self.previous is not None,
+                'psi': {
+                    'species_confidence': population_stability_index(
+                        self.reference.species_confidence.counts, window.species_confidence.counts),
+                    'breed_confidence': population_stability_index(
+                        self.reference.breed_confidence.counts, window.breed_confidence.counts),
+                    'species_mix': population_stability_index(
+                        self.reference.species_counts(species_ids), window.species_counts(species_ids)),
+                    'breed_mix': population_stability_index(reference_breeds, window_breeds)
+                },
+                'top_breeds': [{
+                    'breed': self.dictionary.value(int(breed_ids[i])),
+                    'window_share': round(float(window_breeds[i]) / window_total, 4),
+                    'reference_share': round(float(reference_breeds[i]) / reference_total, 4)
+                } for i in top if window_breeds[i] > 0],
+                'reference': self.reference.to_dict(self.dictionary),
+                'window': window.to_dict(self.dictionary),
+                'samples': [{
+                    'timestamp': round(timestamp, 3),
+                    'species': self.dictionary.value(species),
+                    'breed': self.dictionary.value(breed),
+                    'breed_confidence': round(confidence, 4)
+                } for timestamp, species, breed, confidence in self.samples.items]
+            }
+
+
+def open_prediction_log(path: Optional[str] = PREDICTION_LOG_PATH) -> Optional[PredictionLog]:
+    """Log en `path` o None si está desactivado"""
+    if not path:
+        return None
+    return PredictionLog(path)
+
+
+def load_records(directory: str, since: Optional[str] = None) -> Tuple[np.ndarray, List[str]]:
+    """Todos los registros (desde el día AAAAMMDD `since`) y la tabla de textos"""
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(directory, 'predictions-*.bin'))):
+        if since and os.path.basename(path)[12:20] < since:
+            continue
+        data = np.fromfile(path, dtype=np.uint8)
+        usable = len(data) - len(data) % RECORD_DTYPE.itemsize  # registro final a medio escribir
+        chunks.append(data[:usable].view(RECORD_DTYPE))
+    records = np.concatenate(chunks) if chunks else np.zeros(0, dtype=RECORD_DTYPE)
+    return records, StringDictionary(os.path.join(directory, 'dictionary.jsonl')).values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar el log binario de predicciones a JSONL')
+    parser.add_argument('command', choices=('export',))
+    parser.add_argument('--log-dir', default=PREDICTION_LOG_PATH or None, required=not PREDICTION_LOG_PATH,
+                        help='Directorio del log (por defecto PET_AI_PREDICTION_LOG)')
+    parser.add_argument('--since', help='Primer día a exportar (AAAAMMDD)')
+    parser.add_argument('--output', default='predictions.jsonl')
+    args = parser.parse_args()
+
+    records, values = load_records(args.log_dir, args.since)
+    text = lambda value_id: values[value_id] if value_id < len(values) else None
+    statuses = {code: name for name, code in STATUS_CODES.items()}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps({
+                'timestamp': float(record['timestamp']),
+                'status': statuses[int(record['status'])],
+                'species': text(int(record['species'])),
+                'species_confidence': round(float(record['species_confidence']), 4),
+                'model': text(int(record['model'])),
+                'cache_hit': bool(record['flags'] & FLAG_CACHE_HIT),
+                'tta_applied': bool(record['flags'] & FLAG_TTA),
+                'clip': bool(record['flags'] & FLAG_CLIP),
+                'top_5': [{'breed': text(int(b)), 'confidence': round(float(c), 4)}
+                          for b, c in zip(record['top5'], record['top5_confidence']) if b != NO_ID],
+                'inference_ms': None if np.isnan(record['inference_ms']) else round(float(record['inference_ms']), 2),
+                'total_ms': round(float(record['total_ms']), 2)
+            }, ensure_ascii=False) + '\n')
+    print(f"✅ {len(records)} predicciones exportadas a {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+🔬 Perfilado bajo demanda del servicio en producción
+- CPU: profiler por muestreo de todos los hilos durante N segundos
+  (salida pstats y speedscope)
+- TensorFlow: traza del profiler de TF alrededor de las próximas K predicciones
+  (TensorBoard)
+- Memoria: snapshots y diffs de `tracemalloc` entre peticiones
+
+Todo corre en segundo plano con duración acotada y un único perfil de cada
+tipo a la vez, así que es seguro con tráfico real.
+"""
+
+import json
+import marshal
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+MAX_CPU_SECONDS = 60
+MAX_TF_CALLS = 50
+
+Frame = Tuple[str, int, str]  # (archivo, línea de inicio de la función, función)
+
+
+class ProfilerBusy(Exception):
+    """Ya hay un perfil del mismo tipo en curso"""
+
+
+class ProfilerUnavailable(Exception):
+    """El tipo de perfil no aplica a este proceso (p.ej. TF sin TensorFlow cargado)"""
+
+
+class InvalidProfileParameter(ValueError):
+    """Parámetro de consulta de un endpoint de perfilado que no es un número válido"""
+
+
+def query_number(params, name: str, default, cast=float):
+    """Leer un parámetro numérico de la query (`cast` = float o int)"""
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        kind = 'un entero' if cast is int else 'un número'
+        raise InvalidProfileParameter(f"'{name}' debe ser {kind}, recibido: {value!r}")
+    if not math.isfinite(number):
+        raise InvalidProfileParameter(f"'{name}' debe ser un número finito, recibido: {value!r}")
+    return number
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    """Pila raíz -> hoja de un frame de Python"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def write_pstats(samples: Counter, interval: float, path: str):
+    """
+    Convertir muestras de pilas al formato marshal de `pstats` (cargable con
+    `pstats.Stats(path)` o snakeviz): tiempo propio = muestras en la hoja,
+    tiempo acumulado = muestras en las que la función aparece en la pila
+    """
+    stats: Dict[Frame, list] = {}
+    for stack, count in samples.items():
+        seen = set()
+        for depth, func in enumerate(stack):
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            if func not in seen:  # recursión: contar una sola vez
+                entry[0] += count
+                entry[1] += count
+                entry[3] += count * interval
+                seen.add(func)
+            if depth > 0:
+                caller = stack[depth - 1]
+                cc, nc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                entry[4][caller] = (cc + count, nc + count, tt, ct + count * interval)
+        stats[stack[-1]][2] += count * interval
+    with open(path, 'wb') as f:
+        marshal.dump({func: tuple(values) for func, values in stats.items()}, f)
+
+
+def write_speedscope(samples: Counter, interval: float, path: str, name: str):
+    """Exportar las muestras en formato speedscope ('sampled')"""
+    frames: List[Dict] = []
+    frame_index: Dict[Frame, int] = {}
+    profile_samples, weights = [], []
+    for stack, count in samples.items():
+        indices = []
+        for func in stack:
+            if func not in frame_index:
+                frame_index[func] = len(frames)
+                frames.append({'name': func[2], 'file': func[0], 'line': func[1]})
+            indices.append(frame_index[func])
+        profile_samples.append(indices)
+        weights.append(count * interval)
+    total = sum(weights)
+    document = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': total,
+            'samples': profile_samples,
+            'weights': weights
+        }],
+        'name': name,
+        'exporter': 'pet-ai-profiling'
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f)
+
+
+class ProfilingManager:
+    """Estado y artefactos de los perfiles del proceso"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._cpu_running = False
+        self._cpu_last: Optional[Dict] = None
+        self._tf_remaining = 0
+        self._tf_active = False
+        self._tf_logdir: Optional[str] = None
+        self._memory_last_snapshot = None
+
+    def _artifact_path(self, prefix: str, extension: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.output_dir, f"{prefix}-{stamp}-{os.getpid()}{extension}")
+
+    # -----------------------------------------------------------------
+    # CPU
+    # -----------------------------------------------------------------
+
+    def start_cpu_profile(self, seconds: float, interval_ms: float = 10.0) -> Dict:
+        seconds = min(max(seconds, 0.1), MAX_CPU_SECONDS)
+        interval = max(interval_ms, 1.0) / 1000.0
+        with self._lock:
+            if self._cpu_running:
+                raise ProfilerBusy('Ya hay un perfil de CPU en curso')
+            self._cpu_running = True
+        base = self._artifact_path('cpu', '')
+        artifacts = {'pstats': base + '.pstats', 'speedscope': base + '.speedscope.json'}
+        thread = threading.Thread(target=self._sample_cpu, args=(seconds, interval, artifacts),
+                                  name='cpu-profiler', daemon=True)
+        thread.start()
+        return {'seconds': seconds, 'interval_ms': interval * 1000, 'artifacts': artifacts}
+
+    def _sample_cpu(self, seconds: float, interval: float, artifacts: Dict[str, str]):
+        own_id = threading.get_ident()
+        samples: Counter = Counter()
+        end = time.monotonic() + seconds
+        try:
+            while time.monotonic() < end:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_id:
+                        samples[_stack(frame)] += 1
+                time.sleep(interval)
+            write_pstats(samples, interval, artifacts['pstats'])
+            write_speedscope(samples, interval, artifacts['speedscope'], 'pet-ai cpu')
+            self._cpu_last = {'artifacts': artifacts, 'samples': sum(samples.values())}
+            print(f"🔬 Perfil de CPU guardado: {artifacts['speedscope']}")
+        except Exception as e:
+            print(f"❌ Error en perfil de CPU: {e}")
+            self._cpu_last = {'error': str(e)}
+        finally:
+            with self._lock:
+                self._cpu_running = False
+
+    # -----------------------------------------------------------------
+    # TensorFlow
+    # -----------------------------------------------------------------
+
+    def arm_tf_trace(self, calls: int) -> Dict:
+        if 'tensorflow' not in sys.modules:
+            raise ProfilerUnavailable('TensorFlow no está cargado en este proceso (backend ONNX?)')
+        calls = min(max(calls, 1), MAX_TF_CALLS)
+        with self._lock:
+            if self._tf_remaining or self._tf_active:
+                raise ProfilerBusy('Ya hay una traza de TensorFlow en curso')
+            self._tf_remaining = calls
+            self._tf_logdir = self._artifact_path('tensorflow', '')
+        return {'calls': calls, 'logdir': self._tf_logdir}
+
+    @contextmanager
+    def around_predict(self):
+        """Envolver una llamada a predict: inicia/detiene la traza de TF si está armada"""
+        if not self._tf_remaining and not self._tf_active:
+            yield
+            return
+        tf = sys.modules['tensorflow']
+        with self._lock:
+            if self._tf_remaining and not self._tf_active:
+                tf.profiler.experimental.start(self._tf_logdir)
+                self._tf_active = True
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._tf_active:
+                    self._tf_remaining = max(0, self._tf_remaining - 1)
+                    if self._tf_remaining == 0:
+                        tf.profiler.experimental.stop()
+                        self._tf_active = False
+                        print(f"🔬 Traza de TensorFlow guardada en {self._tf_logdir}")
+
+    # -----------------------------------------------------------------
+    # Memoria
+    # -----------------------------------------------------------------
+
+    def start_memory(self, frames: int = 25) -> Dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._memory_last_snapshot = None
+        return {'tracing': True, 'frames': tracemalloc.get_traceback_limit()}
+
+    def memory_snapshot(self, top: int = 20) -> Dict:
+        """Guardar un snapshot y devolver el diff frente al anterior"""
+        if not tracemalloc.is_tracing():
+            raise ProfilerUnavailable('tracemalloc no está activo: inicia el perfil de memoria')
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        path = self._artifact_path('memory', '.tracemalloc')
+        snapshot.dump(path)
+
+        current, peak = tracemalloc.get_traced_memory()
+        result = {'snapshot': path, 'traced_mb': round(current / 1024**2, 2),
+                  'peak_mb': round(peak / 1024**2, 2)}
+        if self._memory_last_snapshot is not None:
+            diff = snapshot.compare_to(self._memory_last_snapshot, 'lineno')[:top]
+            result['diff'] = [{
+                'location': str(stat.traceback[0]),
+                'size_diff_kb': round(stat.size_diff / 1024, 1),
+                'count_diff': stat.count_diff
+            } for stat in diff]
+        else:
+            result['top'] = [{
+                'location': str(stat.traceback[0]),
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count
+            } for stat in snapshot.statistics('lineno')[:top]]
+        self._memory_last_snapshot = snapshot
+        return result
+
+    def stop_memory(self) -> Dict:
+        tracemalloc.stop()
+        self._memory_last_snapshot = None
+        return {'tracing': False}
+
+    def status(self) -> Dict:
+        artifacts = sorted(os.listdir(self.output_dir)) if os.path.isdir(self.output_dir) else []
+        return {
+            'cpu_running': self._cpu_running,
+            'cpu_last': self._cpu_last,
+            'tensorflow_trace': {'active': self._tf_active, 'remaining_calls': self._tf_remaining,
+                                 'logdir': self._tf_logdir},
+            'memory_tracing': tracemalloc.is_tracing(),
+            'output_dir': self.output_dir,
+            'artifacts': artifacts
+        }
@@ -0,0 +1,133 @@
+"""
+🐾🐾 Regiones de varias mascotas por mapas de activación (CAM)
+El detector MobileNetV2 ya calcula un mapa de características 7x7x1280 antes
+de su capa de clasificación; proyectándolo con los pesos de las clases
+ImageNet de animales se obtiene dónde "ve" cada animal sin otra red ni otra
+pasada. Las zonas activas se separan en componentes conexas (subiendo el
+umbral si dos mascotas juntas forman una sola) y cada una es una región.
+
+Variables de entorno:
+    PET_AI_REGION_THRESHOLD   fracción del máximo del CAM que cuenta como activa (0.35)
+    PET_AI_MAX_REGIONS        regiones como máximo por imagen (6)
+    PET_AI_MIN_REGION_AREA    área mínima de una región (fracción de la imagen, 0.02)
+"""
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+REGION_THRESHOLD = float(os.environ.get('PET_AI_REGION_THRESHOLD', '0.35'))
+MAX_REGIONS = int(os.environ.get('PET_AI_MAX_REGIONS', '6'))
+MIN_REGION_AREA = float(os.environ.get('PET_AI_MIN_REGION_AREA', '0.02'))
+
+# Clases ImageNet (las más probables) que se combinan en el CAM
+CAM_CLASSES = 10
+# Resolución a la que se interpola el CAM 7x7 antes de segmentarlo
+CAM_RESOLUTION = 28
+# Umbrales sucesivos para separar mascotas que se tocan
+SPLIT_STEP = 0.1
+# Margen alrededor de la zona activa (el CAM se concentra en cabeza y cuerpo)
+REGION_MARGIN = 0.15
+
+Box = Tuple[float, float, float, float]  # (x0, y0, x1, y1) relativos a la imagen
+
+
+def class_activation_map(features: np.ndarray, class_weights: np.ndarray,
+                         probabilities: np.ndarray, classes: np.ndarray) -> np.ndarray:
+    """
+    CAM (7, 7) de una imagen: mapas de las `CAM_CLASSES` clases de animales
+    más probables ponderados por su probabilidad
+    """
+    top = classes[np.argsort(probabilities[classes])[::-1][:CAM_CLASSES]]
+    maps = features @ class_weights[:, top]
+    return np.maximum(maps @ probabilities[top], 0)
+
+
+def _interpolation_matrix(source: int, target: int) -> np.ndarray:
+    """Matriz (target, source) de interpolación lineal con centros de celda alineados"""
+    position = np.clip((np.arange(target) + 0.5) * source / target - 0.5, 0, source - 1)
+    low = np.floor(position).astype(int)
+    high = np.minimum(low + 1, source - 1)
+    weight = position - low
+    matrix = np.zeros((target, source))
+    matrix[np.arange(target), low] += 1 - weight
+    matrix[np.arange(target), high] += weight
+    return matrix
+
+
+def _components(mask: np.ndarray) -> List[np.ndarray]:
+    """Componentes 8-conexas de una máscara pequeña, como arrays de (fila, columna)"""
+    seen = np.zeros_like(mask, dtype=bool)
+    height, width = mask.shape
+    components = []
+    for start in zip(*np.nonzero(mask)):
+        if seen[start]:
+            continue
+        seen[start] = True
+        stack, cells = [start], []
+        while stack:
+            y, x = stack.pop()
+            cells.append((y, x))
+            for ny in range(max(y - 1, 0), min(y + 2, height)):
+                for nx in range(max(x - 1, 0), min(x + 2, width)):
+                    if mask[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+        components.append(np.array(cells))
+    return components
+
+
+def _split(cam: np.ndarray, cells: np.ndarray, threshold: float) -> List[Tuple[np.ndarray, float]]:
+    """
+    Dividir una componente subiendo el umbral mientras se separe en varias
+    partes de tamaño suficiente; cada celda de la componente va a la parte
+    más cercana, así cada mascota conserva también su zona menos activa
+    """
+    min_cells = MIN_REGION_AREA * cam.size
+    next_threshold = threshold + SPLIT_STEP
+    if next_threshold < 1.0:
+        mask = np.zeros_like(cam, dtype=bool)
+        mask[cells[:, 0], cells[:, 1]] = cam[cells[:, 0], cells[:, 1]] >= next_threshold
+        parts = [part for part in _components(mask) if len(part) >= min_cells / 4]
+        if len(parts) > 1:
+            distances = np.stack([np.abs(cells[:, np.newaxis] - part[np.newaxis]).max(axis=2).min(axis=1)
+                                  for part in parts])
+            owner = distances.argmin(axis=0)
+            return [piece for i in range(len(parts))
+                    for piece in _split(cam, cells[owner == i], next_threshold)]
+    return [(cells, float(cam[cells[:, 0], cells[:, 1]].max()))]
+
+
+def propose_regions(cam: np.ndarray) -> List[Tuple[Box, float]]:
+    """
+    Regiones (caja relativa, puntuación = pico del CAM normalizado) ordenadas
+    por puntuación; lista vacía si el CAM no tiene activación
+    """
+    if cam.max() <= 0:
+        return []
+    rows = _interpolation_matrix(cam.shape[0], CAM_RESOLUTION)
+    cols = _interpolation_matrix(cam.shape[1], CAM_RESOLUTION)
+    cam = rows @ cam @ cols.T
+    cam /= cam.max()
+
+    regions = []
+    for component in _components(cam >= REGION_THRESHOLD):
+        for cells, score in _split(cam, component, REGION_THRESHOLD):
+            y0, x0 = cells.min(axis=0) / CAM_RESOLUTION
+            y1, x1 = (cells.max(axis=0) + 1) / CAM_RESOLUTION
+            margin_x, margin_y = (x1 - x0) * REGION_MARGIN, (y1 - y0) * REGION_MARGIN
+            box = (float(max(x0 - margin_x, 0.0)), float(max(y0 - margin_y, 0.0)),
+                   float(min(x1 + margin_x, 1.0)), float(min(y1 + margin_y, 1.0)))
+            if (box[2] - box[0]) * (box[3] - box[1]) >= MIN_REGION_AREA:
+                regions.append((box, score))
+    regions.sort(key=lambda region: region[1], reverse=True)
+    return regions[:MAX_REGIONS]
+
+
+def to_pixels(box: Box, size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """Caja relativa a píxeles de una imagen (ancho, alto) para PIL.Image.crop"""
+    width, height = size
+    return (int(box[0] * width), int(box[1] * height),
+            max(int(round(box[2] * width)), int(box[0] * width) + 1),
+            max(int(round(box[3] * height)), int(box[1] * height) + 1))
@@ -0,0 +1,323 @@
+"""
+🧭 Router con afinidad de caché para varias instancias del servicio
+Reparte `/predict` entre instancias con hashing consistente sobre el hash del
+contenido de la imagen y la especie indicada: la misma foto llega siempre a la
+misma instancia, así cada nodo cachea una parte distinta y la capacidad
+efectiva de caché crece al añadir nodos (en vez de repetir las mismas
+entradas en todos).
+
+- Nodos virtuales en el anillo: al añadir o quitar una instancia solo se
+  mueve ~1/N de las claves.
+- Salud: sondeo periódico de `/ready` y marcado pasivo ante errores de red;
+  un nodo caído cede sus claves al siguiente del anillo.
+- Cola acotada por instancia (`--max-pending`): si la dueña de la clave está
+  saturada se desborda al siguiente nodo; si todos lo están, 503 + Retry-After.
+
+Uso:
+    PORT=5001 python app_multi_species.py &
+    PORT=5002 python app_multi_species.py &
+    python router.py --upstream http://localhost:5001 --upstream http://localhost:5002
+"""
+
+import argparse
+import bisect
+import hashlib
+import http.client
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from flask import Flask, Response, jsonify, request
+
+from prediction_cache import content_hash
+from upload_validation import MAX_UPLOAD_BYTES, StreamingImageUpload, UploadRejected
+
+VIRTUAL_NODES = int(os.environ.get('PET_AI_ROUTER_VNODES', '64'))
+MAX_PENDING = int(os.environ.get('PET_AI_ROUTER_MAX_PENDING', '8'))
+HEALTH_INTERVAL = float(os.environ.get('PET_AI_ROUTER_HEALTH_INTERVAL', '2'))
+UPSTREAM_TIMEOUT = float(os.environ.get('PET_AI_ROUTER_TIMEOUT', '30'))
+# Fallos de red seguidos antes de sacar un nodo del anillo sin esperar al sondeo
+FAILURE_THRESHOLD = 2
+
+# Cabeceras que leen las instancias (admission_control.py, variantes, tokens)
+FORWARDED_HEADERS = ('Content-Type', 'X-Request-Priority', 'X-Request-Timeout', 'X-Request-Deadline',
+                     'X-Model-Variant', 'X-Internal-Token', 'X-Admin-Token')
+HOP_BY_HOP = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'server', 'date'}
+
+
+class Upstream:
+    """Una instancia del servicio: salud y peticiones en curso"""
+
+    def __init__(self, url: str, max_pending: int = MAX_PENDING):
+        parts = urlsplit(url)
+        self.url = url.rstrip('/')
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 80
+        self.max_pending = max_pending
+        self.healthy = True
+        self.pending = 0
+        self.failures = 0
+        self.requests = 0
+        self.spilled_in = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if not self.healthy or self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            self.requests += 1
+            return True
+
+    def release(self, ok: bool):
+        with self._lock:
+            self.pending -= 1
+            if ok:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= FAILURE_THRESHOLD and self.healthy:
+                self.healthy = False
+                print(f"🔴 {self.url} marcado como caído tras {self.failures} fallos")
+
+    def set_health(self, healthy: bool):
+        with self._lock:
+            if healthy != self.healthy:
+                print(f"{'🟢' if healthy else '🔴'} {self.url} {'disponible' if healthy else 'no disponible'}")
+            self.healthy = healthy
+            if healthy:
+                self.failures = 0
+
+    def request(self, method: str, path: str, body: Optional[bytes], headers: Dict[str, str],
+                timeout: float = UPSTREAM_TIMEOUT) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.getheaders(), response.read()
+        finally:
+            connection.close()
+
+    def get_stats(self) -> Dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'requests': self.requests,
+            'spilled_in': self.spilled_in
+        }
+
+
+class HashRing:
+    """Anillo de hashing consistente con nodos virtuales"""
+
+    def __init__(self, upstreams: List[Upstream], virtual_nodes: int = VIRTUAL_NODES):
+        self.upstreams = upstreams
+        points = []
+        for upstream in upstreams:
+            for replica in range(virtual_nodes):
+                points.append((self._hash(f'{upstream.url}#{replica}'), upstream))
+        points.sort(key=lambda point: point[0])
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def candidates(self, key: str) -> Iterator[Upstream]:
+        """Instancias distintas en orden del anillo a partir de la clave (dueña primero)"""
+        if not self._nodes:
+            return
+        start = bisect.bisect(self._keys, self._hash(key)) % len(self._nodes)
+        seen = set()
+        for offset in range(len(self._nodes)):
+            node = self._nodes[(start + offset) % len(self._nodes)]
+            if node.url not in seen:
+                seen.add(node.url)
+                yield node
+                if len(seen) == len(self.upstreams):
+                    return
+
+
+class CacheAffinityRouter:
+    """Elegir instancia por clave, con desbordamiento y sondeo de salud"""
+
+    def __init__(self, upstream_urls: List[str], max_pending: int = MAX_PENDING,
+                 virtual_nodes: int = VIRTUAL_NODES):
+        self.upstreams = [Upstream(url, max_pending) for url in upstream_urls]
+        self.ring = HashRing(self.upstreams, virtual_nodes)
+        self.routed = 0
+        self.spilled = 0
+        self.rejected = 0
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def acquire(self, key: str, exclude=()) -> Optional[Upstream]:
+        """Dueña de la clave si tiene hueco; si no, la siguiente sana del anillo"""
+        for position, upstream in enumerate(self.ring.candidates(key)):
+            if upstream not in exclude and upstream.try_acquire():
+                self.routed += 1
+                if position > 0:
+                    self.spilled += 1
+                    upstream.spilled_in += 1
+                return upstream
+        self.rejected += 1
+        return None
+
+    def acquire_any(self, exclude=()) -> Optional[Upstream]:
+        """Rutas sin afinidad: la instancia sana menos ocupada"""
+        for upstream in sorted(self.upstreams, key=lambda u: u.pending):
+            if upstream not in exclude and upstream.try_acquire():
+                return upstream
+        self.rejected += 1
+        return None
+
+    def check_health(self):
+        for upstream in self.upstreams:
+            try:
+                status, _, _ = upstream.request('GET', '/ready', None, {}, timeout=2)
+                upstream.set_health(status == 200)
+            except OSError:
+                upstream.set_health(False)
+
+    def start_health_checks(self, interval: float = HEALTH_INTERVAL):
+        def loop():
+            while not self._stop.wait(interval):
+                self.check_health()
+
+        self.check_health()
+        self._health_thread = threading.Thread(target=loop, name='router-health', daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_stats(self) -> Dict:
+        return {
+            'routed': self.routed,
+            'spilled': self.spilled,
+            'rejected': self.rejected,
+            'healthy_upstreams': sum(1 for u in self.upstreams if u.healthy),
+            'upstreams': [u.get_stats() for u in self.upstreams]
+        }
+
+
+def routing_key(content_type: Optional[str], body: bytes, species_hint: Optional[str]) -> str:
+    """
+    Clave de afinidad: hash del contenido de la imagen (no del multipart
+    completo, cuyo boundary cambia en cada envío) más la especie indicada
+    """
+    if content_type and content_type.startswith('multipart/form-data'):
+        upload = StreamingImageUpload(content_type, len(body))
+        upload.feed(body)
+        image_bytes = upload.finish()
+        species_hint = upload.fields.get('species') or species_hint
+        digest = content_hash(image_bytes or body)
+    else:
+        digest = content_hash(body)
+    return f"{digest}:{(species_hint or '').lower()}"
+
+
+def create_app(router: CacheAffinityRouter) -> Flask:
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = None  # los límites los aplica cada instancia
+
+    def unavailable():
+        response = jsonify({
+            'success': False,
+            'error': 'overloaded',
+            'message': 'Todas las instancias están saturadas o caídas'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def forward(upstream: Upstream, body: Optional[bytes]):
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        path = request.full_path if request.query_string else request.path
+        ok = False
+        try:
+            status, upstream_headers, content = upstream.request(request.method, path, body, headers)
+            ok = True
+        except OSError as e:
+            print(f"⚠️ Error contactando {upstream.url}: {e}")
+            return None
+        finally:
+            upstream.release(ok)
+        response = Response(content, status=status)
+        for name, value in upstream_headers:
+            if name.lower() not in HOP_BY_HOP:
+                response.headers[name] = value
+        response.headers['X-Upstream'] = upstream.url
+        return response
+
+    def forward_with_failover(acquire) -> Response:
+        body = request.get_data() if request.method == 'POST' else None
+        # Un intento por instancia como máximo: los fallos de red sacan al nodo del anillo
+        tried = []
+        for _ in range(len(router.upstreams)):
+            upstream = acquire(tried)
+            if upstream is None:
+                break
+            tried.append(upstream)
+            response = forward(upstream, body)
+            if response is not None:
+                return response
+        return unavailable()
+
+    @app.route('/predict', methods=['POST'])
+    @app.route('/predict/species', methods=['POST'])
+    def predict():
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES * 4:
+            return jsonify({'success': False, 'error': 'file_too_large',
+                            'message': 'El cuerpo es demasiado grande'}), 413
+        try:
+            key = routing_key(request.content_type, request.get_data(),
+                              request.headers.get('X-Species-Hint'))
+        except UploadRejected as e:
+            # La instancia daría el mismo error: responder sin ocupar un nodo
+            return jsonify({'success': False, 'error': e.error, 'message': e.message}), e.status
+        return forward_with_failover(lambda tried: router.acquire(key, tried))
+
+    @app.route('/router/stats', methods=['GET'])
+    def stats():
+        return jsonify({'success': True, **router.get_stats()})
+
+    @app.route('/<path:path>', methods=['GET', 'POST'])
+    def passthrough(path):
+        return forward_with_failover(router.acquire_any)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Router con afinidad de caché entre instancias del servicio')
+    parser.add_argument('--upstream', action='append', default=None,
+                        help='URL de una instancia (repetible); por defecto PET_AI_UPSTREAMS separado por comas')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help='Peticiones en curso por instancia antes de desbordar al siguiente nodo')
+    parser.add_argument('--virtual-nodes', type=int, default=VIRTUAL_NODES)
+    args = parser.parse_args()
+
+    urls = args.upstream or [u.strip() for u in os.environ.get('PET_AI_UPSTREAMS', '').split(',') if u.strip()]
+    if not urls:
+        raise SystemExit("❌ Indica al menos una instancia con --upstream o PET_AI_UPSTREAMS")
+
+    router = CacheAffinityRouter(urls, args.max_pending, args.virtual_nodes)
+    router.start_health_checks()
+    print("\n" + "="*60)
+    print("🧭 ROUTER CON AFINIDAD DE CACHÉ")
+    print("="*60)
+    for url in urls:
+        print(f"   • {url}")
+    print(f"📍 Puerto: {args.port} | Cola máxima por instancia: {args.max_pending}")
+    print("="*60 + "\n")
+    create_app(router).run(host='0.0.0.0', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,684 @@
+"""
+🧩 Núcleo compartido del servicio HTTP
+Configuración, carga del predictor, control de admisión y construcción de las
+respuestas JSON. Lo usan la app Flask (app_multi_species.py) y la app ASGI
+(app_async.py), así ambas mantienen exactamente el mismo contrato.
+
+Las funciones de respuesta no dependen del framework: devuelven
+(payload, status, headers).
+"""
+
+from startup import StartupTimer, PROCESS_START
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import numpy as np
+from multi_species_predictor import MultiSpeciesPredictor, decode_image, load_region_image, normalize_batch
+from admission_control import AdmissionController, AdmissionRejected, parse_lane
+from profiling import ProfilingManager
+from tensor_ingest import HEADER, RawTensorError, decode_raw_tensor
+from upload_validation import UploadRejected
+from perf_config import load_perf_config, tuned_setting
+from prediction_cache import PredictionCache, content_hash
+from tensor_store import open_store
+from prediction_log import open_prediction_log
+from shadow_eval import SHADOW_BACKEND, SHADOW_MODEL, ShadowEvaluator
+from frame_sampling import CLIP_MAX_FRAMES, aggregate_frame_results, is_confident, open_frames, sampling_rounds
+
+startup_timer = StartupTimer()
+startup_timer.record_since('imports del servicio', PROCESS_START)
+
+# Configuración
+MODEL_DATA_PATH = os.path.join(os.path.dirname(__file__), 'model_data')
+
+# Backend de inferencia: 'keras' (por defecto), 'onnx' (sin TensorFlow en runtime) o 'synthetic' (sin modelos)
+INFERENCE_BACKEND = os.environ.get('PET_AI_BACKEND', 'keras')
+
+# Parámetros ajustados por autotune.py para esta máquina (las variables de entorno tienen prioridad)
+PERF_SETTINGS = load_perf_config(MODEL_DATA_PATH, INFERENCE_BACKEND)
+BACKEND_OPTIONS = {
+    'intra_op_threads': tuned_setting(PERF_SETTINGS, 'PET_AI_INTRA_OP_THREADS', 'intra_op_threads'),
+    'inter_op_threads': tuned_setting(PERF_SETTINGS, 'PET_AI_INTER_OP_THREADS', 'inter_op_threads')
+}
+
+# Decodificaciones de imagen simultáneas (fuera del control de admisión)
+PREPROCESS_WORKERS = tuned_setting(PERF_SETTINGS, 'PET_AI_PREPROCESS_WORKERS', 'preprocess_workers')
+preprocess_pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='preprocess')
+
+# Control de admisión: inferencias concurrentes, colas por carril y timeout por defecto
+MAX_IN_FLIGHT = tuned_setting(PERF_SETTINGS, 'PET_AI_MAX_IN_FLIGHT', 'max_in_flight')
+QUEUE_LIMITS = {
+    'high': int(os.environ.get('PET_AI_QUEUE_HIGH', '32')),
+    'low': int(os.environ.get('PET_AI_QUEUE_LOW', '8'))
+}
+DEFAULT_REQUEST_TIMEOUT = float(os.environ.get('PET_AI_DEFAULT_TIMEOUT', '30'))
+
+# Ingesta de tensores crudos: solo para llamadores internos con este token
+INTERNAL_TOKEN = os.environ.get('PET_AI_INTERNAL_TOKEN')
+MAX_RAW_BATCH = int(os.environ.get('PET_AI_MAX_RAW_BATCH', '64'))
+MAX_RAW_BYTES = HEADER.size + MAX_RAW_BATCH * 224 * 224 * 3 * 4  # float32 en el peor caso
+
+admission = AdmissionController(MAX_IN_FLIGHT, QUEUE_LIMITS)
+
+# Perfilado bajo demanda: solo con cabecera X-Admin-Token igual a PET_AI_ADMIN_TOKEN
+ADMIN_TOKEN = os.environ.get('PET_AI_ADMIN_TOKEN')
+PROFILE_DIR = os.environ.get('PET_AI_PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+
+profiler = ProfilingManager(PROFILE_DIR)
+
+# Caché de predicciones por contenido (el router reparte por hash para que no se diluya)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PET_AI_PREDICTION_CACHE_SIZE', '1024'))
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE)
+
+# Tensores preprocesados por hash (tensor_store.py): cada subida se decodifica una vez
+tensor_store = open_store()
+
+# Log binario de todas las predicciones y resúmenes de deriva (prediction_log.py)
+prediction_log = open_prediction_log()
+
+# Modelo candidato en sombra (shadow_eval.py); se arranca con el predictor
+shadow = None
+
+# Servidor de inferencia compartido (inference_server.py): si se define, este
+# proceso no carga modelos y envía los tensores por memoria compartida
+INFERENCE_SHM_NAME = os.environ.get('PET_AI_INFERENCE_SHM')
+
+# Cargar los modelos en segundo plano: /health responde mientras tanto
+BACKGROUND_MODEL_LOAD = os.environ.get('PET_AI_BACKGROUND_LOAD', '1') == '1'
+
+Response = Tuple[Dict, int, Dict[str, str]]
+
+predictor = None
+startup_state = {'status': 'starting', 'error': None}
+
+
+def load_predictor():
+    """Inicializar predictor multi-especies"""
+    global predictor
+    print("🚀 Inicializando Pet ID AI Multi-Especies...")
+    try:
+        if INFERENCE_SHM_NAME:
+            from inference_server import SharedMemoryPredictorClient
+            with startup_timer.phase('conexión al servidor de inferencia'):
+                predictor = SharedMemoryPredictorClient(INFERENCE_SHM_NAME, MODEL_DATA_PATH,
+                                                        timeout=DEFAULT_REQUEST_TIMEOUT)
+        else:
+            predictor = MultiSpeciesPredictor(MODEL_DATA_PATH, backend=INFERENCE_BACKEND,
+                                              backend_options=BACKEND_OPTIONS, timer=startup_timer)
+        if predictor.is_ready():
+            startup_state['status'] = 'ready'
+            print("✅ Sistema multi-especies listo")
+            start_shadow()
+        else:
+            startup_state.update(status='error', error='Detector de especies no disponible')
+    except Exception as e:
+        print(f"❌ Error inicializando sistema: {e}")
+        startup_state.update(status='error', error=str(e))
+    startup_timer.print_summary()
+
+
+def start_shadow():
+    """Evaluación en sombra si PET_AI_SHADOW_MODEL está definido"""
+    global shadow
+    if not SHADOW_MODEL or shadow is not None:
+        return
+    try:
+        shadow = ShadowEvaluator(
+            MODEL_DATA_PATH, SHADOW_MODEL, SHADOW_BACKEND or INFERENCE_BACKEND,
+            primary_backend=getattr(predictor, 'backend', None),
+            busy=admission.has_waiting,
+            cost_scale=BACKEND_OPTIONS['intra_op_threads'] or os.cpu_count() or 1
+        )
+        print(f"👥 Evaluación en sombra activa: {SHADOW_MODEL} ({shadow.backend.name}, "
+              f"{shadow.sample_rate:.0%} de las peticiones de {shadow.species})")
+    except Exception as e:
+        print(f"⚠️ No se pudo activar la evaluación en sombra: {e}")
+
+
+def start():
+    """Cargar el predictor (en segundo plano salvo PET_AI_BACKGROUND_LOAD=0)"""
+    if BACKGROUND_MODEL_LOAD:
+        threading.Thread(target=load_predictor, name='model-loader', daemon=True).start()
+    else:
+        load_predictor()
+
+
+reload_lock = threading.Lock()
+
+
+def reload_models():
+    """
+    Cargar de nuevo modelos y etiquetas (p.ej. una versión publicada por
+    incremental_training.py) y sustituir el predictor solo si queda listo;
+    las peticiones en curso terminan con el anterior
+    """
+    global predictor
+    with reload_lock:
+        print("🔄 Recargando modelos...")
+        try:
+            new_predictor = MultiSpeciesPredictor(MODEL_DATA_PATH, backend=INFERENCE_BACKEND,
+                                                  backend_options=BACKEND_OPTIONS)
+        except Exception as e:
+            print(f"❌ Error recargando modelos: {e}")
+            return
+        if not new_predictor.is_ready():
+            print("❌ El nuevo predictor no está listo: se mantiene el anterior")
+            return
+        predictor = new_predictor
+        prediction_cache.clear()
+        startup_state.update(status='ready', error=None)
+        print("✅ Modelos recargados")
+
+
+def shadow_stats() -> Response:
+    """Comparación del candidato en sombra con el modelo principal"""
+    if shadow is None:
+        return {'success': True, 'enabled': False}, 200, {}
+    return {'success': True, 'enabled': True, **shadow.get_stats()}, 200, {}
+
+
+def drift_stats() -> Response:
+    """Resúmenes de deriva del log de predicciones"""
+    if prediction_log is None:
+        return {'success': True, 'enabled': False}, 200, {}
+    return {'success': True, 'enabled': True, **prediction_log.get_drift()}, 200, {}
+
+
+def request_reload() -> Response:
+    """Lanzar la recarga en segundo plano (202) salvo que ya haya una en curso"""
+    if INFERENCE_SHM_NAME:
+        return {
+            'success': False,
+            'error': 'reload_unavailable',
+            'message': 'Los modelos los carga inference_server.py: reinícialo para recargarlos'
+        }, 409, {}
+    if reload_lock.locked():
+        return {'success': False, 'error': 'reload_in_progress'}, 409, {}
+    threading.Thread(target=reload_models, name='model-reloader', daemon=True).start()
+    return {'success': True, 'status': 'reloading'}, 202, {}
+
+# =====================================================================
+# Respuestas comunes
+# =====================================================================
+
+
+def service_unavailable(payload: Dict) -> Response:
+    """503 + Retry-After mientras cargan los modelos; 500 si la carga falló"""
+    if startup_state['status'] == 'starting':
+        return {**payload, 'status': 'starting'}, 503, {'Retry-After': '5'}
+    return payload, 500, {}
+
+
+def admission_rejected(e: AdmissionRejected) -> Response:
+    """Respuesta 503 rápida cuando la petición no se admite a inferencia"""
+    messages = {
+        'overloaded': 'Servicio saturado, reintenta más tarde',
+        'deadline_exceeded': 'El tiempo límite de la petición expiró antes de la inferencia'
+    }
+    return {
+        'success': False,
+        'error': e.reason,
+        'message': messages.get(e.reason, 'Servicio no disponible')
+    }, 503, {'Retry-After': str(e.retry_after)}
+
+
+def predict_unavailable() -> Response:
+    return service_unavailable({
+        'success': False,
+        'error': 'service_unavailable',
+        'message': 'Servicio de predicción no disponible'
+    })
+
+
+def internal_error(e: Exception) -> Response:
+    """Error inesperado durante /predict"""
+    print(f"❌ Error en predicción: {str(e)}")
+    traceback.print_exc()
+    return {
+        'success': False,
+        'error': 'internal_error',
+        'message': f'Error interno: {str(e)}'
+    }, 500, {}
+
+
+def upload_rejected(e: UploadRejected) -> Response:
+    """Upload rechazado por la validación en streaming (sin llegar a decodificar)"""
+    print(f"🛡️ Upload rechazado: {e.error} - {e.message}")
+    return {'success': False, 'error': e.error, 'message': e.message}, e.status, {}
+
+
+def raw_tensor_forbidden() -> Response:
+    return {
+        'success': False,
+        'error': 'forbidden',
+        'message': 'Ingesta de tensores crudos solo para llamadores internos'
+    }, 403, {}
+
+
+def is_internal_caller(token: Optional[str]) -> bool:
+    return bool(INTERNAL_TOKEN) and token == INTERNAL_TOKEN
+
+
+def request_lane(headers) -> str:
+    """Carril de admisión: 'high' solo para llamadores con `X-Internal-Token` válido"""
+    return parse_lane(headers, trusted=is_internal_caller(headers.get('X-Internal-Token')))
+
+# =====================================================================
+# Salud
+# =====================================================================
+
+
+def health() -> Response:
+    """Endpoint de salud del servicio"""
+    if predictor is None:
+        if startup_state['status'] == 'starting':
+            # Liveness: el proceso está vivo aunque los modelos sigan cargando
+            return {
+                'status': 'starting',
+                'message': 'Cargando modelos',
+                'startup': startup_timer.summary()
+            }, 200, {}
+        return {
+            'status': 'error',
+            'message': 'Sistema no inicializado',
+            'error': startup_state['error']
+        }, 500, {}
+
+    # Obtener información de especies soportadas
+    species_info = predictor.get_supported_species()
+
+    return {
+        'status': 'healthy',
+        'version': '2.0.0',
+        'features': ['multi_species', 'breed_prediction', 'species_detection'],
+        'supported_species': list(species_info.keys()),
+        'species_details': species_info,
+        'total_breeds': sum(info['breeds_count'] for info in species_info.values()),
+        'admission': admission.get_stats(),
+        'prediction_cache': prediction_cache.get_stats(),
+        'tensor_store': tensor_store.get_stats() if tensor_store else None,
+        'startup': startup_timer.summary()
+    }, 200, {}
+
+
+def ready() -> Response:
+    """Readiness: 200 solo cuando los modelos están cargados"""
+    if predictor is None or not predictor.is_ready():
+        return service_unavailable({'ready': False, 'error': startup_state['error']})
+    return {'ready': True, 'backend': INFERENCE_BACKEND}, 200, {}
+
+# =====================================================================
+# Predicción
+# =====================================================================
+
+
+def format_prediction_response(result):
+    """Respuesta de /predict para una predicción exitosa"""
+    response = {
+        'success': True,
+        'species': result['species'],
+        'species_confidence': result['species_confidence'],
+        'breed': result['breed'],
+        'confidence': result['breed_confidence'],  # Mantener compatibilidad
+        'breed_confidence': result['breed_confidence'],
+        'top_5_predictions': result['top_5_predictions'],
+        'model_info': result['model_info'],
+        'additional_info': result.get('additional_info', {})
+    }
+
+    # GIF/WebP animado o vídeo: resumen del muestreo de fotogramas
+    if 'frames' in result:
+        response['frames'] = result['frames']
+
+    # Para compatibilidad con frontend existente (solo perros)
+    if result['species'] == 'dog':
+        # Mantener formato original para perros
+        dog_config = predictor.species_manager.get_species_config('dog')
+        response['model_info'].update({
+            'architecture': 'MobileNetV2',
+            'dataset': 'Stanford Dogs Dataset',
+            'num_classes': result['model_info'].get('total_breeds', 0),
+            'validation_accuracy': dog_config.metrics.get('top1_accuracy') if dog_config else None
+        })
+
+    return response
+
+
+def preprocess(image_bytes: bytes, key: Optional[str] = None):
+    """
+    Decodificar en el pool de preprocesado: acota CPU y memoria de decodificación.
+    Con almacén de tensores, una imagen ya vista se lee del shard sin decodificar
+    """
+    if tensor_store is None:
+        return preprocess_pool.submit(predictor._preprocess_image, image_bytes).result()
+    key = key or content_hash(image_bytes)
+    image = tensor_store.get(key)
+    if image is None:
+        image = preprocess_pool.submit(decode_image, image_bytes).result()
+        # Sin flush: el kernel escribe las páginas; el índice se añade después del tensor
+        tensor_store.put(key, image, flush=False)
+    return normalize_batch(image[np.newaxis])
+
+
+def predict_image(image_bytes: bytes, lane: str, deadline: float,
+                  model_variant: Optional[str]) -> Response:
+    """
+    Predicción multi-especies de una imagen. La decodificación no ocupa un hueco
+    de inferencia; el trabajo caducado se descarta en admit
+    """
+    request_start = time.perf_counter()
+    cache_key = (content_hash(image_bytes), model_variant or 'default')
+    cached = prediction_cache.get(cache_key)
+    if cached is not None:
+        print("⚡ Predicción servida desde caché")
+        payload, status = cached
+        log_prediction(payload, request_start, cache_hit=True)
+        return payload, status, {'X-Cache': 'HIT'}
+
+    inference_ms = None
+    try:
+        frames = open_frames(image_bytes)
+        if frames is not None:
+            result = predict_clip(frames, lane, deadline, model_variant)
+        else:
+            image_array = preprocess(image_bytes, cache_key[0])
+            with admission.admit(lane, deadline), profiler.around_predict():
+                inference_start = time.perf_counter()
+                result = predictor.predict_batch(image_array, model_variant)[0]
+                inference_ms = (time.perf_counter() - inference_start) * 1000
+            # Solo encola: el candidato se ejecuta después en su hilo de baja prioridad
+            if shadow is not None and result.get('success') \
+                    and result['model_info']['breed_model_variant'] == 'default':
+                shadow.submit(image_array, result, predictor.get_species_breeds(result['species']),
+                              inference_ms)
+    except (AdmissionRejected, UploadRejected):
+        raise
+    except Exception as e:
+        print(f"❌ Error en predicción completa: {e}")
+        result = {
+            'success': False,
+            'error': 'prediction_failed',
+            'message': f'Error interno en predicción: {str(e)}'
+        }
+
+    # Si hay error, retornarlo (la especie no detectada también se cachea)
+    if not result.get('success', False):
+        if result.get('error') == 'species_not_detected':
+            prediction_cache.put(cache_key, (result, 400))
+        log_prediction(result, request_start, inference_ms)
+        return result, 400, {'X-Cache': 'MISS'}
+
+    # Formatear respuesta exitosa
+    response = format_prediction_response(result)
+    prediction_cache.put(cache_key, (response, 200))
+    log_prediction(response, request_start, inference_ms)
+
+    print(f"✅ Predicción exitosa: {result['species']} - {result['breed']}")
+    print("="*60 + "\n")
+
+    return response, 200, {'X-Cache': 'MISS'}
+
+
+def log_prediction(result: Dict, request_start: float, inference_ms: Optional[float] = None,
+                   cache_hit: bool = False):
+    """Encolar la predicción en el log (O(1); lo escribe el hilo del log)"""
+    if prediction_log is None:
+        return
+    model = None
+    if result.get('success'):
+        config = predictor.species_manager.get_species_config(result['species'])
+        model_file = (config.model_file if config else None) or 'placeholder'
+        model = f"{result['species']}/{model_file}/{result['model_info'].get('breed_model_variant', 'default')}"
+    prediction_log.record(result, model, (time.perf_counter() - request_start) * 1000, inference_ms, cache_hit)
+
+
+def predict_clip(frames, lane: str, deadline: float, model_variant: Optional[str]) -> Dict:
+    """
+    GIF/WebP animado o vídeo: inferir una muestra dispersa de fotogramas por
+    rondas (un batch por ronda) hasta que la predicción agregada es confiable
+    """
+    indices, results = [], []
+    early_stop = False
+    for round_indices in sampling_rounds(frames.frame_count):
+        # Solo los índices realmente decodificados: deben ir a la par que los resultados
+        decoded, batch = preprocess_pool.submit(frames.decode, round_indices).result()
+        if not decoded:
+            continue
+        with admission.admit(lane, deadline), profiler.around_predict():
+            results += predictor.predict_batch(normalize_batch(batch), model_variant)
+        indices += decoded
+        aggregated = aggregate_frame_results(indices, results)
+        if is_confident(aggregated):
+            early_stop = len(indices) < min(frames.frame_count, CLIP_MAX_FRAMES)
+            break
+
+    if not indices:
+        raise UploadRejected('invalid_image', 'No se pudo decodificar ningún fotograma del vídeo')
+    print(f"🎞️ {len(indices)}/{frames.frame_count} fotogramas inferidos"
+          f"{' (parada temprana)' if early_stop else ''}")
+    frames_info = {
+        'total': frames.frame_count,
+        'sampled': len(indices),
+        'early_stop': early_stop,
+        'per_frame': aggregated.pop('per_frame')
+    }
+    if aggregated.get('success'):
+        aggregated['frames'] = frames_info
+    return aggregated
+
+
+def predict_raw_tensor(payload, lane: str, deadline: float, model_variant: Optional[str]) -> Response:
+    """
+    /predict con cuerpo application/octet-stream (ver tensor_ingest.py):
+    sin decodificación de imagen y con varias imágenes por payload
+    """
+    try:
+        image_array = decode_raw_tensor(payload, MAX_RAW_BATCH)
+    except RawTensorError as e:
+        return {'success': False, 'error': 'invalid_tensor', 'message': str(e)}, 400, {}
+
+    with admission.admit(lane, deadline), profiler.around_predict():
+        results = predictor.predict_batch(image_array, model_variant)
+
+    formatted = [format_prediction_response(r) if r.get('success') else r for r in results]
+    print(f"✅ Predicción de tensores crudos: {len(formatted)} imágenes")
+    if len(formatted) == 1:
+        result = formatted[0]
+        return result, (200 if result.get('success') else 400), {}
+    return {'success': True, 'count': len(formatted), 'results': formatted}, 200, {}
+
+
+def predict_regions(image_bytes: bytes, lane: str, deadline: float,
+                    model_variant: Optional[str]) -> Response:
+    """
+    Varias mascotas en una imagen: una entrada por región (caja relativa
+    x0, y0, x1, y1) con la misma predicción que /predict
+    """
+    if not hasattr(predictor, 'predict_regions'):
+        return {
+            'success': False,
+            'error': 'regions_unavailable',
+            'message': 'La detección de varias mascotas no está disponible con el servidor de inferencia compartido'
+        }, 501, {}
+
+    image, image_array = preprocess_pool.submit(load_region_image, image_bytes).result()
+    with admission.admit(lane, deadline), profiler.around_predict():
+        results = predictor.predict_regions(image, image_array, model_variant)
+
+    regions = []
+    for result in results:
+        region = format_prediction_response(result) if result.get('success') else dict(result)
+        region['box'] = result['box']
+        region['region_score'] = result['region_score']
+        regions.append(region)
+    detected = sum(1 for region in regions if region.get('success'))
+    print(f"✅ Predicción por regiones: {detected} mascotas en {len(regions)} regiones")
+
+    return {
+        'success': detected > 0,
+        'count': detected,
+        'regions': regions
+    }, (200 if detected else 400), {}
+
+
+def predict_species(image_bytes: bytes, lane: str, deadline: float) -> Response:
+    """Detectar solo la especie (sin raza específica)"""
+    image_array = preprocess(image_bytes)
+    with admission.admit(lane, deadline), profiler.around_predict():
+        species, confidence = predictor.detect_species(image_array)
+
+    return {
+        'success': True,
+        'species': species.value,
+        'confidence': confidence,
+        'species_name': species.value.title()
+    }, 200, {}
+
+# =====================================================================
+# Metadatos
+# =====================================================================
+
+
+def breeds(species_param: str) -> Response:
+    """Razas soportadas de una especie (o de todas con species=all)"""
+    species_info = predictor.get_supported_species()
+
+    if species_param == 'all':
+        # Retornar todas las especies y sus razas
+        return {
+            'success': True,
+            'species': species_info,
+            'total_species': len(species_info),
+            'total_breeds': sum(info['breeds_count'] for info in species_info.values())
+        }, 200, {}
+
+    # Retornar solo una especie específica (compatibilidad)
+    breeds_species = species_param if species_param in species_info else 'dog'
+    species_data = species_info.get(breeds_species)
+
+    if species_data:
+        return {
+            'success': True,
+            # Lista completa ya ordenada en el índice (el resumen solo trae las 10 primeras)
+            'breeds': predictor.breed_index.sorted_breeds.get(breeds_species, []),
+            'total': species_data['breeds_count'],
+            'species': species_param,
+            'model_status': species_data['model_status']
+        }, 200, {}
+    return {
+        'success': False,
+        'error': f'Especie no soportada: {species_param}'
+    }, 400, {}
+
+
+def breed_search(query: str, species_param: Optional[str], limit_param: Optional[str]) -> Response:
+    """Autocompletado de razas: coincidencias ordenadas con especie e índice de clase"""
+    try:
+        limit = max(1, min(int(limit_param or 10), 50))
+    except ValueError:
+        limit = 10
+    if not query.strip():
+        return {
+            'success': False,
+            'error': 'missing_query',
+            'message': 'Indica el texto a buscar con el parámetro q'
+        }, 400, {}
+    if species_param and species_param not in predictor.breed_index.sorted_breeds:
+        return {
+            'success': False,
+            'error': f'Especie no soportada: {species_param}'
+        }, 400, {}
+
+    matches = predictor.search_breeds(query, species_param or None, limit)
+    return {
+        'success': True,
+        'query': query,
+        'species': species_param or 'all',
+        'matches': matches,
+        'total': len(matches)
+    }, 200, {}
+
+
+def species() -> Response:
+    """Información sobre especies soportadas"""
+    species_info = predictor.get_supported_species()
+
+    return {
+        'success': True,
+        'supported_species': species_info,
+        'total_species': len(species_info),
+        'capabilities': {
+            'species_detection': True,
+            'breed_prediction': True,
+            'multi_species': True
+        }
+    }, 200, {}
+
+
+def model_info() -> Response:
+    """Información detallada del modelo"""
+    species_info = predictor.get_supported_species()
+    dog_metrics = species_info.get('dog', {}).get('metrics', {})
+
+    return {
+        'success': True,
+        'version': '2.0.0',
+        'architecture': 'Multi-Species MobileNetV2',
+        'species_detector': 'MobileNetV2 + ImageNet',
+        'supported_species': species_info,
+        'features': [
+            'Detección automática de especies',
+            'Predicción de razas específicas',
+            'Soporte para perros, gatos, aves y conejos',
+            'API compatible con versión anterior'
+        ],
+        'performance': {
+            'dog_breeds': {
+                'accuracy': dog_metrics.get('top1_accuracy'),
+                'top5_accuracy': dog_metrics.get('top5_accuracy'),
+                'accuracy_source': dog_metrics.get('source'),
+                'dataset': dog_metrics.get('dataset') or 'Stanford Dogs Dataset',
+                'breeds_count': species_info.get('dog', {}).get('breeds_count', 0)
+            },
+            'species_detection': {
+                'method': 'ImageNet pre-trained classes',
+                'confidence_threshold': 0.15
+            }
+        }
+    }, 200, {}
+
+
+def print_banner(server: str, port: int):
+    """Resumen de especies y endpoints al arrancar"""
+    print("\n" + "="*60)
+    print("🐾 Pet ID AI - Servicio Multi-Especies")
+    print("="*60)
+
+    if predictor:
+        species_info = predictor.get_supported_species()
+        print("📊 Especies soportadas:")
+        for species_name, info in species_info.items():
+            status = "✅" if info['model_status'] == 'trained' else "🔄"
+            print(f"  {status} {species_name.title()}: {info['breeds_count']} razas")
+
+        print(f"\n🎯 Total de razas: {sum(info['breeds_count'] for info in species_info.values())}")
+    elif startup_state['status'] == 'starting':
+        print("🔄 Modelos cargándose en segundo plano (GET /health ya responde)")
+    else:
+        print("❌ Sistema no inicializado correctamente")
+
+    print("="*60)
+    print(f"🌐 Servidor {server} iniciando en http://localhost:{port}")
+    print("📚 Endpoints disponibles:")
+    print("  POST /predict - Predicción multi-especies")
+    print("  POST /predict/species - Solo detección de especie")
+    print("  GET  /breeds - Obtener razas (por especie)")
+    print("  GET  /species - Información de especies")
+    print("  GET  /model/info - Información del modelo")
+    print("  GET  /health - Estado del servicio (liveness)")
+    print("  GET  /ready - Modelos cargados (readiness)")
+    print("="*60 + "\n")
@@ -0,0 +1,194 @@
+"""
+👥 Evaluación en sombra de un modelo candidato con tráfico real
+Una fracción de las predicciones de `/predict` se repite con un modelo de
+razas candidato (nuevo entrenamiento, variante cuantizada u otro backend)
+fuera del camino crítico: el servicio solo encola el tensor ya preprocesado
+y un único hilo de baja prioridad lo infiere después, respetando un
+presupuesto de CPU. Si la cola está llena o la CPU agotada, la muestra se
+descarta: la latencia de los usuarios no cambia.
+
+El tensor puede llegar en uint8 (cliente del servidor de inferencia): se
+normaliza en el hilo de la sombra, no en el de la petición.
+
+Se registran acuerdo en la raza top-1, solapamiento del top-5, diferencias de
+confianza y latencias de ambos modelos (`GET /admin/shadow`; las medias y
+percentiles son de las últimas 1000 comparaciones).
+
+Variables de entorno:
+    PET_AI_SHADOW_MODEL        modelo candidato (relativo a model_data/); vacío = desactivado
+    PET_AI_SHADOW_SPECIES      especie del candidato (dog)
+    PET_AI_SHADOW_BACKEND      backend del candidato (por defecto el del servicio)
+    PET_AI_SHADOW_SAMPLE_RATE  fracción de peticiones muestreadas (0.1)
+    PET_AI_SHADOW_CPU_BUDGET   núcleos que puede consumir la sombra en promedio (0.25)
+    PET_AI_SHADOW_QUEUE        muestras pendientes como máximo (16)
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from inference_backends import create_backend
+from multi_species_predictor import normalize_batch
+
+SHADOW_MODEL = os.environ.get('PET_AI_SHADOW_MODEL', '')
+SHADOW_SPECIES = os.environ.get('PET_AI_SHADOW_SPECIES', 'dog')
+SHADOW_BACKEND = os.environ.get('PET_AI_SHADOW_BACKEND', '')
+SHADOW_SAMPLE_RATE = float(os.environ.get('PET_AI_SHADOW_SAMPLE_RATE', '0.1'))
+SHADOW_CPU_BUDGET = float(os.environ.get('PET_AI_SHADOW_CPU_BUDGET', '0.25'))
+SHADOW_QUEUE = int(os.environ.get('PET_AI_SHADOW_QUEUE', '16'))
+
+# Muestras más antiguas que esto se descartan (el tráfico ya no es "actual")
+MAX_SAMPLE_AGE = 30.0
+LATENCY_WINDOW = 1000
+LOWEST_PRIORITY = 19
+
+
+def percentile(values, q: float) -> Optional[float]:
+    return round(float(np.percentile(np.asarray(values), q)), 2) if values else None
+
+
+class ShadowEvaluator:
+    """
+    Cola acotada + un hilo de baja prioridad (nice 19) que ejecuta el candidato
+    y compara con el resultado principal. Tras cada inferencia duerme lo
+    necesario para no superar `cpu_budget` núcleos de media.
+    """
+
+    def __init__(self, model_data_path: str, model_file: str, backend_name: str,
+                 primary_backend=None, species: str = SHADOW_SPECIES, sample_rate: float = SHADOW_SAMPLE_RATE,
+                 cpu_budget: float = SHADOW_CPU_BUDGET, max_queue: int = SHADOW_QUEUE,
+                 busy: Optional[Callable[[], bool]] = None, cost_scale: float = 1.0):
+        self.model_path = os.path.join(model_data_path, model_file)
+        self.model_file = model_file
+        self.species = species
+        self.sample_rate = sample_rate
+        self.cpu_budget = max(cpu_budget, 0.01)
+        self.busy = busy or (lambda: False)
+        self.model = None
+
+        # Backend propio con un hilo para que el coste sea medible; TensorFlow
+        # fija sus hilos por proceso, así que con Keras se comparte el del
+        # servicio y el coste se escala por sus hilos (`cost_scale`)
+        if backend_name == 'keras' and getattr(primary_backend, 'name', None) == 'keras':
+            self.backend = primary_backend
+            self.cost_scale = cost_scale
+        else:
+            self.backend = create_backend(backend_name, model_data_path,
+                                          {'intra_op_threads': 1, 'inter_op_threads': 1})
+            self.cost_scale = 1.0
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'sampled': 0, 'compared': 0, 'agreements': 0, 'dropped_queue_full': 0,
+                       'dropped_stale': 0, 'errors': 0, 'throttled_seconds': 0.0}
+        self._confidence_deltas: deque = deque(maxlen=LATENCY_WINDOW)
+        self._top5_overlap: deque = deque(maxlen=LATENCY_WINDOW)
+        self._primary_latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._shadow_latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._last_error: Optional[str] = None
+        self._thread = threading.Thread(target=self._worker, name='shadow-eval', daemon=True)
+        self._thread.start()
+
+    def submit(self, image_array: np.ndarray, primary_result: Dict, labels: List[str],
+               primary_latency_ms: float):
+        """Encolar una muestra (O(1), nunca bloquea al llamador)"""
+        if primary_result.get('species') != self.species or random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((time.monotonic(), image_array, primary_result, labels, primary_latency_ms))
+            with self._lock:
+                self._stats['sampled'] += 1
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped_queue_full'] += 1
+
+    def _worker(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), LOWEST_PRIORITY)
+        except (AttributeError, OSError):
+            pass  # sin prioridad por hilo en esta plataforma: queda el presupuesto de CPU
+
+        while True:
+            enqueued, image_array, primary_result, labels, primary_latency_ms = self._queue.get()
+            # Ceder mientras haya peticiones de usuarios esperando hueco
+            while self.busy() and time.monotonic() - enqueued < MAX_SAMPLE_AGE:
+                time.sleep(0.01)
+            if time.monotonic() - enqueued >= MAX_SAMPLE_AGE:
+                with self._lock:
+                    self._stats['dropped_stale'] += 1
+                continue
+
+            start = time.perf_counter()
+            try:
+                if self.model is None:
+                    self.model = self.backend.load_model(self.model_path)
+                    print(f"👥 Modelo en sombra cargado: {self.model_file} ({self.backend.name})")
+                # Con PET_AI_INFERENCE_SHM el servicio preprocesa a uint8 (se normaliza al escribir en el slot)
+                if image_array.dtype == np.uint8:
+                    image_array = normalize_batch(image_array)
+                start = time.perf_counter()
+                probabilities = np.asarray(self.model.predict(image_array))[0]
+                elapsed = time.perf_counter() - start
+                self._record(probabilities, primary_result, labels, primary_latency_ms, elapsed * 1000)
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._stats['errors'] += 1
+                    self._last_error = str(e)
+
+            # Presupuesto: coste / presupuesto = tiempo mínimo por muestra
+            pause = elapsed * self.cost_scale / self.cpu_budget - elapsed
+            if pause > 0:
+                with self._lock:
+                    self._stats['throttled_seconds'] += pause
+                time.sleep(pause)
+
+    def _record(self, probabilities: np.ndarray, primary_result: Dict, labels: List[str],
+                primary_latency_ms: float, shadow_latency_ms: float):
+        if len(probabilities) != len(labels):
+            raise ValueError(f"El candidato tiene {len(probabilities)} clases y el principal {len(labels)}")
+        top_5 = np.argpartition(probabilities, -5)[-5:] if len(labels) > 5 else np.arange(len(labels))
+        top_5 = top_5[np.argsort(probabilities[top_5])[::-1]]
+        shadow_breed = labels[top_5[0]]
+        primary_top_5 = {p['breed'] for p in primary_result['top_5_predictions']}
+        overlap = len(primary_top_5 & {labels[i] for i in top_5}) / max(len(primary_top_5), 1)
+
+        with self._lock:
+            self._stats['compared'] += 1
+            self._stats['agreements'] += shadow_breed == primary_result['breed']
+            self._confidence_deltas.append(float(probabilities[top_5[0]]) - primary_result['breed_confidence'])
+            self._top5_overlap.append(overlap)
+            self._primary_latencies.append(primary_latency_ms)
+            self._shadow_latencies.append(shadow_latency_ms)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            compared = self._stats['compared']
+            deltas = np.asarray(self._confidence_deltas)
+            return {
+                'model_file': self.model_file,
+                'species': self.species,
+                'backend': self.backend.name,
+                'sample_rate': self.sample_rate,
+                'cpu_budget': self.cpu_budget,
+                'queued': self._queue.qsize(),
+                **{key: round(value, 2) if isinstance(value, float) else value
+                   for key, value in self._stats.items()},
+                'agreement_rate': round(self._stats['agreements'] / compared, 4) if compared else None,
+                'top5_overlap': round(float(np.mean(self._top5_overlap)), 4) if compared else None,
+                'confidence_delta_mean': round(float(np.mean(deltas)), 4) if compared else None,
+                'confidence_delta_abs_mean': round(float(np.mean(np.abs(deltas))), 4) if compared else None,
+                'latency_ms': {
+                    'primary_p50': percentile(self._primary_latencies, 50),
+                    'primary_p95': percentile(self._primary_latencies, 95),
+                    'shadow_p50': percentile(self._shadow_latencies, 50),
+                    'shadow_p95': percentile(self._shadow_latencies, 95)
+                },
+                'last_error': self._last_error
+            }
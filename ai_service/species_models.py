@@ -6,7 +6,10 @@ Configuraciones y datos para cada tipo de animal soportado
 import json
 import os
 from typing import Dict, List, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+# Métricas publicadas por evaluate_model.py --publish
+EVALUATION_REPORT_FILE = 'evaluation_report.json'
 
 @dataclass
 class SpeciesModelConfig:
@@ -19,6 +22,11 @@ class SpeciesModelConfig:
     confidence_threshold: float
     status: str  # 'trained', 'placeholder', 'training'
     description: str
+    variants: Dict[str, str] = field(default_factory=dict)  # variante -> archivo de modelo
+    metrics: Dict = field(default_factory=dict)  # precisión medida del modelo desplegado
+    # TTA adaptativo: solo si la confianza top-1 o el margen top-1/top-2 quedan por debajo
+    tta_min_confidence: float = 0.4
+    tta_min_margin: float = 0.1
 
 class SpeciesModelsManager:
     """Gestor de modelos específicos por especie"""
@@ -42,7 +50,10 @@ class SpeciesModelsManager:
                 imagenet_classes=list(range(151, 269)),  # Clases 151-268 son perros
                 confidence_threshold=0.15,
                 status='trained',
-                description='Modelo entrenado con Stanford Dogs Dataset - 120+ razas'
+                description='Modelo entrenado con Stanford Dogs Dataset - 120+ razas',
+                # 120 razas con pares muy parecidos: más margen exigido
+                tta_min_confidence=0.45,
+                tta_min_margin=0.15
             ),
             
             'cat': SpeciesModelConfig(
@@ -79,8 +90,110 @@ class SpeciesModelsManager:
             )
         }
         
+        self._apply_trained_artifacts(configs)
+        self._apply_model_variants(configs)
+        self._apply_model_metrics(configs)
+        
         return configs
     
+    def _apply_trained_artifacts(self, configs: Dict[str, SpeciesModelConfig]):
+        """
+        Marcar como entrenadas las especies cuyos artefactos generó
+        training_pipeline.py (`{especie}_model.keras` + `{especie}_labels.json`)
+        """
+        for species, config in configs.items():
+            labels_file = f"{species}_labels.json"
+            labels_path = os.path.join(self.model_data_path, labels_file)
+            if not os.path.exists(labels_path):
+                continue
+            try:
+                with open(labels_path, 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+                # Los archivos placeholder son listas planas sin modelo asociado
+                if not isinstance(metadata, dict) or not metadata.get('model_file'):
+                    continue
+                model_file = metadata['model_file']
+                if not os.path.exists(os.path.join(self.model_data_path, model_file)):
+                    print(f"⚠️ {labels_file} apunta a {model_file}, que no existe")
+                    continue
+                
+                config.model_file = model_file
+                config.labels_file = labels_file
+                config.breeds = metadata['class_names']
+                config.status = 'trained'
+                config.tta_min_confidence = metadata.get('tta_min_confidence', config.tta_min_confidence)
+                config.tta_min_margin = metadata.get('tta_min_margin', config.tta_min_margin)
+                accuracy = metadata.get('validation_accuracy')
+                accuracy_text = f" - val. accuracy {accuracy:.1%}" if accuracy is not None else ''
+                config.description = (f"Modelo entrenado con {metadata.get('dataset', 'dataset propio')} - "
+                                      f"{len(config.breeds)} razas{accuracy_text}")
+            except Exception as e:
+                print(f"⚠️ Error leyendo artefactos de {species}: {e}")
+    
+    def _apply_model_variants(self, configs: Dict[str, SpeciesModelConfig]):
+        """
+        Registrar modelos alternativos por especie (p.ej. el estudiante compacto
+        de distill_model.py) desde `model_variants.json`
+        """
+        variants_path = os.path.join(self.model_data_path, 'model_variants.json')
+        if not os.path.exists(variants_path):
+            return
+        try:
+            with open(variants_path, 'r', encoding='utf-8') as f:
+                registry = json.load(f)
+            for species, variants in registry.items():
+                config = configs.get(species)
+                if config is None:
+                    continue
+                for variant, info in variants.items():
+                    model_file = info['model_file']
+                    if os.path.exists(os.path.join(self.model_data_path, model_file)):
+                        config.variants[variant] = model_file
+                    else:
+                        print(f"⚠️ Variante {species}/{variant}: {model_file} no encontrado")
+        except Exception as e:
+            print(f"⚠️ Error leyendo model_variants.json: {e}")
+    
+    def _apply_model_metrics(self, configs: Dict[str, SpeciesModelConfig]):
+        """
+        Precisión de cada modelo entrenado: la del informe de evaluate_model.py
+        si corresponde al modelo desplegado, si no la de validación guardada
+        al entrenar en el archivo de etiquetas
+        """
+        report = {}
+        report_path = os.path.join(self.model_data_path, EVALUATION_REPORT_FILE)
+        if os.path.exists(report_path):
+            try:
+                with open(report_path, 'r', encoding='utf-8') as f:
+                    report = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Error leyendo {EVALUATION_REPORT_FILE}: {e}")
+        
+        for species, config in configs.items():
+            if config.status != 'trained':
+                continue
+            evaluation = report.get(species)
+            if evaluation and evaluation.get('model_file') == config.model_file:
+                config.metrics = {key: value for key, value in evaluation.items() if key != 'model_file'}
+                config.metrics['source'] = 'evaluation'
+                continue
+            if not config.labels_file:
+                continue
+            labels_path = os.path.join(self.model_data_path, config.labels_file)
+            if not os.path.exists(labels_path):
+                continue
+            try:
+                with open(labels_path, 'r', encoding='utf-8') as f:
+                    metadata = json.load(f)
+                if isinstance(metadata, dict) and metadata.get('validation_accuracy') is not None:
+                    config.metrics = {
+                        'top1_accuracy': round(metadata['validation_accuracy'], 4),
+                        'dataset': metadata.get('dataset'),
+                        'source': 'training'
+                    }
+            except Exception as e:
+                print(f"⚠️ Error leyendo métricas de {species}: {e}")
+    
     def _load_dog_breeds(self) -> List[str]:
         """Cargar razas de perros desde el archivo existente"""
         try:
@@ -209,6 +322,13 @@ class SpeciesModelsManager:
             return os.path.join(self.model_data_path, config.model_file)
         return None
     
+    def get_variant_model_path(self, species: str, variant: str) -> Optional[str]:
+        """Obtener ruta de un modelo alternativo (variante) para una especie"""
+        config = self.get_species_config(species)
+        if config and variant in config.variants:
+            return os.path.join(self.model_data_path, config.variants[variant])
+        return None
+    
     def get_labels_path(self, species: str) -> Optional[str]:
         """Obtener ruta del archivo de etiquetas para una especie"""
         config = self.get_species_config(species)
@@ -247,6 +367,8 @@ class SpeciesModelsManager:
                 'name': config.name,
                 'breeds_count': len(config.breeds),
                 'model_status': config.status,
+                'model_variants': ['default'] + sorted(config.variants),
+                'metrics': config.metrics,
                 'description': config.description,
                 'breeds': config.breeds[:10] if len(config.breeds) > 10 else config.breeds,  # Primeras 10 razas
                 'has_more_breeds': len(config.breeds) > 10
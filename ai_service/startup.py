@@ -0,0 +1,46 @@
+"""
+⏱️ Medición del arranque del servicio por fases
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Instante de import de este módulo: aproxima el inicio del proceso
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """Registra la duración de cada fase del arranque y la imprime al terminar"""
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = PROCESS_START if start is None else start
+        self.phases: List[Dict] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - phase_start) * 1000
+            self.phases.append({'phase': name, 'ms': round(elapsed_ms, 1)})
+            print(f"⏱️ {name}: {elapsed_ms:.0f} ms")
+
+    def record_since(self, name: str, start: float):
+        """Registrar una fase que empezó en `start` (perf_counter) y termina ahora"""
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.phases.append({'phase': name, 'ms': round(elapsed_ms, 1)})
+        print(f"⏱️ {name}: {elapsed_ms:.0f} ms")
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def summary(self) -> Dict:
+        return {'phases': list(self.phases), 'total_ms': self.total_ms()}
+
+    def print_summary(self):
+        print("⏱️ Arranque por fases:")
+        for item in self.phases:
+            print(f"   {item['phase']:<28}{item['ms']:>10.0f} ms")
+        print(f"   {'total desde el inicio':<28}{self.total_ms():>10.0f} ms")
@@ -0,0 +1,97 @@
+"""
+📥 Ingesta de tensores crudos pre-redimensionados
+Formato `application/octet-stream` para llamadores internos de confianza
+(backend, jobs batch) que ya envían imágenes RGB 224x224: sin decodificación
+JPEG ni copias intermedias.
+
+Cabecera (16 bytes, little-endian) seguida de los píxeles en orden NHWC:
+
+    magic     4s   b'PTNS'
+    version   B    1
+    dtype     B    1 = uint8 RGB 0-255, 2 = float32 ya normalizado a [-1, 1]
+    channels  H    3
+    count     I    número de imágenes
+    height    H    224
+    width     H    224
+"""
+
+import struct
+from typing import Tuple
+
+import numpy as np
+
+from multi_species_predictor import IMAGE_SIZE, normalize_batch
+
+RAW_TENSOR_MIMETYPE = 'application/octet-stream'
+HEADER = struct.Struct('<4sBBHIHH')
+MAGIC = b'PTNS'
+VERSION = 1
+DTYPES = {1: np.uint8, 2: np.float32}
+DTYPE_CODES = {np.dtype(np.uint8): 1, np.dtype(np.float32): 2}
+
+
+class RawTensorError(ValueError):
+    """Payload crudo mal formado"""
+
+
+def read_body(stream, content_length: int) -> bytearray:
+    """
+    Leer el cuerpo directamente en un buffer preasignado (sin concatenar
+    chunks). Al ser un bytearray, las vistas NumPy sobre él son escribibles.
+    """
+    buffer = bytearray(content_length)
+    view = memoryview(buffer)
+    received = 0
+    while received < content_length:
+        read = stream.readinto(view[received:])
+        if not read:
+            raise RawTensorError(f"Cuerpo incompleto: {received} de {content_length} bytes")
+        received += read
+    return buffer
+
+
+def parse_header(payload) -> Tuple[np.dtype, int, int, int, int]:
+    if len(payload) < HEADER.size:
+        raise RawTensorError("Payload más corto que la cabecera")
+    magic, version, dtype_code, channels, count, height, width = HEADER.unpack_from(payload, 0)
+    if magic != MAGIC or version != VERSION:
+        raise RawTensorError("Cabecera de tensor desconocida")
+    if dtype_code not in DTYPES:
+        raise RawTensorError(f"dtype no soportado: {dtype_code}")
+    return np.dtype(DTYPES[dtype_code]), count, height, width, channels
+
+
+def decode_raw_tensor(payload, max_images: int = 64) -> np.ndarray:
+    """
+    Convertir el payload en un batch float32 (N, 224, 224, 3) listo para los
+    modelos. Los datos se leen con `np.frombuffer` (sin copia); uint8 se
+    normaliza en una única pasada hacia el batch float32 y float32 se usa tal cual.
+    """
+    dtype, count, height, width, channels = parse_header(payload)
+    if (height, width) != IMAGE_SIZE or channels != 3:
+        raise RawTensorError(f"Se esperaba {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}x3, "
+                             f"recibido {height}x{width}x{channels}")
+    if not 0 < count <= max_images:
+        raise RawTensorError(f"Número de imágenes fuera de rango (1-{max_images}): {count}")
+
+    expected = HEADER.size + count * height * width * channels * dtype.itemsize
+    if len(payload) != expected:
+        raise RawTensorError(f"Tamaño de payload {len(payload)} != {expected} esperado")
+
+    images = np.frombuffer(payload, dtype=dtype, count=count * height * width * channels,
+                           offset=HEADER.size).reshape(count, height, width, channels)
+    if dtype == np.float32:
+        return images
+    return normalize_batch(images)
+
+
+def encode_raw_tensor(images: np.ndarray) -> bytes:
+    """Serializar un batch (N, 224, 224, 3) uint8 o float32 en el formato de ingesta"""
+    if images.ndim == 3:
+        images = images[np.newaxis]
+    dtype_code = DTYPE_CODES.get(images.dtype)
+    if dtype_code is None:
+        raise RawTensorError(f"dtype no soportado: {images.dtype}")
+    count, height, width, channels = images.shape
+    header = HEADER.pack(MAGIC, VERSION, dtype_code, channels, count, height, width)
+    return header + np.ascontiguousarray(images).tobytes()
@@ -0,0 +1,339 @@
+"""
+🗄️ Almacén persistente de tensores preprocesados
+Cada imagen se decodifica y redimensiona una sola vez: el resultado uint8
+(224, 224, 3) se guarda por hash de contenido en shards `.npy` grandes que se
+abren con memmap, así el servicio, las herramientas de evaluación y el
+reentrenamiento leen vistas sin copiar ni volver a decodificar JPEG.
+
+Estructura del directorio (PET_AI_TENSOR_STORE, por defecto desactivado):
+    store.json           capacidad de cada shard
+    shard_00000.npy      (capacidad, 224, 224, 3) uint8, archivo disperso
+    index.jsonl          una línea por imagen: hash, shard, fila y ruta de origen
+
+El índice es de solo añadir y se escribe después del tensor: una fila sin
+línea en el índice no existe y se reutiliza. Varios procesos pueden escribir
+a la vez (bloqueo con fcntl sobre `index.lock`).
+
+Uso:
+    python tensor_store.py ingest ../backend/uploads/pets ../backend/uploads/posts
+    python tensor_store.py stats
+    python tensor_store.py rescore --output scores.jsonl --backend onnx
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from dataset_manifests import IMAGE_EXTENSIONS
+from multi_species_predictor import IMAGE_SIZE, decode_image, normalize_batch
+from prediction_cache import content_hash
+
+TENSOR_STORE_PATH = os.environ.get('PET_AI_TENSOR_STORE', '')
+# 4096 imágenes por shard: ~616 MB de archivo disperso
+SHARD_CAPACITY = int(os.environ.get('PET_AI_TENSOR_SHARD_IMAGES', '4096'))
+TENSOR_SHAPE = (*IMAGE_SIZE, 3)
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+
+
+class TensorStore:
+    """Tensores uint8 por hash de contenido en shards memmap con índice de solo añadir"""
+
+    def __init__(self, root: str, shard_capacity: int = SHARD_CAPACITY, writable: bool = True):
+        self.root = root
+        self.writable = writable
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.lock_path = os.path.join(root, 'index.lock')
+        meta_path = os.path.join(root, 'store.json')
+        if writable:
+            os.makedirs(root, exist_ok=True)
+            if not os.path.exists(meta_path):
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'shard_capacity': shard_capacity, 'shape': list(TENSOR_SHAPE)}, f)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.shard_capacity = json.load(f)['shard_capacity']
+
+        self._entries: Dict[str, Tuple[int, int]] = {}  # hash -> (shard, fila)
+        self._paths: Dict[str, Tuple[str, int, int]] = {}  # ruta -> (hash, tamaño, mtime_ns)
+        self._shards: Dict[int, np.ndarray] = {}
+        self._next = (0, 0)
+        self._offset = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._refresh()
+
+    # -----------------------------------------------------------------
+    # Índice y shards
+    # -----------------------------------------------------------------
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Leer las líneas del índice añadidas desde la última lectura (también por otros procesos)"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # línea a medio escribir
+                self._offset += len(line)
+                record = json.loads(line)
+                shard, row = record['shard'], record['row']
+                self._entries[record['hash']] = (shard, row)
+                if record.get('path'):
+                    self._paths[record['path']] = (record['hash'], record['size'], record['mtime_ns'])
+                self._next = max(self._next, (shard, row + 1))
+
+    def _shard(self, shard: int, create: bool = False) -> np.ndarray:
+        array = self._shards.get(shard)
+        if array is None:
+            path = os.path.join(self.root, f"shard_{shard:05d}.npy")
+            if create and not os.path.exists(path):
+                array = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                                  shape=(self.shard_capacity, *TENSOR_SHAPE))
+            else:
+                array = np.load(path, mmap_mode='r+' if self.writable else 'r')
+            self._shards[shard] = array
+        return array
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    # -----------------------------------------------------------------
+    # Lectura y escritura
+    # -----------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Vista (224, 224, 3) uint8 sobre el shard, sin copia; None si no está"""
+        location = self._entries.get(key)
+        if location is None:
+            with self._lock:
+                self._refresh()
+                location = self._entries.get(key)
+        if location is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        shard, row = location
+        return self._shard(shard)[row]
+
+    def put(self, key: str, image: np.ndarray, path: Optional[str] = None,
+            size: int = 0, mtime_ns: int = 0, flush: bool = True) -> bool:
+        """Guardar un tensor (una sola vez por hash); False si ya existía"""
+        if not self.writable:
+            raise PermissionError("Almacén de tensores abierto en solo lectura")
+        with self._lock, self._file_lock():
+            self._refresh()
+            exists = key in self._entries
+            if exists and (path is None or self._paths.get(path, (None,))[0] == key):
+                return False
+            if exists:
+                shard, row = self._entries[key]  # misma imagen en otra ruta: solo se indexa la ruta
+            else:
+                shard, row = self._next
+                if row >= self.shard_capacity:
+                    shard, row = shard + 1, 0
+                array = self._shard(shard, create=True)
+                array[row] = image
+                if flush:
+                    array.flush()
+            record = {'hash': key, 'shard': shard, 'row': row}
+            if path:
+                record.update(path=path, size=size, mtime_ns=mtime_ns)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+            self._refresh()
+            return not exists
+
+    def flush(self):
+        for array in self._shards.values():
+            if isinstance(array, np.memmap) and self.writable:
+                array.flush()
+
+    def load_file(self, path: str) -> np.ndarray:
+        """
+        Tensor de un archivo: por ruta (si tamaño y mtime no cambiaron) o por
+        hash sin decodificar; si no está, se decodifica y se guarda
+        """
+        stat = os.stat(path)
+        known = self._paths.get(path)
+        if known and known[1:] == (stat.st_size, stat.st_mtime_ns):
+            image = self.get(known[0])
+            if image is not None:
+                return image
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = content_hash(data)
+        image = self.get(key)
+        if image is None:
+            image = decode_image(data)
+        if self.writable:
+            self.put(key, image, path, stat.st_size, stat.st_mtime_ns, flush=False)
+        return image
+
+    def load_files(self, files: List[str], workers: int = 8) -> np.ndarray:
+        """Batch uint8 (N, 224, 224, 3) de varios archivos; solo decodifica los que faltan"""
+        images = np.empty((len(files), *TENSOR_SHAPE), dtype=np.uint8)
+
+        def load(index: int):
+            images[index] = self.load_file(files[index])
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(load, range(len(files))))
+        self.flush()
+        return images
+
+    def iter_batches(self, batch_size: int = 64) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """Recorrer todo el almacén por filas contiguas: (hashes, vista uint8 sin copia)"""
+        with self._lock:
+            self._refresh()
+            by_row = {location: key for key, location in self._entries.items()}
+        for shard in sorted({shard for shard, _ in by_row}):
+            rows = sorted(row for s, row in by_row if s == shard)
+            array = self._shard(shard)
+            for start in range(0, len(rows), batch_size):
+                chunk = rows[start:start + batch_size]
+                # Las filas se asignan en orden: el trozo suele ser contiguo
+                if chunk[-1] - chunk[0] == len(chunk) - 1:
+                    view = array[chunk[0]:chunk[-1] + 1]
+                else:
+                    view = array[chunk]
+                yield [by_row[(shard, row)] for row in chunk], view
+
+    def paths_by_hash(self) -> Dict[str, List[str]]:
+        result: Dict[str, List[str]] = {}
+        for path, (key, _, _) in self._paths.items():
+            result.setdefault(key, []).append(path)
+        return result
+
+    def get_stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'images': len(self._entries),
+            'paths': len(self._paths),
+            'shards': self._next[0] + 1 if self._entries else 0,
+            'shard_capacity': self.shard_capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def open_store(path: Optional[str] = TENSOR_STORE_PATH, writable: bool = True) -> Optional[TensorStore]:
+    """Almacén en `path` o None si no está configurado"""
+    if not path:
+        return None
+    return TensorStore(path, writable=writable)
+
+
+# =====================================================================
+# Comandos
+# =====================================================================
+
+def find_images(directories: List[str]) -> List[str]:
+    files = []
+    for directory in directories:
+        for dirpath, _, filenames in os.walk(directory):
+            files.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                         if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+    return files
+
+
+def ingest(store: TensorStore, directories: List[str], workers: int, chunk: int = 512):
+    files = find_images([os.path.abspath(d) for d in directories])
+    before = len(store)
+    start = time.perf_counter()
+    failed = 0
+
+    def load(path: str) -> bool:
+        try:
+            store.load_file(path)
+            return True
+        except Exception as e:
+            print(f"⚠️ {path}: {e}")
+            return False
+
+    for offset in range(0, len(files), chunk):
+        batch = files[offset:offset + chunk]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            failed += sum(not ok for ok in pool.map(load, batch))
+        store.flush()
+        print(f"   {min(offset + chunk, len(files))}/{len(files)} archivos")
+    print(f"✅ {len(store) - before} tensores nuevos ({len(store)} en total, {failed} archivos con error) "
+          f"en {time.perf_counter() - start:.1f}s")
+
+
+def rescore(store: TensorStore, args):
+    """Predecir todo el almacén con el modelo actual, sin decodificar imágenes"""
+    from multi_species_predictor import MultiSpeciesPredictor
+
+    predictor = MultiSpeciesPredictor(args.model_data, backend=args.backend)
+    if not predictor.is_ready():
+        raise SystemExit("❌ El predictor no está listo")
+    paths = store.paths_by_hash()
+    buffer = np.empty((args.batch_size, *TENSOR_SHAPE), dtype=np.float32)
+    count = 0
+    start = time.perf_counter()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for keys, images in store.iter_batches(args.batch_size):
+            results = predictor.predict_batch(normalize_batch(images, out=buffer[:len(images)]))
+            for key, result in zip(keys, results):
+                f.write(json.dumps({
+                    'hash': key,
+                    'paths': paths.get(key, []),
+                    'species': result.get('species'),
+                    'species_confidence': result.get('species_confidence'),
+                    'breed': result.get('breed'),
+                    'breed_confidence': result.get('breed_confidence'),
+                    'error': result.get('error')
+                }, ensure_ascii=False) + '\n')
+            count += len(keys)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {count} imágenes en {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} img/s) -> {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Almacén de tensores preprocesados (224x224 uint8)')
+    parser.add_argument('command', choices=('ingest', 'stats', 'rescore'))
+    parser.add_argument('directories', nargs='*', help='ingest: directorios de imágenes')
+    parser.add_argument('--store', default=TENSOR_STORE_PATH or os.path.join(MODEL_DATA_PATH, 'tensor_store'))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    parser.add_argument('--backend', default=os.environ.get('PET_AI_BACKEND', 'keras'))
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--output', default='scores.jsonl')
+    args = parser.parse_args()
+
+    store = TensorStore(args.store, writable=args.command == 'ingest' or not os.path.exists(args.store))
+    if args.command == 'ingest':
+        if not args.directories:
+            raise SystemExit("❌ Indica los directorios a ingerir")
+        ingest(store, args.directories, args.workers)
+    elif args.command == 'stats':
+        print(json.dumps(store.get_stats(), indent=2))
+    else:
+        rescore(store, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+🧪 Cabeceras que el router reenvía a las instancias
+    python -m pytest test_router.py
+"""
+
+import http.server
+import json
+import threading
+
+import pytest
+
+from router import CacheAffinityRouter, create_app
+
+
+class RecordingHandler(http.server.BaseHTTPRequestHandler):
+    """Instancia falsa: guarda las cabeceras recibidas y responde 200"""
+    received = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.received.append(dict(self.headers))
+        body = json.dumps({'success': True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    RecordingHandler.received = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RecordingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", RecordingHandler.received
+    server.shutdown()
+    server.server_close()
+
+
+def test_forwards_admission_and_auth_headers(upstream):
+    url, received = upstream
+    client = create_app(CacheAffinityRouter([url])).test_client()
+    headers = {
+        'X-Request-Priority': 'high',
+        'X-Request-Timeout': '12',
+        'X-Request-Deadline': '1900000000',
+        'X-Model-Variant': 'compact',
+        'X-Internal-Token': 'internal',
+        'X-Admin-Token': 'admin',
+        'X-Species-Hint': 'dog',
+        'Cookie': 'session=abc'
+    }
+
+    response = client.post('/predict', data=b'payload', headers=headers, content_type='application/octet-stream')
+
+    assert response.status_code == 200
+    assert response.headers['X-Upstream'] == url
+    forwarded = received[0]
+    for name in ('X-Request-Priority', 'X-Request-Timeout', 'X-Request-Deadline', 'X-Model-Variant',
+                 'X-Internal-Token', 'X-Admin-Token'):
+        assert forwarded.get(name) == headers[name]
+    assert forwarded['Content-Type'] == 'application/octet-stream'
+    # Solo se reenvía la lista explícita
+    assert 'X-Species-Hint' not in forwarded
+    assert 'Cookie' not in forwarded
+
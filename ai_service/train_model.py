@@ -12,9 +12,10 @@ import scipy.io
 IMAGE_SIZE = (224, 224)
 BATCH_SIZE = 16  # ⚠️ Reducido para mejor convergencia
 EPOCHS = 50
-BASE_PATH = r"C:\Users\LENOVO\Desktop\pet-id-ai\entrenamiento"
+# Rutas configurables por entorno (para otras especies usar training_pipeline.py)
+BASE_PATH = os.environ.get('STANFORD_DOGS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'entrenamiento'))
 IMAGES_PATH = os.path.join(BASE_PATH, "Images")
-MODEL_SAVE_PATH = r"C:\Users\LENOVO\Desktop\pet-id-ai\ai_service\model_data"
+MODEL_SAVE_PATH = os.environ.get('MODEL_SAVE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data'))
 
 def load_stanford_splits():
     """Carga los splits oficiales del Stanford Dogs Dataset"""
@@ -0,0 +1,219 @@
+"""
+🛡️ Validación de uploads en streaming
+Parser multipart incremental para `/predict` y `/predict/species`: mira los
+primeros bytes del archivo para identificar el formato y las dimensiones y
+rechaza lo que no es una imagen, lo que excede el tamaño y las "bombas" de
+píxeles antes de recibir el resto del cuerpo. Los clips de vídeo (MP4/WebM)
+solo se identifican aquí; sus dimensiones se comprueban al decodificar
+(frame_sampling.py).
+
+Límites (variables de entorno):
+    PET_AI_MAX_UPLOAD_MB      tamaño máximo del cuerpo (16)
+    PET_AI_MAX_IMAGE_PIXELS   ancho x alto máximo antes de decodificar (40 MP)
+    PET_AI_MAX_IMAGE_SIDE     lado máximo en píxeles (12000)
+"""
+
+import io
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get('PET_AI_MAX_UPLOAD_MB', '16')) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(os.environ.get('PET_AI_MAX_IMAGE_PIXELS', str(40_000_000)))
+MAX_IMAGE_SIDE = int(os.environ.get('PET_AI_MAX_IMAGE_SIDE', '12000'))
+
+# Bytes máximos para encontrar las dimensiones (EXIF y miniaturas pueden ir antes)
+MAX_HEADER_BYTES = 256 * 1024
+MAX_FIELD_BYTES = 4096
+MAX_PARTS = 16
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+SUPPORTED_FORMATS = 'JPEG, PNG, WebP, GIF, BMP, MP4, WebM'
+VIDEO_FORMATS = ('MP4', 'WEBM')
+MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'\x1a\x45\xdf\xa3', 'WEBM'),  # EBML (WebM/Matroska)
+)
+SNIFF_BYTES = 12
+
+
+def too_large_message(max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Mensaje del 413 con el límite configurado (`PET_AI_MAX_UPLOAD_MB`)"""
+    return f'El archivo es demasiado grande. Máximo {max_bytes / (1024 * 1024):g}MB.'
+
+
+class UploadRejected(Exception):
+    """Upload rechazado antes de decodificar (error y status HTTP para la respuesta)"""
+
+    def __init__(self, error: str, message: str, status: int = 400):
+        super().__init__(message)
+        self.error = error
+        self.message = message
+        self.status = status
+
+
+@dataclass
+class ImageInfo:
+    format: str
+    width: int
+    height: int
+
+
+def sniff_format(head: bytes) -> str:
+    """Identificar el formato por sus magic numbers"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if head[4:8] == b'ftyp':
+        return 'MP4'
+    for magic, image_format in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return image_format
+    raise UploadRejected('unsupported_format',
+                         f'El archivo no es una imagen soportada ({SUPPORTED_FORMATS})', 415)
+
+
+def probe_dimensions(data: bytes, image_format: str) -> Optional[Tuple[int, int]]:
+    """
+    Leer ancho y alto de la cabecera sin decodificar píxeles (PIL abre de forma
+    perezosa). None si faltan bytes para llegar a la cabecera.
+    """
+    try:
+        with Image.open(io.BytesIO(data), formats=[image_format]) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected('image_too_large', 'La imagen excede el número máximo de píxeles', 413)
+    except Exception:
+        return None
+
+
+def check_dimensions(width: int, height: int):
+    """Rechazar imágenes vacías, gigantes o con demasiados píxeles antes de decodificar"""
+    if width <= 0 or height <= 0:
+        raise UploadRejected('invalid_image', 'Dimensiones de imagen inválidas')
+    if max(width, height) > MAX_IMAGE_SIDE or width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected('image_too_large',
+                             f'Imagen de {width}x{height} demasiado grande '
+                             f'(máximo {MAX_IMAGE_SIDE}px por lado y {MAX_IMAGE_PIXELS // 1_000_000} MP)', 413)
+
+
+def validate_image_bytes(data: bytes) -> ImageInfo:
+    """Validar una imagen ya recibida completa (formato y dimensiones)"""
+    if len(data) < SNIFF_BYTES:
+        raise UploadRejected('invalid_image', 'Archivo demasiado corto para ser una imagen')
+    image_format = sniff_format(data[:SNIFF_BYTES])
+    if image_format in VIDEO_FORMATS:
+        return ImageInfo(image_format, 0, 0)
+    size = probe_dimensions(data[:MAX_HEADER_BYTES], image_format)
+    if size is None:
+        raise UploadRejected('invalid_image', 'No se pudo leer la cabecera de la imagen')
+    check_dimensions(*size)
+    return ImageInfo(image_format, *size)
+
+
+class StreamingImageUpload:
+    """
+    Recibir un multipart/form-data trozo a trozo con `feed()`. El archivo
+    `file_field` se valida en cuanto llegan sus primeros bytes; el resto de
+    archivos se descarta y los campos de texto se limitan a MAX_FIELD_BYTES.
+    La memoria por petición queda acotada por `max_bytes`.
+    """
+
+    def __init__(self, content_type: Optional[str], content_length: Optional[int],
+                 file_field: str = 'image', max_bytes: int = MAX_UPLOAD_BYTES):
+        if content_length is not None and content_length > max_bytes:
+            raise UploadRejected('file_too_large', too_large_message(max_bytes), 413)
+        mimetype, options = parse_options_header(content_type or '')
+        boundary = options.get('boundary')
+        if mimetype != 'multipart/form-data' or not boundary:
+            raise UploadRejected('bad_request', 'Se esperaba multipart/form-data')
+
+        self.decoder = MultipartDecoder(boundary.encode('latin-1'), max_parts=MAX_PARTS)
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.filename: Optional[str] = None
+        self.fields: Dict[str, str] = {}
+        self.image = bytearray()
+        self.info: Optional[ImageInfo] = None
+        self._part: Optional[Tuple[str, str]] = None  # (tipo, nombre) de la parte actual
+        self._field_value = bytearray()
+        self._next_probe = SNIFF_BYTES
+
+    def feed(self, chunk: bytes):
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadRejected('file_too_large', too_large_message(self.max_bytes), 413)
+        self.decoder.receive_data(chunk)
+        self._drain()
+
+    def finish(self) -> Optional[bytes]:
+        """Cerrar el stream; retorna los bytes de la imagen (None si no se envió)"""
+        self.decoder.receive_data(None)
+        self._drain()
+        if self.filename is None:
+            return None
+        if self.image and self.info is None:
+            self._inspect_image(final=True)
+        return bytes(self.image)
+
+    def _drain(self):
+        while True:
+            try:
+                event = self.decoder.next_event()
+            except ValueError as e:
+                raise UploadRejected('bad_request', f'Multipart inválido: {e}')
+            if isinstance(event, (NeedData, Epilogue)):
+                return
+            if isinstance(event, File):
+                self._part = ('file', event.name)
+                if event.name == self.file_field and self.filename is None:
+                    self.filename = event.filename
+                else:
+                    self._part = ('ignored', event.name)
+            elif isinstance(event, Field):
+                self._part = ('field', event.name)
+                self._field_value = bytearray()
+            elif isinstance(event, Data) and self._part is not None:
+                self._receive_data(event)
+
+    def _receive_data(self, event: Data):
+        kind, name = self._part
+        if kind == 'file':
+            self.image += event.data
+            if self.info is None and len(self.image) >= self._next_probe:
+                self._inspect_image(final=False)
+        elif kind == 'field':
+            self._field_value += event.data
+            if len(self._field_value) > MAX_FIELD_BYTES:
+                raise UploadRejected('bad_request', f'Campo {name} demasiado largo')
+            if not event.more_data:
+                self.fields[name] = self._field_value.decode('utf-8', 'replace')
+
+    def _inspect_image(self, final: bool):
+        """Formato con los primeros bytes; dimensiones en cuanto la cabecera está completa"""
+        if len(self.image) < SNIFF_BYTES:
+            if final:
+                raise UploadRejected('invalid_image', 'Archivo demasiado corto para ser una imagen')
+            return
+        image_format = sniff_format(bytes(self.image[:SNIFF_BYTES]))
+        if image_format in VIDEO_FORMATS:
+            # El índice de un MP4 puede ir al final: se valida al decodificar
+            self.info = ImageInfo(image_format, 0, 0)
+            return
+        size = probe_dimensions(bytes(self.image[:MAX_HEADER_BYTES]), image_format)
+        if size is None:
+            if final or len(self.image) >= MAX_HEADER_BYTES:
+                raise UploadRejected('invalid_image', 'No se pudo leer la cabecera de la imagen')
+            # Reintentar cuando llegue el doble de datos (evita reparsear en cada trozo)
+            self._next_probe = min(len(self.image) * 2, MAX_HEADER_BYTES)
+            return
+        check_dimensions(*size)
+        self.info = ImageInfo(image_format, *size)
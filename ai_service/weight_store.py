@@ -0,0 +1,138 @@
+"""
+🧱 Almacén de pesos deduplicado por contenido (modelos ONNX)
+Los modelos de razas afinados desde MobileNetV2 repiten gran parte de los
+pesos del backbone (y del detector ImageNet). `pack` saca cada inicializador
+de los modelos de model_data/onnx/ a un único `tensors.bin` direccionado por
+contenido: un tensor idéntico en varias especies, versiones o en el detector
+se guarda una sola vez. Los modelos reescritos lo referencian como datos
+externos alineados a página; ONNX Runtime los mapea en memoria y todos los
+procesos comparten las mismas páginas de solo lectura de la caché del sistema.
+
+Uso:
+    python export_onnx.py && python weight_store.py pack   # incremental: solo añade tensores nuevos
+    python weight_store.py stats
+    PET_AI_BACKEND=onnx PET_AI_WEIGHT_STORE=1 python app_multi_species.py
+
+Con el backend Keras no aplica: TensorFlow copia los pesos a su propia memoria.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict
+
+MODEL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_data')
+WEIGHT_STORE_DIR = 'weights'
+TENSORS_FILE = 'tensors.bin'
+INDEX_FILE = 'index.json'
+# Offsets alineados a la granularidad de mmap para que ONNX Runtime mapee cada tensor
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+# Los tensores pequeños (sesgos, escalas) se quedan dentro del modelo
+MIN_EXTERNAL_BYTES = 4096
+
+
+class WeightStore:
+    """Tensores únicos en `tensors.bin` + índice hash -> (offset, longitud)"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.tensors_path = os.path.join(directory, TENSORS_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.index = {'tensors': {}, 'models': {}}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def add(self, key: str, data: bytes) -> int:
+        """Offset del tensor en el archivo compartido; solo se escribe si es nuevo"""
+        entry = self.index['tensors'].get(key)
+        if entry is not None:
+            return entry['offset']
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.tensors_path, 'ab') as f:
+            end = f.tell()
+            offset = -(-end // ALIGNMENT) * ALIGNMENT
+            f.write(b'\0' * (offset - end))
+            f.write(data)
+        self.index['tensors'][key] = {'offset': offset, 'length': len(data)}
+        return offset
+
+    def pack_model(self, source_path: str, name: str) -> Dict:
+        """Reescribir un modelo ONNX con sus inicializadores en el almacén"""
+        import onnx
+        from onnx import numpy_helper
+        from onnx.external_data_helper import set_external_data
+
+        model = onnx.load(source_path)
+        logical = unique = 0
+        for tensor in model.graph.initializer:
+            data = numpy_helper.to_array(tensor).tobytes()
+            if len(data) < MIN_EXTERNAL_BYTES:
+                continue
+            digest = hashlib.blake2b(data, digest_size=20)
+            digest.update(f"{tensor.data_type}:{list(tensor.dims)}".encode())
+            key = digest.hexdigest()
+            is_new = key not in self.index['tensors']
+            offset = self.add(key, data)
+            logical += len(data)
+            unique += len(data) if is_new else 0
+
+            # Mismo tensor, ahora como referencia al archivo compartido
+            set_external_data(tensor, location=TENSORS_FILE, offset=offset, length=len(data))
+            tensor.ClearField('raw_data')
+            for field in ('float_data', 'int32_data', 'int64_data', 'double_data', 'uint64_data', 'string_data'):
+                tensor.ClearField(field)
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+
+        onnx.save(model, os.path.join(self.directory, f"{name}.onnx"))
+        stats = {'source': os.path.basename(source_path), 'weight_bytes': logical, 'new_bytes': unique}
+        self.index['models'][name] = stats
+        return stats
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def get_stats(self) -> Dict:
+        stored = sum(entry['length'] for entry in self.index['tensors'].values())
+        logical = sum(model['weight_bytes'] for model in self.index['models'].values())
+        return {
+            'models': len(self.index['models']),
+            'unique_tensors': len(self.index['tensors']),
+            'logical_mb': round(logical / 1024**2, 2),
+            'stored_mb': round(stored / 1024**2, 2),
+            'dedup_ratio': round(logical / stored, 2) if stored else None
+        }
+
+
+def main():
+    from inference_backends import ONNX_DIR
+
+    parser = argparse.ArgumentParser(description='Almacén de pesos ONNX deduplicado y mapeado en memoria')
+    parser.add_argument('command', choices=('pack', 'stats'))
+    parser.add_argument('--model-data', default=MODEL_DATA_PATH)
+    args = parser.parse_args()
+
+    onnx_dir = os.path.join(args.model_data, ONNX_DIR)
+    store = WeightStore(os.path.join(onnx_dir, WEIGHT_STORE_DIR))
+    if args.command == 'pack':
+        sources = sorted(glob.glob(os.path.join(onnx_dir, '*.onnx')))
+        if not sources:
+            raise SystemExit(f"❌ No hay modelos ONNX en {onnx_dir} (ejecuta export_onnx.py)")
+        for path in sources:
+            name = os.path.splitext(os.path.basename(path))[0]
+            stats = store.pack_model(path, name)
+            print(f"📦 {name}: {stats['weight_bytes'] / 1024**2:.1f} MB de pesos, "
+                  f"{stats['new_bytes'] / 1024**2:.1f} MB nuevos")
+        # El índice se escribe al final: un pack interrumpido solo deja bytes sin referenciar
+        store.save_index()
+    print(json.dumps(store.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ import FormData from 'form-data';
 export class PredictionService {
   private readonly AI_SERVICE_URL =
     process.env.AI_SERVICE_URL || 'http://localhost:5000';
+  // El servicio de IA solo respeta la prioridad 'high' de llamadores internos
+  private readonly AI_SERVICE_INTERNAL_TOKEN =
+    process.env.AI_SERVICE_INTERNAL_TOKEN;
 
   constructor(private prisma: PrismaService) {}
 
@@ -25,6 +28,11 @@ export class PredictionService {
       // Agregar la especie al FormData para que el servicio de IA sepa qué modelo usar
       formData.append('species', species);
 
+      // El tráfico anónimo usa el modelo compacto (destilado) si está disponible
+      if (!userId) {
+        formData.append('model_variant', 'compact');
+      }
+
       console.log('📤 Enviando imagen al servicio de IA...');
 
       // Llamar al servicio de IA Python
@@ -34,6 +42,12 @@ export class PredictionService {
         {
           headers: {
             ...formData.getHeaders(),
+            // Deadline y prioridad para el control de admisión del servicio de IA
+            'X-Request-Timeout': '30',
+            'X-Request-Priority': userId ? 'high' : 'low',
+            ...(this.AI_SERVICE_INTERNAL_TOKEN
+              ? { 'X-Internal-Token': this.AI_SERVICE_INTERNAL_TOKEN }
+              : {}),
           },
           maxContentLength: Infinity,
           maxBodyLength: Infinity,